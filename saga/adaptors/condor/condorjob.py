@@ -11,6 +11,7 @@ import saga.utils.which
 import saga.utils.pty_shell
 
 import saga.adaptors.base
+import saga.adaptors.poller
 import saga.adaptors.cpi.job
 
 from saga.job.constants import *
@@ -19,12 +20,19 @@ from transferdirectives import TransferDirectives
 import re
 import os
 import time
+import uuid
+import threading
 from copy import deepcopy
 from cgi import parse_qs
 
 SYNC_CALL = saga.adaptors.cpi.decorators.SYNC_CALL
 ASYNC_CALL = saga.adaptors.cpi.decorators.ASYNC_CALL
 
+# job states are polled in bulk, with an interval between these bounds
+# (see saga.adaptors.poller)
+POLL_INTERVAL_MIN = 0.5  # seconds
+POLL_INTERVAL_MAX = 30   # seconds
+
 
 # --------------------------------------------------------------------
 #
@@ -68,10 +76,118 @@ def _condor_to_saga_jobstate(condorjs):
         return saga.job.UNKNOWN
 
 
+# --------------------------------------------------------------------
+# user log events look like this (the event body is indented, and every
+# event is terminated by a line containing '...'):
+#
+#   000 (112.000.000) 10/18 10:00:00 Job submitted from host: <1.2.3.4:5678>
+#   ...
+#   001 (112.000.000) 10/18 10:00:05 Job executing on host: <1.2.3.5:9618>
+#   ...
+#   005 (112.000.000) 10/18 10:01:00 Job terminated.
+#           (1) Normal termination (return value 0)
+#   ...
+#
+_LOG_EVENT_RE   = re.compile(r'^(\d{3}) \((\d+)\.(\d+)\.\d+\) (\S+ \S+) (.*)$')
+_LOG_HOST_RE    = re.compile(r'<([^:>]+)')
+_LOG_RETURN_RE  = re.compile(r'\(return value (\d+)\)')
+
+
 # --------------------------------------------------------------------
 #
-def _condorscript_generator(url, logger, jd, option_dict=None):
-    """ generates a Condor script from a SAGA job description
+def _parse_condor_log(text):
+    """ splits (a chunk of) a Condor user log into a list of events.  Each
+        event is returned as tuple (code, pid, timestamp, header, body), where
+        'pid' is formatted as 'cluster.proc', the way condor_submit reports
+        it.  Incomplete events at the end of the chunk are ignored -- the
+        second return value is the number of lines consumed by the complete
+        events, so that the caller can continue reading from there.
+    """
+    events   = list()
+    consumed = 0
+    event    = None
+    lines    = text.split('\n')
+
+    # a trailing incomplete line is never part of a complete event
+    for n, line in enumerate(lines[:-1]):
+
+        line = line.rstrip('\r')
+
+        if line.strip() == '...':
+            if event:
+                events.append(event)
+            event    = None
+            consumed = n + 1
+            continue
+
+        if event is None:
+            match = _LOG_EVENT_RE.match(line)
+            if match:
+                code, cluster, proc, timestamp, header = match.groups()
+                pid   = "%d.%d" % (int(cluster), int(proc))
+                event = (int(code), pid, timestamp, header, list())
+        else:
+            event[4].append(line.strip())
+
+    return events, consumed
+
+
+# --------------------------------------------------------------------
+#
+def _apply_condor_log_event(job_info, event):
+    """ updates a job info dict according to a user log event
+    """
+    code, pid, timestamp, header, body = event
+
+    if code == 0:       # submit
+        job_info['create_time'] = timestamp
+
+    elif code == 1:     # execute
+        job_info['state']      = saga.job.RUNNING
+        job_info['start_time'] = timestamp
+        match = _LOG_HOST_RE.search(header)
+        if match:
+            job_info['exec_hosts'] = [match.group(1)]
+
+    elif code == 2:     # executable error
+        job_info['state']    = saga.job.FAILED
+        job_info['end_time'] = timestamp
+
+    elif code == 4:     # evicted -- the job goes back into the queue
+        job_info['state'] = saga.job.PENDING
+
+    elif code == 5:     # terminated
+        job_info['end_time'] = timestamp
+        match = _LOG_RETURN_RE.search(' '.join(body))
+        if match:
+            job_info['returncode'] = int(match.group(1))
+            if job_info['returncode'] == 0:
+                job_info['state'] = saga.job.DONE
+            else:
+                job_info['state'] = saga.job.FAILED
+        else:
+            # abnormal termination (signal)
+            job_info['state'] = saga.job.FAILED
+
+    elif code == 9:     # aborted
+        job_info['state']    = saga.job.CANCELED
+        job_info['end_time'] = timestamp
+
+    elif code == 10:    # suspended
+        job_info['state'] = saga.job.SUSPENDED
+
+    elif code == 11:    # unsuspended
+        job_info['state'] = saga.job.RUNNING
+
+    elif code in [12, 13]:  # held, released
+        job_info['state'] = saga.job.PENDING
+
+
+# --------------------------------------------------------------------
+#
+def _condorscript_generator(url, logger, jd, option_dict=None, log_file=None):
+    """ generates a Condor script from a SAGA job description.  If 'log_file'
+        is given, the job will write its events into that user log.
     """
     condor_file = str()
 
@@ -170,10 +286,12 @@ def _condorscript_generator(url, logger, jd, option_dict=None):
                 transfer_output_files += "%s, " % source
             condor_file += "\n%s" % transfer_output_files
 
-    # always define log. if 'jd.output' is defined, we use it 
-    # to name the logfile. if not, we fall back to a standard
-    # name... 
-    if jd.output is not None:
+    # always define log. if the job service maintains a user log, we use
+    # that one.  Otherwise, if 'jd.output' is defined, we use it to name the
+    # logfile. if not, we fall back to a standard name...
+    if log_file is not None:
+        filename = log_file
+    elif jd.output is not None:
         filename = str(jd.output)
         idx = filename.rfind('.')
         if idx != -1:
@@ -347,6 +465,7 @@ class CondorJobService (saga.adaptors.cpi.job.Service):
     #
     def __init__(self, api, adaptor):
 
+        self.poller = None
         _cpi_base = super(CondorJobService, self)
         _cpi_base.__init__(api, adaptor)
 
@@ -370,6 +489,16 @@ class CondorJobService (saga.adaptors.cpi.job.Service):
         self.is_cray       = False
         self.jobs          = dict()
         self.query_options = dict()
+        self.shell         = None
+
+        # all jobs submitted through this service write their events into
+        # one user log, which we tail to learn about state changes.  The
+        # read offset is counted in bytes if we can read the log directly,
+        # and in lines if we need to read it via the shell.
+        self.log_file      = None
+        self.log_local     = False
+        self.log_offset    = 0
+        self.log_lock      = threading.RLock()
 
         rm_scheme = rm_url.scheme
         pty_url   = deepcopy(rm_url)
@@ -404,14 +533,37 @@ class CondorJobService (saga.adaptors.cpi.job.Service):
       # self.shell.set_initialize_hook(self.initialize)
       # self.shell.set_finalize_hook(self.finalize)
 
+        self.log_local = (pty_url.scheme == "fork")
+
         self.initialize()
 
+        # job states are refreshed by the poller for the target host
+        self.poller = saga.adaptors.poller.register(self.rm, self._poll_jobs,
+                                                    POLL_INTERVAL_MIN,
+                                                    POLL_INTERVAL_MAX)
+
         return self.get_api ()
 
 
+
     # ----------------------------------------------------------------
     #
     def close (self) :
+
+        if  self.poller :
+            self.poller.unregister()
+            self.poller = None
+
+        # the user log is not needed anymore once all our jobs are final --
+        # otherwise we leave it to Condor.
+        if  self.shell and self.log_file :
+            active = [job_id for job_id in self.jobs \
+                      if self.jobs[job_id]['state'] not in \
+                         [saga.job.DONE, saga.job.FAILED, saga.job.CANCELED]]
+            if  not active :
+                self.shell.run_sync("rm -f %s" % self.log_file)
+            self.log_file = None
+
         if  self.shell :
             self.shell.finalize (True)
 
@@ -447,6 +599,17 @@ class CondorJobService (saga.adaptors.cpi.job.Service):
 
         self._logger.info("Found Condor tools: %s" % self._commands)
 
+        # create the user log location.  The log lives on the submit host,
+        # next to the other saga state.
+        ret, out, _ = self.shell.run_sync("mkdir -p $HOME/.saga/adaptors/condor/ && echo $HOME")
+        if ret != 0:
+            message = "Error creating Condor user log directory: %s" % out
+            log_error_and_raise(message, saga.NoSuccess, self._logger)
+
+        self.log_file = "%s/.saga/adaptors/condor/%s.log" \
+                      % (out.strip(), uuid.uuid4())
+        self._logger.info("Using Condor user log: %s" % self.log_file)
+
     # ----------------------------------------------------------------
     #
     def finalize(self, kill_shell=False):
@@ -455,13 +618,28 @@ class CondorJobService (saga.adaptors.cpi.job.Service):
     # ----------------------------------------------------------------
     #
     def _job_run(self, jd):
-        """ runs a job via qsub
+        """ runs a job via condor_submit
         """
         # create a Condor job script from SAGA job description
         script = _condorscript_generator(url=self.rm, logger=self._logger, jd=jd,
-            option_dict=self.query_options)
+            option_dict=self.query_options, log_file=self.log_file)
         self._logger.info("Generated Condor script: %s" % script)
 
+        pids   = self._submit(script, 1)
+        job_id = self._register_job(pids[0])
+
+        # make sure the poller picks up the new job quickly
+        if self.poller:
+            self.poller.poke()
+
+        return job_id
+
+    # ----------------------------------------------------------------
+    #
+    def _submit(self, script, njobs):
+        """ pipes a submit description into condor_submit, and returns the
+            'cluster.proc' ids of the 'njobs' jobs it queued, in queue order.
+        """
         ret, out, _ = self.shell.run_sync('echo "%s" | %s -' \
             % (script, self._commands['condor_submit']['path']))
 
@@ -470,34 +648,164 @@ class CondorJobService (saga.adaptors.cpi.job.Service):
             message = "Error running job via 'condor_submit': %s. Script was: %s" \
                 % (out, script)
             log_error_and_raise(message, saga.NoSuccess, self._logger)
+
+        # stdout contains the job ids, either one per job:
+        #   ** Proc 112.0:
+        # or one line per cluster:
+        #   3 job(s) submitted to cluster 112.
+        pids = list()
+        for line in out.split("\n"):
+            if "** Proc" in line:
+                pids.append(line.split()[2][:-1])
+            elif "submitted to cluster" in line and not pids:
+                cluster = line.split()[-1].strip('.')
+                pids = ["%s.%d" % (cluster, proc) for proc in range(njobs)]
+
+        if len(pids) != njobs:
+            message = "Couldn't parse job id(s) from 'condor_submit' output: %s" % out
+            log_error_and_raise(message, saga.NoSuccess, self._logger)
+
+        return pids
+
+    # ----------------------------------------------------------------
+    #
+    def _register_job(self, pid):
+        """ adds a freshly submitted job to the list of known jobs, and
+            returns its job id
+        """
+        # we don't want the 'query' part of the URL to be part of the ID,
+        # simply because it can get terribly long (and ugly). to get rid
+        # of it, we clone the URL and set the query part to None.
+        rm_clone = deepcopy(self.rm)
+        rm_clone.query = ""
+        rm_clone.path = ""
+
+        job_id = "[%s]-[%s]" % (rm_clone, pid)
+        self._logger.info("Submitted Condor job with id: %s" % job_id)
+
+        # add job to internal list of known jobs.  Its state will be
+        # updated from the user log.
+        self.jobs[job_id] = {
+            'state':        saga.job.PENDING,
+            'exec_hosts':   None,
+            'returncode':   None,
+            'create_time':  None,
+            'start_time':   None,
+            'end_time':     None,
+            'gone':         False,
+            'logged':       True
+        }
+
+        return job_id
+
+    # ----------------------------------------------------------------
+    #
+    def _read_log(self):
+        """ returns all complete events which have been added to the user log
+            since the last call.
+        """
+        if self.log_local:
+            try:
+                with open(self.log_file, 'r') as log:
+                    log.seek(self.log_offset)
+                    text = log.read()
+            except IOError:
+                # no event has been logged, yet
+                return list()
+
+            events, consumed = _parse_condor_log(text)
+            for line in text.split('\n')[:consumed]:
+                self.log_offset += len(line) + 1
         else:
-            # stdout contains the job id
-            for line in out.split("\n"):
-                if "** Proc" in line:
-                    pid = line.split()[2][:-1]
-
-            # we don't want the 'query' part of the URL to be part of the ID,
-            # simply because it can get terribly long (and ugly). to get rid
-            # of it, we clone the URL and set the query part to None.
-            rm_clone = deepcopy(self.rm)
-            rm_clone.query = ""
-            rm_clone.path = ""
-
-            job_id = "[%s]-[%s]" % (rm_clone, pid)
-            self._logger.info("Submitted Condor job with id: %s" % job_id)
-
-            # add job to internal list of known jobs.
-            self.jobs[job_id] = {
-                'state':        saga.job.PENDING,
-                'exec_hosts':   None,
-                'returncode':   None,
-                'create_time':  None,
-                'start_time':   None,
-                'end_time':     None,
-                'gone':         False
-            }
+            ret, out, _ = self.shell.run_sync("tail -n +%d %s 2>/dev/null" \
+                % (self.log_offset + 1, self.log_file))
+            if ret != 0:
+                # no event has been logged, yet
+                return list()
+
+            events, consumed = _parse_condor_log(out)
+            self.log_offset += consumed
+
+        return events
+
+    # ----------------------------------------------------------------
+    #
+    def _update_from_log(self):
+        """ updates the state of all jobs submitted via this service, by
+            applying the new events from the user log.  This does not cost any
+            per-job query.  Returns True if any job changed state.
+        """
+        changed = False
+
+        # map the log's 'cluster.proc' ids back to our job ids
+        pids = dict()
+        for job_id in self.jobs.keys():
+            if self.jobs[job_id].get('logged'):
+                rm, pid = self._adaptor.parse_id(job_id)
+                pids[pid] = job_id
+
+        # the log is read by the poller and by the state getters
+        with self.log_lock:
+            for event in self._read_log():
+                job_id = pids.get(event[1])
+                if job_id is None:
+                    continue
+
+                # canceled jobs keep their state
+                state = self.jobs[job_id]['state']
+                if state != saga.job.CANCELED:
+                    _apply_condor_log_event(self.jobs[job_id], event)
+                    if self.jobs[job_id]['state'] != state:
+                        changed = True
+
+        return changed
+
+    # ----------------------------------------------------------------
+    #
+    def _poll_jobs(self):
+        """ bulk fetch callable for the job state poller
+        """
+        active = [job_id for job_id in self.jobs.keys() \
+                  if not self.jobs[job_id]['gone'] and \
+                     self.jobs[job_id]['state'] not in \
+                     [saga.job.CANCELED, saga.job.FAILED, saga.job.DONE]]
+        if not active:
+            return None
+
+        changed = False
+        logged  = False
+
+        for job_id in active:
+            if self.jobs[job_id].get('logged'):
+                logged = True
+            else:
+                # jobs we did not submit ourself are not in our user log
+                state = self.jobs[job_id]['state']
+                self.jobs[job_id] = self._job_get_info(job_id=job_id)
+                if self.jobs[job_id]['state'] != state:
+                    changed = True
+
+        if logged and self._update_from_log():
+            changed = True
+
+        return changed
+
+    # ----------------------------------------------------------------
+    #
+    def _job_update(self, job_id):
+        """ makes sure the job info is current, either by reading the user
+            log, or (for jobs we did not submit ourself) via condor_q
+        """
+        info = self.jobs[job_id]
 
-            return job_id
+        if info['gone'] is True or info['state'] in \
+            [saga.job.CANCELED, saga.job.FAILED, saga.job.DONE]:
+            return
+
+        if info.get('logged'):
+            self._update_from_log()
+        else:
+            self.jobs[job_id] = self._job_get_info(job_id=job_id)
 
     # ----------------------------------------------------------------
     #
@@ -644,15 +952,7 @@ class CondorJobService (saga.adaptors.cpi.job.Service):
     def _job_get_state(self, job_id):
         """ get the job's state
         """
-        # check if we have already reach a terminal state
-        if self.jobs[job_id]['state'] == saga.job.CANCELED \
-        or self.jobs[job_id]['state'] == saga.job.FAILED \
-        or self.jobs[job_id]['state'] == saga.job.DONE:
-            return self.jobs[job_id]['state']
-
-        # check if we can / should update
-        if (self.jobs[job_id]['gone'] is not True):
-            self.jobs[job_id] = self._job_get_info(job_id=job_id)
+        self._job_update(job_id)
 
         return self.jobs[job_id]['state']
 
@@ -662,9 +962,8 @@ class CondorJobService (saga.adaptors.cpi.job.Service):
         """ get the job's exit code
         """
         # check if we can / should update
-        if (self.jobs[job_id]['gone'] is not True) \
-        and (self.jobs[job_id]['returncode'] is None):
-            self.jobs[job_id] = self._job_get_info(job_id=job_id)
+        if self.jobs[job_id]['returncode'] is None:
+            self._job_update(job_id)
 
         ret = self.jobs[job_id]['returncode']
 
@@ -678,9 +977,8 @@ class CondorJobService (saga.adaptors.cpi.job.Service):
         """ get the job's exit code
         """
         # check if we can / should update
-        if (self.jobs[job_id]['gone'] is not True) \
-        and (self.jobs[job_id]['exec_hosts'] is None):
-            self.jobs[job_id] = self._job_get_info(job_id=job_id)
+        if self.jobs[job_id]['exec_hosts'] is None:
+            self._job_update(job_id)
 
         return self.jobs[job_id]['exec_hosts']
 
@@ -690,9 +988,8 @@ class CondorJobService (saga.adaptors.cpi.job.Service):
         """ get the job's creation time
         """
         # check if we can / should update
-        if (self.jobs[job_id]['gone'] is not True) \
-        and (self.jobs[job_id]['create_time'] is None):
-            self.jobs[job_id] = self._job_get_info(job_id=job_id)
+        if self.jobs[job_id]['create_time'] is None:
+            self._job_update(job_id)
 
         return self.jobs[job_id]['create_time']
 
@@ -702,9 +999,8 @@ class CondorJobService (saga.adaptors.cpi.job.Service):
         """ get the job's start time
         """
         # check if we can / should update
-        if (self.jobs[job_id]['gone'] is not True) \
-        and (self.jobs[job_id]['start_time'] is None):
-            self.jobs[job_id] = self._job_get_info(job_id=job_id)
+        if self.jobs[job_id]['start_time'] is None:
+            self._job_update(job_id)
 
         return self.jobs[job_id]['start_time']
 
@@ -714,9 +1010,8 @@ class CondorJobService (saga.adaptors.cpi.job.Service):
         """ get the job's end time
         """
         # check if we can / should update
-        if (self.jobs[job_id]['gone'] is not True) \
-        and (self.jobs[job_id]['end_time'] is None):
-            self.jobs[job_id] = self._job_get_info(job_id=job_id)
+        if self.jobs[job_id]['end_time'] is None:
+            self._job_update(job_id)
 
         return self.jobs[job_id]['end_time']
 
@@ -747,15 +1042,17 @@ class CondorJobService (saga.adaptors.cpi.job.Service):
         time_now   = time_start
         rm, pid    = self._adaptor.parse_id(job_id)
 
+        # someone is waiting -- make sure the job state is fresh
+        if self.poller:
+            self.poller.poke()
+
         while True:
-            state = self._job_get_state(job_id=job_id)
+            state = self.jobs[job_id]['state']  # updated in the bg.
 
             if state == saga.job.DONE or \
                state == saga.job.FAILED or \
                state == saga.job.CANCELED:
                     return True
-            # avoid busy poll
-            time.sleep(0.5)
 
             # check if we hit timeout
             if timeout >= 0:
@@ -763,6 +1060,12 @@ class CondorJobService (saga.adaptors.cpi.job.Service):
                 if time_now - time_start > timeout:
                     return False
 
+                # wait for the next job state update
+                saga.adaptors.poller.wait(self.poller, timeout - (time_now - time_start),
+                                          POLL_INTERVAL_MIN)
+            else:
+                saga.adaptors.poller.wait(self.poller, None, POLL_INTERVAL_MIN)
+
     # ----------------------------------------------------------------
     #
     @SYNC_CALL
@@ -844,29 +1147,148 @@ class CondorJobService (saga.adaptors.cpi.job.Service):
         return ids
 
 
-  # # ----------------------------------------------------------------
-  # #
-  # def container_run (self, jobs) :
-  #     self._logger.debug ("container run: %s"  %  str(jobs))
-  #     # TODO: this is not optimized yet
-  #     for job in jobs:
-  #         job.run ()
-  #
-  #
-  # # ----------------------------------------------------------------
-  # #
-  # def container_wait (self, jobs, mode, timeout) :
-  #     self._logger.debug ("container wait: %s"  %  str(jobs))
-  #     # TODO: this is not optimized yet
-  #     for job in jobs:
-  #         job.wait ()
-  #
-  #
-  # # ----------------------------------------------------------------
-  # #
-  # def container_cancel (self, jobs) :
-  #     self._logger.debug ("container cancel: %s"  %  str(jobs))
-  #     raise saga.NoSuccess ("Not Implemented");
+    # ----------------------------------------------------------------
+    #
+    @SYNC_CALL
+    def container_run (self, jobs) :
+        """
+        Submits all jobs of the container as Condor clusters.  The submit
+        descriptions of all jobs are concatenated into one submit file with
+        one 'queue' statement per job, and the resulting 'cluster.proc' ids
+        are mapped back to the jobs.  As submit commands persist across
+        'queue' statements, only jobs whose descriptions set the same
+        submit commands share a submit file -- for homogeneous workloads
+        that means a single condor_submit call.
+        """
+
+        self._logger.debug ("container run: %s"  %  str(jobs))
+
+        clusters = dict()
+        errors   = list()
+
+        for job in jobs :
+            script = _condorscript_generator(url=self.rm, logger=self._logger,
+                jd=job._adaptor.jd, option_dict=self.query_options,
+                log_file=self.log_file)
+
+            keys = list()
+            for line in script.split("\n") :
+                if  '=' in line and not line.startswith('#') :
+                    keys.append (line.split('=', 1)[0].strip())
+            keys = tuple (sorted (keys))
+
+            if  keys not in clusters :
+                clusters[keys] = list()
+            clusters[keys].append ((job, script))
+
+        for cluster in clusters.values () :
+
+            script = "\n".join ([s for (_, s) in cluster])
+            self._logger.info ("Generated Condor cluster script for %d jobs" \
+                            % len(cluster))
+
+            try :
+                pids = self._submit (script, len(cluster))
+
+            except Exception as e :
+                errors.append (str(e))
+                continue
+
+            for (job, _), pid in zip (cluster, pids) :
+                job._adaptor._id      = self._register_job (pid)
+                job._adaptor._started = True
+
+        if  self.poller :
+            self.poller.poke ()
+
+        if  errors :
+            log_error_and_raise ("failed to run (parts of the) bulk jobs: %s" \
+                                 % errors, saga.NoSuccess, self._logger)
+
+
+    # ----------------------------------------------------------------
+    #
+    @SYNC_CALL
+    def container_wait (self, jobs, mode, timeout) :
+        """
+        Waits for all (or any) of the given jobs.  All jobs are updated from
+        the same user log read, so the wait costs no per-job queries.
+        """
+
+        self._logger.debug ("container wait: %s"  %  str(jobs))
+
+        time_start = time.time()
+        job_ids    = [job.id for job in jobs]
+
+        # someone is waiting -- make sure the job states are fresh
+        if  self.poller :
+            self.poller.poke ()
+
+        while True:
+            final = [job_id for job_id in job_ids \
+                     if self.jobs[job_id]['state'] in \
+                        [saga.job.DONE, saga.job.FAILED, saga.job.CANCELED]]
+
+            if  mode == saga.task.ANY and final :
+                return True
+
+            if  len(final) == len(job_ids) :
+                return True
+
+            # check if we hit timeout
+            if timeout >= 0:
+                time_now = time.time()
+                if time_now - time_start > timeout:
+                    return False
+
+                # wait for the next job state update
+                saga.adaptors.poller.wait (self.poller, timeout - (time_now - time_start),
+                                           POLL_INTERVAL_MIN)
+            else:
+                saga.adaptors.poller.wait (self.poller, None, POLL_INTERVAL_MIN)
+
+
+    # ----------------------------------------------------------------
+    #
+    @SYNC_CALL
+    def container_cancel (self, jobs, timeout) :
+        """
+        Cancels all given jobs with as few condor_rm calls as the command
+        line length permits.
+        """
+
+        self._logger.debug ("container cancel: %s"  %  str(jobs))
+
+        pids = list()
+        for job in jobs :
+            rm, pid = self._adaptor.parse_id (job.id)
+            pids.append (pid)
+
+        cmd = "%s %%s\n" % self._commands['condor_rm']['path']
+
+        for batch in self.shell._arg_batches (pids, len (cmd)) :
+
+            ret, out, _ = self.shell.run_sync (cmd % ' '.join (batch))
+
+            if ret != 0:
+                message = "Error canceling jobs via 'condor_rm': %s" % out
+                log_error_and_raise(message, saga.NoSuccess, self._logger)
+
+        # assume the jobs were succesfully canceld -- jobs we do not know
+        # about have no state to update
+        for job in jobs :
+            if  job.id in self.jobs :
+                self.jobs[job.id]['state'] = saga.job.CANCELED
+
+
+    # ----------------------------------------------------------------
+    #
+    @SYNC_CALL
+    def container_get_states (self, jobs) :
+
+        self._logger.debug ("container get_state: %s"  %  str(jobs))
+
+        return [self._job_get_state (job.id) for job in jobs]
 
 
 ###############################################################################
@@ -890,6 +1312,10 @@ class CondorJob (saga.adaptors.cpi.job.Job):
         self.jd = job_info["job_description"]
         self.js = job_info["job_service"]
 
+        # the js is responsible for job bulk operations
+        self._container   = self.js
+        self._method_type = "run"
+
         if job_info['reconnect'] is True:
             self._id = job_info['reconnect_jobid']
             self._started = True
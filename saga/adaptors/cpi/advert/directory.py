@@ -62,6 +62,16 @@ class Directory (cpi_ns.directory.Directory,
     def find_adverts_async      (self, name_pattern, attr_pattern,
                                  obj_type, flags, ttype)             : pass
 
+    @SYNC
+    def set_attributes          (self, attributes, ttype)            : pass
+    @ASYNC
+    def set_attributes_async    (self, attributes, ttype)            : pass
+
+    @SYNC
+    def get_attributes          (self, keys, ttype)                  : pass
+    @ASYNC
+    def get_attributes_async    (self, keys, ttype)                  : pass
+
 
 
 # vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
@@ -6,8 +6,17 @@ __license__   = "MIT"
 """ file adaptor implementation on top tof the HTTP protocol
 """
 
-import os.path
-import urllib
+import os
+import json
+import time
+import errno
+import shutil
+import socket
+import hashlib
+import tempfile
+import httplib
+import urlparse
+import threading
 
 import saga.adaptors.base
 import saga.adaptors.cpi.filesystem
@@ -25,7 +34,78 @@ ASYNC_CALL = saga.adaptors.cpi.decorators.ASYNC_CALL
 #
 _ADAPTOR_NAME          = "saga.adaptor.http_file"
 _ADAPTOR_SCHEMAS       = ["http", "https"]
-_ADAPTOR_OPTIONS       = []
+_ADAPTOR_OPTIONS       = [
+    {
+    'category'         : 'saga.adaptor.http_file',
+    'name'             : 'download_channels',
+    'type'             : int,
+    'default'          : 4,
+    'documentation'    : '''Number of concurrent range requests used to download
+                          large files (if the server supports ranges).''',
+    'env_variable'     : None
+    },
+    {
+    'category'         : 'saga.adaptor.http_file',
+    'name'             : 'pool_size',
+    'type'             : int,
+    'default'          : 8,
+    'documentation'    : '''Number of idle keep-alive connections kept open per
+                          host, for reuse by later requests.''',
+    'env_variable'     : None
+    },
+    {
+    'category'         : 'saga.adaptor.http_file',
+    'name'             : 'cache_dir',
+    'type'             : str,
+    'default'          : '',
+    'documentation'    : '''Directory for a local cache of downloaded files.  Cached
+                          files are revalidated with the server (via ETag and
+                          Last-Modified), and are only downloaded again if they
+                          changed.  The cache is disabled if this is empty.''',
+    'env_variable'     : None
+    },
+    {
+    'category'         : 'saga.adaptor.http_file',
+    'name'             : 'cache_size',
+    'type'             : int,
+    'default'          : 1024,
+    'documentation'    : '''Size limit of the download cache (in MB).  The least
+                          recently used files are evicted if the limit is
+                          exceeded.''',
+    'env_variable'     : None
+    },
+    {
+    'category'         : 'saga.adaptor.http_file',
+    'name'             : 'cache_link',
+    'type'             : bool,
+    'default'          : False,
+    'valid_options'    : [True, False],
+    'documentation'    : '''Hardlink cached files to the copy target, instead of
+                          copying them.  Note that the target must then not be
+                          modified in place, as that would alter the cached
+                          file, too.''',
+    'env_variable'     : None
+    }
+]
+
+# files of at least that size are downloaded in parallel ranges
+_SPLIT_MIN = 32 * 1024 * 1024
+
+# read size for response bodies
+_BLOCK_SIZE = 1024 * 1024
+
+# unread response bodies up to that size are drained to keep the connection
+# alive -- larger ones (or those of unknown size) close the connection instead
+_DRAIN_MAX = 64 * 1024
+
+# how often a failed range request is resumed
+_RETRIES = 3
+
+# maximal number of redirects we follow
+_REDIRECTS = 5
+
+# socket timeout (seconds)
+_TIMEOUT = 60
 
 # --------------------------------------------------------------------
 # the adaptor capabilities & supported attributes
@@ -83,12 +163,225 @@ class Adaptor (saga.adaptors.base.Base):
 
         saga.adaptors.base.Base.__init__(self, _ADAPTOR_INFO, _ADAPTOR_OPTIONS)
 
+        self.opts = self.get_config()
+
+        self.channels = max(1, int(self.opts['download_channels'].get_value()))
+
+        # the adaptor singleton holds the connection pool, so that all
+        # HTTPFile instances share the keep-alive connections
+        self.pool = ConnectionPool(int(self.opts['pool_size'].get_value()))
+
+        self.cache = None
+        cache_dir = str(self.opts['cache_dir'].get_value())
+
+        if cache_dir:
+            self.cache = DownloadCache(os.path.expanduser(cache_dir),
+                                       int(self.opts['cache_size'].get_value()) * 1024 * 1024,
+                                       bool(self.opts['cache_link'].get_value()))
+
     # ----------------------------------------------------------------
     #
     def sanity_check(self):
         pass
 
 
+###############################################################################
+#
+class ConnectionPool(object):
+    """ Keeps idle HTTP/1.1 keep-alive connections, per host, for reuse.
+    """
+    # ----------------------------------------------------------------
+    #
+    def __init__(self, size):
+
+        self._size = size
+        self._idle = dict()
+        self._lock = threading.Lock()
+
+    # ----------------------------------------------------------------
+    #
+    def get(self, scheme, netloc):
+        """ Return an idle connection to the given host, or a new one.
+        """
+        with self._lock:
+            conns = self._idle.get((scheme, netloc))
+            if conns:
+                return conns.pop()
+
+        if scheme == 'https':
+            return httplib.HTTPSConnection(netloc, timeout=_TIMEOUT)
+        else:
+            return httplib.HTTPConnection(netloc, timeout=_TIMEOUT)
+
+    # ----------------------------------------------------------------
+    #
+    def put(self, scheme, netloc, conn):
+        """ Return a connection to the pool -- the last response on it must
+            have been read completely.
+        """
+        with self._lock:
+            conns = self._idle.setdefault((scheme, netloc), list())
+            if len(conns) < self._size:
+                conns.append(conn)
+                return
+
+        conn.close()
+
+
+###############################################################################
+#
+class DownloadCache(object):
+    """ An on-disk cache of downloaded files, keyed by URL.  For each URL, the
+        cache holds the file content ('<key>.data') and its validators ETag and
+        Last-Modified ('<key>.meta').  The mtime of the meta file marks the
+        last use of the entry, for LRU eviction.
+
+        Entries are replaced by atomic renames, so several processes can share
+        one cache directory.
+    """
+    # ----------------------------------------------------------------
+    #
+    def __init__(self, path, size, link):
+
+        self._path = path
+        self._size = size
+        self._link = link
+
+        if not os.path.isdir(path):
+            try:
+                os.makedirs(path)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise saga.NoSuccess("cannot create cache dir %s: %s" % (path, e))
+
+    # ----------------------------------------------------------------
+    #
+    def _entry(self, url):
+
+        key = os.path.join(self._path, hashlib.sha1(url).hexdigest())
+        return key + '.data', key + '.meta'
+
+    # ----------------------------------------------------------------
+    #
+    def conditions(self, url):
+        """ Return the request headers which revalidate the cached copy of
+            url -- empty if there is none.
+        """
+        data, meta = self._entry(url)
+
+        try:
+            with open(meta) as f:
+                info = json.load(f)
+        except (IOError, ValueError):
+            return dict()
+
+        if not os.path.exists(data):
+            return dict()
+
+        headers = dict()
+
+        if info.get('etag'):
+            headers['If-None-Match'] = str(info['etag'])
+        if info.get('modified'):
+            headers['If-Modified-Since'] = str(info['modified'])
+
+        return headers
+
+    # ----------------------------------------------------------------
+    #
+    def reserve(self):
+        """ Return the path of a new temporary file in the cache dir, to
+            download into (see store).
+        """
+        handle, tmp = tempfile.mkstemp(dir=self._path, suffix='.tmp')
+        os.close(handle)
+        return tmp
+
+    # ----------------------------------------------------------------
+    #
+    def store(self, url, tmp, etag, modified):
+        """ Move the downloaded file tmp into the cache, as entry for url.
+        """
+        data, meta = self._entry(url)
+
+        handle, tmp_meta = tempfile.mkstemp(dir=self._path, suffix='.tmp')
+        with os.fdopen(handle, 'w') as f:
+            json.dump({'url': url, 'etag': etag, 'modified': modified}, f)
+
+        os.rename(tmp, data)
+        os.rename(tmp_meta, meta)
+
+    # ----------------------------------------------------------------
+    #
+    def serve(self, url, target):
+        """ Copy (or hardlink) the cached file for url to target.  Returns
+            False if the entry got evicted in the meantime.
+        """
+        data, meta = self._entry(url)
+
+        if os.path.exists(target):
+            os.remove(target)
+
+        try:
+            if self._link:
+                try:
+                    os.link(data, target)
+                except OSError as e:
+                    if e.errno != errno.EXDEV:
+                        raise
+                    shutil.copyfile(data, target)
+            else:
+                shutil.copyfile(data, target)
+
+            os.utime(meta, None)
+
+        except (IOError, OSError) as e:
+            if e.errno == errno.ENOENT and not os.path.exists(data):
+                return False
+            raise
+
+        return True
+
+    # ----------------------------------------------------------------
+    #
+    def evict(self):
+        """ Remove the least recently used entries until the cache fits into
+            its size limit.
+        """
+        entries = list()
+        total = 0
+
+        for name in os.listdir(self._path):
+
+            if not name.endswith('.data'):
+                continue
+
+            data = os.path.join(self._path, name)
+            meta = data[:-len('.data')] + '.meta'
+
+            try:
+                size = os.path.getsize(data)
+                used = os.path.getmtime(meta)
+            except OSError:
+                continue
+
+            entries.append((used, size, data, meta))
+            total += size
+
+        for used, size, data, meta in sorted(entries):
+
+            if total <= self._size:
+                break
+
+            for path in (meta, data):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+            total -= size
+
+
 ###############################################################################
 #
 class HTTPFile (saga.adaptors.cpi.filesystem.File):
@@ -209,12 +502,252 @@ class HTTPFile (saga.adaptors.cpi.filesystem.File):
                     if not flags & saga.filesystem.OVERWRITE:
                         raise saga.BadParameter("Local file '%s' exists." % target)
 
+        else:
+            target = local_path
+
         try:
-            urllib.urlretrieve(str(src), target)
+            self._download(str(src), target)
         except Exception, e:
             raise saga.BadParameter("Couldn't copy %s to %s: %s" %
                                     (str(src), target, str(e)))
 
+    # ----------------------------------------------------------------
+    #
+    def _request(self, method, url, headers=None):
+        """ Send a request over a pooled connection, and follow redirects.
+            Returns the response (with its connection as 'conn' attribute, see
+            _release) and the final URL.
+        """
+        for _ in range(_REDIRECTS + 1):
+
+            parts = urlparse.urlsplit(url)
+            path = urlparse.urlunsplit(('', '', parts.path or '/', parts.query, ''))
+
+            # a pooled connection may have been closed by the server in the
+            # meantime -- retry once on a fresh one
+            for attempt in range(2):
+                conn = self._adaptor.pool.get(parts.scheme, parts.netloc)
+                try:
+                    conn.request(method, path, headers=headers or dict())
+                    resp = conn.getresponse()
+                    break
+                except (httplib.HTTPException, socket.error):
+                    conn.close()
+                    if attempt:
+                        raise
+
+            resp.conn = conn
+            resp.scheme = parts.scheme
+            resp.netloc = parts.netloc
+
+            if resp.status in (301, 302, 303, 307, 308) and resp.getheader('location'):
+                self._release(resp)
+                url = urlparse.urljoin(url, resp.getheader('location'))
+                continue
+
+            return resp, url
+
+        raise saga.NoSuccess("too many redirects for %s" % url)
+
+    # ----------------------------------------------------------------
+    #
+    def _release(self, resp):
+        """ Hand the connection of the response back to the pool.  A small
+            unread rest of the body is drained first -- if more is left (for
+            example the full body of a failed range request), the connection
+            is closed instead.
+        """
+        if not resp.isclosed():
+
+            if resp.length is None or resp.length > _DRAIN_MAX:
+                resp.conn.close()
+                return
+
+            try:
+                while resp.read(_BLOCK_SIZE):
+                    pass
+            except (httplib.HTTPException, socket.error):
+                resp.conn.close()
+                return
+
+        if resp.will_close:
+            resp.conn.close()
+        else:
+            self._adaptor.pool.put(resp.scheme, resp.netloc, resp.conn)
+
+    # ----------------------------------------------------------------
+    #
+    def _download(self, url, target):
+        """ Download url to the local file target, or serve it from the
+            download cache if it did not change.
+        """
+        cache = self._adaptor.cache
+        headers = dict()
+
+        if cache:
+            headers = cache.conditions(url)
+
+        size = None
+        ranges = False
+        etag = None
+        modified = None
+        location = url
+
+        try:
+            resp, location = self._request('HEAD', url, headers)
+            self._release(resp)
+
+            if resp.status == 304 and headers:
+                if cache.serve(url, target):
+                    self._logger.debug("%s not modified, served from cache" % url)
+                    return
+
+                # evicted meanwhile -- download again, unconditionally
+                resp, location = self._request('HEAD', url)
+                self._release(resp)
+
+            if resp.status == 200:
+                size = int(resp.getheader('content-length', -1))
+                ranges = 'bytes' in resp.getheader('accept-ranges', '')
+                etag = resp.getheader('etag')
+                modified = resp.getheader('last-modified')
+
+        except (ValueError, httplib.HTTPException, socket.error):
+            # no usable HEAD support -- just GET the thing
+            pass
+
+        # range requests are only served from the same version of the file
+        # (weak ETags are not allowed for If-Range)
+        validator = modified
+        if etag and not etag.startswith('W/'):
+            validator = etag
+
+        # without validators, there is no way to reuse a cached copy
+        if not cache or not (etag or modified):
+            self._fetch(location, target, size, ranges, validator)
+            return
+
+        tmp = cache.reserve()
+
+        try:
+            self._fetch(location, tmp, size, ranges, validator)
+        except:
+            os.remove(tmp)
+            raise
+
+        cache.store(url, tmp, etag, modified)
+
+        if not cache.serve(url, target):
+            raise saga.NoSuccess("%s got evicted from the cache" % url)
+
+        # evict only after serving, so that files larger than the cache
+        # still get through
+        cache.evict()
+
+    # ----------------------------------------------------------------
+    #
+    def _fetch(self, url, target, size, ranges, validator=None):
+        """ Fetch url into the local file target.  Large files are fetched
+            in parallel ranges, if the server supports that, and if a
+            validator (ETag or Last-Modified) ensures that all ranges come
+            from the same version of the file.
+        """
+        if ranges and validator and size >= _SPLIT_MIN and self._adaptor.channels > 1:
+            self._download_ranges(url, target, size, validator)
+            return
+
+        resp, url = self._request('GET', url)
+
+        try:
+            if resp.status != 200:
+                raise saga.NoSuccess("GET %s failed: %s %s" % (url, resp.status, resp.reason))
+
+            with open(target, 'wb') as f:
+                while True:
+                    data = resp.read(_BLOCK_SIZE)
+                    if not data:
+                        break
+                    f.write(data)
+
+        finally:
+            self._release(resp)
+
+    # ----------------------------------------------------------------
+    #
+    def _download_ranges(self, url, target, size, validator):
+        """ Download url in one range per channel, concurrently, into target.
+        """
+        with open(target, 'wb') as f:
+            f.truncate(size)
+
+        chunk = (size + self._adaptor.channels - 1) / self._adaptor.channels
+        errors = list()
+
+        def fetch(start, end):
+            try:
+                self._download_range(url, target, start, end, validator)
+            except Exception as e:
+                errors.append(e)
+
+        threads = list()
+        for start in range(0, size, chunk):
+            thread = threading.Thread(target=fetch,
+                                      args=(start, min(start + chunk, size) - 1))
+            thread.start()
+            threads.append(thread)
+
+        for thread in threads:
+            thread.join()
+
+        if errors:
+            raise errors[0]
+
+        self._logger.debug("downloaded %s in %d ranges" % (url, len(threads)))
+
+    # ----------------------------------------------------------------
+    #
+    def _download_range(self, url, target, start, end, validator):
+        """ Download the byte range [start, end] of url into target.  If the
+            transfer breaks, it is resumed where it stopped -- unless the file
+            changed on the server in the meantime (see If-Range).
+        """
+        pos = start
+        retries = _RETRIES
+
+        with open(target, 'r+b') as f:
+
+            while pos <= end:
+
+                try:
+                    resp, _ = self._request('GET', url, {'Range': 'bytes=%d-%d' % (pos, end),
+                                                         'If-Range': validator})
+
+                    try:
+                        if resp.status == 200:
+                            raise saga.IncorrectState("%s changed during the download" % url)
+
+                        if resp.status != 206:
+                            raise saga.NoSuccess("range request on %s failed: %s %s"
+                                                 % (url, resp.status, resp.reason))
+                        f.seek(pos)
+                        while pos <= end:
+                            data = resp.read(min(_BLOCK_SIZE, end - pos + 1))
+                            if not data:
+                                break
+                            f.write(data)
+                            pos += len(data)
+                    finally:
+                        self._release(resp)
+
+                    if pos <= end:
+                        raise saga.NoSuccess("range request on %s ended early" % url)
+
+                except (saga.NoSuccess, httplib.HTTPException, socket.error) as e:
+                    retries -= 1
+                    if not retries:
+                        raise
+                    self._logger.warning("resuming %s at %d: %s" % (url, pos, e))
+
     # ----------------------------------------------------------------
     #
     @SYNC_CALL
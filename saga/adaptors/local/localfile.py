@@ -7,8 +7,17 @@ __license__   = "MIT"
 """ Local filesystem adaptor implementation """
 
 import os
+import glob
+import time
+import mmap
+import Queue
+import errno
+import fcntl
+import ctypes
+import ctypes.util
 import pprint
 import shutil
+import threading
 import traceback
 
 import saga.url
@@ -16,6 +25,7 @@ import saga.adaptors.base
 import saga.adaptors.cpi.filesystem
 
 import saga.utils.misc
+import saga.utils.sync
 
 SYNC_CALL  = saga.adaptors.cpi.decorators.SYNC_CALL
 ASYNC_CALL = saga.adaptors.cpi.decorators.ASYNC_CALL
@@ -27,7 +37,29 @@ ASYNC_CALL = saga.adaptors.cpi.decorators.ASYNC_CALL
 
 _ADAPTOR_NAME          = 'saga.adaptor.filesystem.local'
 _ADAPTOR_SCHEMAS       = ['file', 'local']
-_ADAPTOR_OPTIONS       = []
+_ADAPTOR_OPTIONS       = [
+    { 
+    'category'         : 'saga.adaptor.filesystem.local',
+    'name'             : 'sync_check', 
+    'type'             : str, 
+    'default'          : 'mtime',
+    'valid_options'    : ['mtime', 'md5', 'sha1'],
+    'documentation'    : '''Decides which files are considered unchanged on copies
+                          with the SYNCHRONIZE flag: 'mtime' compares size and
+                          modification time of source and target, 'md5' and 'sha1'
+                          compare size and checksum.''',
+    'env_variable'     : None
+    },
+    { 
+    'category'         : 'saga.adaptor.filesystem.local',
+    'name'             : 'copy_threads', 
+    'type'             : int, 
+    'default'          : 4,
+    'documentation'    : '''Maximal number of copies which are run concurrently
+                          when a task container of copy tasks is run.''',
+    'env_variable'     : None
+    }
+]
 _ADAPTOR_CAPABILITIES  = {}
 
 _ADAPTOR_DOC           = {
@@ -35,7 +67,9 @@ _ADAPTOR_DOC           = {
     'cfg_options'      : _ADAPTOR_OPTIONS, 
     'capabilities'     : _ADAPTOR_CAPABILITIES,
     'description'      : """This adaptor interacts with local filesystem, by
-                            using the (POSIX like) os and shutil Python packages.""",
+                            using the (POSIX like) os and shutil Python packages.
+                            Copies from or to other hosts are handed over to
+                            the shell adaptor.""",
     'schemas'          : {'file'  : 'local filesystem.', 
                           'local' : 'alias for *file*' 
     },
@@ -57,6 +91,316 @@ _ADAPTOR_INFO          = {
 }
 
 
+###############################################################################
+#
+# Files are copied in the kernel where possible.  In the order of preference:
+#
+#   - reflink (FICLONE ioctl): the target shares the data blocks of the source
+#     (btrfs, xfs, ...), so nothing is copied at all;
+#   - copy_file_range(2), which lets the filesystem copy (or clone) the data;
+#   - sendfile(2), which copies the data in the kernel;
+#   - read/write loops, as last resort.
+#
+# Only the data segments of the source are copied (using SEEK_DATA /
+# SEEK_HOLE), so that sparse files stay sparse.  Python 2 has no bindings for
+# most of those calls, so they are used via ctypes.
+#
+_FICLONE   = 0x40049409   # _IOW (0x94, 9, int)
+_SEEK_DATA = 3
+_SEEK_HOLE = 4
+_CHUNK     = 64 * 1024 * 1024
+
+try :
+    _libc = ctypes.CDLL (ctypes.util.find_library ('c'), use_errno=True)
+except Exception :
+    _libc = None
+
+_copy_file_range = getattr (_libc, 'copy_file_range', None)
+_sendfile        = getattr (_libc, 'sendfile64', None) or getattr (_libc, 'sendfile', None)
+
+if  _copy_file_range :
+    _copy_file_range.argtypes = [ctypes.c_int, ctypes.POINTER (ctypes.c_longlong),
+                                 ctypes.c_int, ctypes.POINTER (ctypes.c_longlong),
+                                 ctypes.c_size_t, ctypes.c_uint]
+    _copy_file_range.restype  = ctypes.c_ssize_t
+
+if  _sendfile :
+    _sendfile.argtypes = [ctypes.c_int, ctypes.c_int,
+                          ctypes.POINTER (ctypes.c_longlong), ctypes.c_size_t]
+    _sendfile.restype  = ctypes.c_ssize_t
+
+# errors which tell us that a copy method is not available for the given files
+_UNSUPPORTED = [errno.ENOSYS, errno.EXDEV, errno.EINVAL, errno.EOPNOTSUPP,
+                errno.ENOTTY, errno.EBADF]
+
+
+def _segments (fd, size) :
+    # yield the (offset, length) data segments of the file
+
+    offset = 0
+
+    while offset < size :
+
+        try :
+            start = os.lseek (fd, offset, _SEEK_DATA)
+            end   = os.lseek (fd, start,  _SEEK_HOLE)
+
+        except OSError as e :
+            if  e.errno == errno.ENXIO :
+                return  # only a hole left
+
+            # no sparse file support -- all data
+            yield (offset, size - offset)
+            return
+
+        yield (start, min (end, size) - start)
+        offset = end
+
+
+def _copy_range (src_fd, dst_fd, offset, count, methods) :
+    # copy count bytes at offset, with the first method in methods which
+    # works.  Methods which turn out not to work are removed from the list.
+
+    while count > 0 :
+
+        n = 0
+
+        if  'copy_file_range' in methods :
+            off_in  = ctypes.c_longlong (offset)
+            off_out = ctypes.c_longlong (offset)
+            n = _copy_file_range (src_fd, ctypes.byref (off_in),
+                                  dst_fd, ctypes.byref (off_out),
+                                  min (count, _CHUNK), 0)
+
+        elif 'sendfile' in methods :
+            os.lseek (dst_fd, offset, os.SEEK_SET)
+            off_in = ctypes.c_longlong (offset)
+            n = _sendfile (dst_fd, src_fd, ctypes.byref (off_in), min (count, _CHUNK))
+
+        else :
+            os.lseek (src_fd, offset, os.SEEK_SET)
+            os.lseek (dst_fd, offset, os.SEEK_SET)
+            data = os.read (src_fd, min (count, 1024 * 1024))
+            n    = os.write (dst_fd, data)
+
+        if  n < 0 :
+            err = ctypes.get_errno ()
+            if  err == errno.EINTR :
+                continue
+            if  err in _UNSUPPORTED and methods[0] != 'read' :
+                methods.pop (0)
+                continue
+            raise OSError (err, os.strerror (err))
+
+        if  n == 0 :
+            # source shrunk under our feet
+            break
+
+        offset += n
+        count  -= n
+
+
+def _copy_file (src, tgt) :
+    """
+    Copy the file src to tgt (or into tgt, if that is a directory), including
+    permissions and times (like shutil.copy2).  Returns the number of bytes
+    copied.
+    """
+
+    if  os.path.isdir (tgt) :
+        tgt = os.path.join (tgt, os.path.basename (src))
+
+    src_fd = os.open (src, os.O_RDONLY)
+
+    try :
+        src_st = os.fstat (src_fd)
+        size   = src_st.st_size
+
+        # opening the target truncates it -- which must not hit the source
+        if  os.path.exists (tgt) :
+            tgt_st = os.stat (tgt)
+            if  (src_st.st_dev, src_st.st_ino) == (tgt_st.st_dev, tgt_st.st_ino) :
+                raise saga.exceptions.BadParameter ("Cannot copy %s onto itself (%s)" \
+                                                 % (src, tgt))
+
+        dst_fd = os.open (tgt, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0666)
+
+        try :
+            try :
+                fcntl.ioctl (dst_fd, _FICLONE, src_fd)
+
+            except (IOError, OSError) :
+                methods = [m for m, f in [('copy_file_range', _copy_file_range),
+                                          ('sendfile',        _sendfile)] if f]
+                methods.append ('read')
+
+                for offset, count in _segments (src_fd, size) :
+                    _copy_range (src_fd, dst_fd, offset, count, methods)
+
+                # a trailing hole is not covered by any segment
+                os.ftruncate (dst_fd, size)
+
+        finally :
+            os.close (dst_fd)
+
+    finally :
+        os.close (src_fd)
+
+    shutil.copystat (src, tgt)
+
+    return size
+
+
+def _copy_tree (src, tgt) :
+    """
+    Copy the tree src to tgt, which must not exist (like shutil.copytree).
+    Returns the number of bytes copied.
+    """
+
+    size = 0
+
+    os.makedirs (tgt)
+
+    for name in os.listdir (src) :
+
+        s = os.path.join (src, name)
+        t = os.path.join (tgt, name)
+
+        if  os.path.isdir (s) : size += _copy_tree (s, t)
+        else                  : size += _copy_file (s, t)
+
+    shutil.copystat (src, tgt)
+
+    return size
+
+
+def _get_size (path) :
+    """
+    The size of the file path, or the summed sizes of the files in the tree
+    path.
+    """
+
+    if  not os.path.lexists (path) :
+        raise saga.exceptions.DoesNotExist ("%s does not exist" % path)
+
+    if  not os.path.isdir (path) or os.path.islink (path) :
+        return os.path.getsize (path)
+
+    size = 0
+    for root, dirs, files in os.walk (path) :
+        for name in files :
+            size += os.lstat (os.path.join (root, name)).st_size
+
+    return size
+
+
+def _move (src, tgt) :
+    """
+    Move src to tgt (or into tgt, if that is a directory), like mv.  Returns
+    the new path of src.
+    """
+
+    if  not os.path.lexists (src) :
+        raise saga.exceptions.DoesNotExist ("%s does not exist" % src)
+
+    if  os.path.isdir (tgt) :
+        tgt = os.path.join (tgt, os.path.basename (src))
+
+    try :
+        shutil.move (src, tgt)
+    except (IOError, OSError, shutil.Error) as e :
+        raise saga.exceptions.NoSuccess ("Could not move %s to %s: %s" % (src, tgt, e))
+
+    return tgt
+
+
+def _remove (path, flags) :
+    """
+    Remove path, like 'rm -f': missing entries are ignored, and directories
+    are only removed with the RECURSIVE flag.
+    """
+
+    try :
+        if  os.path.isdir (path) and not os.path.islink (path) :
+            if  not flags & saga.filesystem.RECURSIVE :
+                raise saga.exceptions.BadParameter ("Cannot remove %s (is a directory)" % path)
+            shutil.rmtree (path)
+
+        else :
+            os.unlink (path)
+
+    except OSError as e :
+        if  e.errno != errno.ENOENT :
+            raise saga.exceptions.NoSuccess ("Could not remove %s: %s" % (path, e))
+
+
+def _foreign (url) :
+    # whether url points to another host, or to another kind of filesystem
+
+    url = saga.url.Url (url)
+
+    if  url.schema and not url.schema.lower () in _ADAPTOR_SCHEMAS :
+        return True
+
+    return not saga.utils.misc.url_is_local (url)
+
+
+def _shell_copy (cwd, source, target, flags, session) :
+    # copies from or to other hosts are left to the shell adaptor, which
+    # stages them over ssh
+
+    import saga.engine
+
+    shell = saga.engine.Engine ().get_adaptor ('saga.adaptor.shell_file')
+    cwd   = saga.filesystem.Directory (cwd, session=session, _adaptor=shell)
+
+    try :
+        cwd.copy (source, target, flags)
+    finally :
+        cwd.close ()
+
+
+def _saga_exception (e) :
+    # tasks can only hold saga exceptions
+
+    if  isinstance (e, saga.exceptions.SagaException) :
+        return e
+
+    if  isinstance (e, (IOError, OSError)) and e.errno == errno.ENOENT :
+        return saga.exceptions.DoesNotExist (str (e))
+
+    return saga.exceptions.NoSuccess (str (e))
+
+
+def _log_rate (logger, src, tgt, size, duration) :
+
+    logger.info ("copied %s to %s: %d bytes in %.3fs (%.1f MB/s)" \
+              % (src, tgt, size, duration, size / max (duration, 1e-6) / (1024 * 1024)))
+
+
+###############################################################################
+# 
+def _sync (src, tgt, flags, check) :
+    """
+    Copy only those files of the tree src which are missing or changed in
+    tgt (see saga.utils.sync).  Files are copied with their mtime, so that
+    the next sync recognizes them as unchanged.
+    """
+
+    manifest = lambda path : saga.utils.sync.local_manifest (path, check)
+
+    tgt, dirs, files = saga.utils.sync.plan (src, tgt, 
+                                             flags & saga.filesystem.RECURSIVE, 
+                                             check, manifest, manifest)
+
+    for d in dirs :
+        if not os.path.isdir (saga.utils.sync.join (tgt, d)) :
+            os.makedirs (saga.utils.sync.join (tgt, d))
+
+    for f in files :
+        _copy_file (saga.utils.sync.join (src, f), saga.utils.sync.join (tgt, f))
+
+
 ###############################################################################
 # The adaptor class
 
@@ -71,9 +415,13 @@ class Adaptor (saga.adaptors.base.Base):
 
         saga.adaptors.base.Base.__init__ (self, _ADAPTOR_INFO, _ADAPTOR_OPTIONS)
 
+        self.opts         = self.get_config ()
+        self.sync_check   = str (self.opts['sync_check'].get_value ())
+        self.copy_threads = int (self.opts['copy_threads'].get_value ())
+
         # the adaptor *singleton* creates a (single) instance of a bulk handler
         # (BulkDirectory), which implements container_* bulk methods.
-        self._bulk = BulkDirectory ()
+        self._bulk = BulkDirectory (self.copy_threads)
 
 
     def sanity_check (self) :
@@ -87,14 +435,15 @@ class Adaptor (saga.adaptors.base.Base):
 #
 class BulkDirectory (saga.adaptors.cpi.filesystem.Directory) :
     """
-    Well, this implementation can handle bulks, but cannot optimize them.
-    We leave that code here anyway, for demonstration -- but those methods
-    are also provided as fallback, and are thusly used if the adaptor does
-    not implement the bulk container_* methods at all.
+    Well, this implementation can handle bulks, but cannot optimize them much.
+    Copies are run concurrently though, in a bounded number of threads.  The
+    methods not implemented here are provided as fallback, and are thusly used
+    if the adaptor does not implement the bulk container_* methods at all.
     """
 
-    def __init__ (self) : 
-        pass
+    def __init__ (self, threads=4) : 
+
+        self._threads = max (1, threads)
 
 
     def container_wait (self, tasks, mode, timeout) :
@@ -119,14 +468,40 @@ class BulkDirectory (saga.adaptors.cpi.filesystem.Directory) :
         """
         A *good* implementation would dig the file copy operations from the
         tasks, and run them in a bulk -- we can't do that, so simply *run* the
-        individual tasks, falling back to the default non-bulk asynchronous copy
-        operation...
+        individual tasks.  As the copies are independent, and mostly spend
+        their time in the kernel, they are run in a pool of threads.  The pool
+        is bounded, as too many concurrent copies only thrash the disks.
         """
-      # print " ~ bulk copy ~~~~~~~~~~~~~~~~~~~~~ "
-      # pprint.pprint (tasks)
+
+        queue = Queue.Queue ()
+
         for task in tasks :
-            task.run ()
-      # print " ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ "
+            queue.put (task)
+
+        def worker () :
+            while True :
+                try :
+                    task = queue.get_nowait ()
+                except Queue.Empty :
+                    return
+
+                # a failing task must not take the remaining ones down
+                try :
+                    task.run ()
+                except Exception as e :
+                    task._set_exception (_saga_exception (e))
+                    task._set_state     (saga.task.FAILED)
+
+        threads = [threading.Thread (target=worker)
+                   for _ in range (min (self._threads, len (tasks)))]
+
+        for thread in threads : thread.start ()
+        for thread in threads : thread.join  ()
+
+
+    def container_copy_self (self, tasks) :
+
+        self.container_copy (tasks)
 
 
     # the container methods for the other calls are obviously similar, and left
@@ -224,6 +599,182 @@ class LocalDirectory (saga.adaptors.cpi.filesystem.Directory) :
         return self._url
 
 
+    def _resolve (self, name) :
+        # the absolute local path for name, which is relative to this
+        # directory unless it is absolute
+
+        url = saga.url.Url (name)
+
+        if url.schema :
+            if not url.schema.lower () in _ADAPTOR_SCHEMAS :
+                raise saga.exceptions.BadParameter ("Cannot handle url %s (not local)" %  name)
+
+        if not saga.utils.misc.url_is_local (url) :
+            raise saga.exceptions.BadParameter ("Cannot handle url %s (not local)"     %  name)
+
+        return os.path.normpath (os.path.join (self._path, url.path))
+
+
+    @SYNC_CALL
+    def finalize (self, kill=False) :
+        pass
+
+
+    @SYNC_CALL
+    def close (self, timeout=None) :
+        pass
+
+
+    @SYNC_CALL
+    def change_dir (self, url) :
+
+        path = self._resolve (url)
+
+        if not os.path.isdir (path) :
+            raise saga.exceptions.DoesNotExist ("Cannot change to %s (not a directory)" % url)
+
+        self._url      = saga.url.Url (self._url)
+        self._url.path = path
+        self._path     = path
+
+
+    @SYNC_CALL
+    def list (self, npat, flags) :
+
+        # like 'ls', this leaves out hidden entries unless they are asked for
+        if  npat :
+            names = [os.path.relpath (p, self._path)
+                     for p in glob.glob (os.path.join (self._path, npat))]
+        else :
+            names = [n for n in os.listdir (self._path) if not n.startswith ('.')]
+
+        return [saga.url.Url (name) for name in sorted (names)]
+
+
+    @SYNC_CALL
+    def exists (self, name) :
+
+        return os.path.lexists (self._resolve (name))
+
+
+    @SYNC_CALL
+    def is_dir (self, name) :
+
+        path = self._resolve (name)
+        return os.path.isdir (path) and not os.path.islink (path)
+
+
+    @SYNC_CALL
+    def is_dir_self (self) :
+
+        return not os.path.islink (self._path)
+
+
+    @SYNC_CALL
+    def is_entry (self, name) :
+
+        path = self._resolve (name)
+        return os.path.isfile (path) and not os.path.islink (path)
+
+
+    @SYNC_CALL
+    def is_entry_self (self) :
+
+        return False
+
+
+    @SYNC_CALL
+    def is_link (self, name) :
+
+        return os.path.islink (self._resolve (name))
+
+
+    @SYNC_CALL
+    def is_link_self (self) :
+
+        return os.path.islink (self._path)
+
+
+    @SYNC_CALL
+    def is_file (self, name) :
+
+        return self.is_entry (name)
+
+
+    @SYNC_CALL
+    def is_file_self (self) :
+
+        return False
+
+
+    @SYNC_CALL
+    def get_size (self, name) :
+
+        return _get_size (self._resolve (name))
+
+
+    @SYNC_CALL
+    def get_size_self (self) :
+
+        return _get_size (self._path)
+
+
+    @SYNC_CALL
+    def make_dir (self, name, flags) :
+
+        path = self._resolve (name)
+
+        if  os.path.exists (path) :
+            if  flags & saga.filesystem.EXCLUSIVE :
+                raise saga.exceptions.AlreadyExists ("make_dir target (%s) exists" % name)
+            if  os.path.isdir (path) :
+                return
+
+        try :
+            if  flags & saga.filesystem.CREATE_PARENTS : os.makedirs (path)
+            else                                       : os.mkdir    (path)
+
+        except OSError as e :
+            raise saga.exceptions.NoSuccess ("Could not create %s: %s" % (name, e))
+
+
+    @SYNC_CALL
+    def open_dir (self, url, flags) :
+
+        tgt      = saga.url.Url (self._url)
+        tgt.path = self._resolve (url)
+
+        return saga.filesystem.Directory (tgt, flags, self._session, _adaptor=self._adaptor)
+
+
+    @SYNC_CALL
+    def move (self, source, target, flags) :
+
+        _move (self._resolve (source), self._resolve (target))
+
+
+    @SYNC_CALL
+    def move_self (self, target, flags) :
+
+        path = _move (self._path, self._resolve (target))
+
+        self._url      = saga.url.Url (self._url)
+        self._url.path = path
+        self._path     = path
+
+
+    @SYNC_CALL
+    def remove (self, name, flags) :
+
+        _remove (self._resolve (name), flags)
+
+
+    @SYNC_CALL
+    def remove_self (self, flags) :
+
+        _remove (self._path, flags)
+
+
     @SYNC_CALL
     def open (self, url, flags) :
 
@@ -250,48 +801,34 @@ class LocalDirectory (saga.adaptors.cpi.filesystem.Directory) :
     @SYNC_CALL
     def copy (self, source, target, flags) :
 
-        src_url = saga.url.Url (source)
-        src     = src_url.path
-        tgt_url = saga.url.Url (target)
-        tgt     = tgt_url.path
-
-
-        if src_url.schema :
-            if not src_url.schema.lower () in _ADAPTOR_SCHEMAS :
-                raise saga.exceptions.BadParameter ("Cannot handle url %s (not local)" %  source)
+        if  _foreign (source) or _foreign (target) :
+            return _shell_copy (self._url, source, target, flags, self._session)
 
-        if not saga.utils.misc.url_is_local (src_url) :
-            raise saga.exceptions.BadParameter ("Cannot handle url %s (not local)"     %  source)
+        src = self._resolve (source)
+        tgt = self._resolve (target)
 
-        if src[0] != '/' :
-            if not src_url.scheme and not src_url.host :
-                if self._url.path[0] == '/' :
-                    src = "%s/%s"   % (self._url.path, src)
+        if not os.path.lexists (src) :
+            raise saga.exceptions.DoesNotExist ("Cannot copy %s (does not exist)" % source)
 
+        # FIXME: eval flags
 
-        if tgt_url.schema :
-            if not tgt_url.schema.lower () in _ADAPTOR_SCHEMAS :
-                raise saga.exceptions.BadParameter ("Cannot handle url %s (not local)" %  target)
 
-        if not saga.utils.misc.url_is_local (tgt_url) :
-            raise saga.exceptions.BadParameter ("Cannot handle url %s (not local)"     %  target)
+        start = time.time ()
+        size  = None
 
-        if tgt[0] != '/' :
-            if not tgt_url.scheme and not tgt_url.host :
-                if self._url.path[0] == '/' :
-                    tgt = "%s/%s"   % (self._url.path, tgt)
+        if flags & saga.filesystem.SYNCHRONIZE :
+            _sync (src, tgt, flags, self._adaptor.sync_check)
 
-
-        # FIXME: eval flags, check for existence, etc.
-
-
-        if os.path.isdir (src) :
+        elif os.path.isdir (src) :
           # print "sync copy tree %s -> %s" % (src, tgt)
-            shutil.copytree (src, tgt)
+            size = _copy_tree (src, tgt)
 
         else : 
           # print "sync copy %s -> %s" % (src, tgt)
-            shutil.copy2 (src, tgt)
+            size = _copy_file (src, tgt)
+
+        if size is not None :
+            _log_rate (self._logger, src, tgt, size, time.time () - start)
 
 
 
@@ -332,7 +869,7 @@ class LocalDirectory (saga.adaptors.cpi.filesystem.Directory) :
                 task._set_result (self.copy (c['src'], c['tgt'], c['flags']))
                 task._set_state  (saga.task.DONE)
             except Exception as e :
-                task._set_exception (e)
+                task._set_exception (_saga_exception (e))
                 task._set_state     (saga.task.FAILED)
         elif call == 'init_instance' :
             try :
@@ -340,14 +877,14 @@ class LocalDirectory (saga.adaptors.cpi.filesystem.Directory) :
                 task._set_result (self.get_api ())
                 task._set_state  (saga.task.DONE)
             except Exception as e :
-                task._set_exception (e)
+                task._set_exception (_saga_exception (e))
                 task._set_state     (saga.task.FAILED)
         elif call == 'open' :
             try :
                 task._set_result (self.open (c['url'], c['flags']))
                 task._set_state  (saga.task.DONE)
             except Exception as e :
-                task._set_exception (e)
+                task._set_exception (_saga_exception (e))
                 task._set_state     (saga.task.FAILED)
         else :
             raise saga.exceptions.NotImplemented ("Cannot handle %s tasks" %  call)
@@ -382,6 +919,13 @@ class LocalFile (saga.adaptors.cpi.filesystem.File) :
 
         self._init_check ()
 
+        self._container = self._adaptor._bulk
+
+        self._pos     = 0     # file position for read/write/seek
+        self._fd      = None  # write handle, opened on first write
+        self._mmap    = None  # read-only mapping, created on first read
+        self._mmap_id = None  # (inode, size) of the mapped file
+
         return self.get_api ()
 
 
@@ -439,15 +983,15 @@ class LocalFile (saga.adaptors.cpi.filesystem.File) :
             if not os.path.exists (dirname) :
                 if saga.filesystem.CREATE_PARENTS & flags :
                     try :
-                        os.makedirs (path)
+                        os.makedirs (dirname)
                     except Exception as e :
                         raise saga.exceptions.NoSuccess ("Could not 'mkdir -p %s': %s)"  \
-                                                        % (path, str(e)))
+                                                        % (dirname, str(e)))
                 else :
-                    raise saga.exceptions.BadParameter ("Cannot handle url %s (parent dir does not exist)"  \
+                    raise saga.exceptions.DoesNotExist ("Cannot handle url %s (parent dir does not exist)"  \
                                                      %  path)
         
-            if not os.path.exists (filename) :
+            if not os.path.exists (path) :
                 if saga.filesystem.CREATE & flags :
                     try :
                         open (path, 'w').close () # touch
@@ -455,7 +999,7 @@ class LocalFile (saga.adaptors.cpi.filesystem.File) :
                         raise saga.exceptions.NoSuccess ("Could not 'touch %s': %s)"  \
                                                         % (path, str(e)))
                 else :
-                    raise saga.exceptions.BadParameter ("Cannot handle url %s (file does not exist)"  \
+                    raise saga.exceptions.DoesNotExist ("Cannot handle url %s (file does not exist)"  \
                                                      %  path)
         
         if not os.path.isfile (path) :
@@ -497,12 +1041,200 @@ class LocalFile (saga.adaptors.cpi.filesystem.File) :
         return t
 
 
+    def _get_mmap (self) :
+        """
+        Reads are served from a read-only memory map of the file, which saves
+        the read syscalls and the buffering of file objects.  The file is
+        remapped if it was replaced or changed size since it was mapped.
+        Returns None for empty files, which cannot be mapped.
+        """
+
+        stat = os.stat (self._path)
+
+        if  self._mmap is not None and self._mmap_id == (stat.st_ino, stat.st_size) :
+            return self._mmap
+
+        self._close_mmap ()
+
+        if  not stat.st_size :
+            return None
+
+        with open (self._path, 'rb') as f :
+            self._mmap = mmap.mmap (f.fileno (), 0, access=mmap.ACCESS_READ)
+
+        self._mmap_id = (stat.st_ino, stat.st_size)
+
+        return self._mmap
+
+
+    def _close_mmap (self) :
+
+        if  self._mmap is not None :
+            self._mmap.close ()
+
+        self._mmap    = None
+        self._mmap_id = None
+
+
+    def _get_fd (self) :
+        # the fd for writes is opened on the first write
+
+        if  self._fd is None :
+            self._fd = os.open (self._path, os.O_WRONLY)
+
+        return self._fd
+
+
+    def _pwrite (self, offset, data) :
+        # write all of data at offset (or at the end of the file if offset is
+        # None), and return the offset after the written data
+
+        fd = self._get_fd ()
+
+        if  offset is None : offset = os.lseek (fd, 0,      os.SEEK_END)
+        else               : offset = os.lseek (fd, offset, os.SEEK_SET)
+
+        view = buffer (data)
+
+        while view :
+            n       = os.write (fd, view)
+            offset += n
+            view    = buffer (view, n)
+
+        return offset
+
+
     @SYNC_CALL
-    def copy_self (self, target, flags) :
+    def read (self, size=None) :
+
+        mm = self._get_mmap ()
+
+        if  not mm :
+            return ""
+
+        if  size is None or size < 0 : end = len (mm)
+        else                         : end = min (len (mm), self._pos + size)
+
+        data       = mm[self._pos:end]
+        self._pos += len (data)
+
+        return data
+
+
+    @SYNC_CALL
+    def read_v (self, iovecs) :
+
+        # (offset, length) tuples -- like pread, this leaves the file position
+        # alone
+        mm = self._get_mmap ()
+
+        if  not mm :
+            return ["" for _ in iovecs]
+
+        return [mm[offset:offset + length] for offset, length in iovecs]
+
+
+    @SYNC_CALL
+    def write (self, data, flags=None) :
+        """
+        Writes data at the current file position, and advances the position.
+        As for the shell adaptor, a write at position 0 replaces the complete
+        file content, and data are appended if the file was opened with (or
+        flags contain) APPEND.  Given flags apply to later writes, too.
+        """
+
+        if  flags is None : flags       = self._flags
+        else              : self._flags = flags
+
+        if  flags & saga.filesystem.APPEND :
+            self._pos = self._pwrite (None, data)
+
+        elif self._pos == 0 :
+            os.ftruncate (self._get_fd (), 0)
+            self._pos = self._pwrite (0, data)
+
+        else :
+            self._pos = self._pwrite (self._pos, data)
+
+        return len (data)
+
+
+    @SYNC_CALL
+    def write_v (self, data) :
+
+        # (offset, data) tuples -- like pwrite, this leaves the file position
+        # alone
+        return [self._pwrite (offset, buf) - offset for offset, buf in data]
+
+
+    @SYNC_CALL
+    def seek (self, offset, whence=saga.filesystem.START) :
+
+        if   whence == saga.filesystem.START   : pos = offset
+        elif whence == saga.filesystem.CURRENT : pos = self._pos + offset
+        elif whence == saga.filesystem.END     : pos = os.path.getsize (self._path) + offset
+        else :
+            raise saga.exceptions.BadParameter ("invalid seek mode %s" % whence)
+
+        if  pos < 0 :
+            raise saga.exceptions.BadParameter ("cannot seek before start of file (%s)" % pos)
+
+        self._pos = pos
+
+        return self._pos
+
+
+    @SYNC_CALL
+    def finalize (self, kill=False) :
+
+        self._close_mmap ()
+
+        if  self._fd is not None :
+            os.close (self._fd)
+            self._fd = None
+
+
+    @SYNC_CALL
+    def close (self, timeout=None) :
+
+        self.finalize ()
+
+
+    @SYNC_CALL
+    def is_file_self (self) :
+
+        return not os.path.islink (self._path)
+
+
+    @SYNC_CALL
+    def is_entry_self (self) :
+
+        return self.is_file_self ()
+
+
+    @SYNC_CALL
+    def is_dir_self (self) :
+
+        return False
+
+
+    @SYNC_CALL
+    def is_link_self (self) :
+
+        return os.path.islink (self._path)
+
+
+    @SYNC_CALL
+    def remove_self (self, flags) :
+
+        self.finalize ()
+        _remove (self._path, flags)
+
+
+    @SYNC_CALL
+    def move_self (self, target, flags) :
 
         tgt_url = saga.url.Url (target)
-        tgt     = tgt_url.path
-        src     = self._url.path
 
         if tgt_url.schema :
             if not tgt_url.schema.lower () in _ADAPTOR_SCHEMAS :
@@ -511,14 +1243,47 @@ class LocalFile (saga.adaptors.cpi.filesystem.File) :
         if not saga.utils.misc.url_is_local (tgt_url) :
             raise saga.exceptions.BadParameter ("Cannot handle url %s (not local)"     %  target)
 
+        # open fds and maps follow the file, but are dropped anyway
+        self.finalize ()
+
+        path = _move (self._path, os.path.join (os.path.dirname (self._path), tgt_url.path))
+
+        self._url      = saga.url.Url (self._url)
+        self._url.path = path
+        self._path     = path
+
+
+    @SYNC_CALL
+    def copy_self (self, target, flags) :
+
+        if  _foreign (target) :
+            cwd      = saga.url.Url (self._url)
+            cwd.path = os.path.dirname (self._path)
+            return _shell_copy (cwd, self._url, target, flags, self._session)
+
+        tgt_url = saga.url.Url (target)
+        tgt     = tgt_url.path
+        src     = self._url.path
+
         if tgt[0] != '/' :
             tgt = "%s/%s"   % (os.path.dirname (src), tgt)
 
       # print " copy %s %s" % (self._url, tgt)
-        shutil.copy2 (src, tgt)
+        if flags & saga.filesystem.SYNCHRONIZE :
+            _sync (src, tgt, flags, self._adaptor.sync_check)
+
+        else :
+            start = time.time ()
+            size  = _copy_file (src, tgt)
+            _log_rate (self._logger, src, tgt, size, time.time () - start)
 
 
 
+    def task_wait (self, task, timout) :
+        # FIXME: our task_run moves all tasks into DONE state... :-/
+        pass
+
+
     def task_run (self, task) :
         # FIXME: that should be generalized, possibly wrapped into a thread, and
         # moved to CPI level
@@ -531,14 +1296,14 @@ class LocalFile (saga.adaptors.cpi.filesystem.File) :
                 task._set_result (self.copy_self (c['tgt'], c['flags']))
                 task._set_state  (saga.task.DONE)
             except Exception as e :
-                task._set_exception (e)
+                task._set_exception (_saga_exception (e))
                 task._set_state     (saga.task.FAILED)
         elif call == 'get_size' :
             try :
                 task._set_result (self.get_size_self ())
                 task._set_state  (saga.task.DONE)
             except Exception as e :
-                task._set_exception (e)
+                task._set_exception (_saga_exception (e))
                 task._set_state     (saga.task.FAILED)
         else :
             raise saga.exceptions.NotImplemented ("Cannot handle %s tasks" %  call)
@@ -0,0 +1,1510 @@
+
+__author__    = "Andre Merzky, Ole Weidner"
+__copyright__ = "Copyright 2012-2013, The SAGA Project"
+__license__   = "MIT"
+
+
+""" Local job adaptor implementation """
+
+import os
+import re
+import sys
+import json
+import time
+import errno
+import fcntl
+import atexit
+import ctypes
+import select
+import signal
+import threading
+import subprocess
+import multiprocessing
+
+import saga.adaptors.base
+import saga.adaptors.cpi.job
+
+from   saga.job.constants import *
+
+SYNC_CALL  = saga.adaptors.cpi.decorators.SYNC_CALL
+ASYNC_CALL = saga.adaptors.cpi.decorators.ASYNC_CALL
+
+# bounds for the interval in which jobs without pidfd, and jobs owned by other
+# applications, are polled (seconds)
+POLL_INTERVAL_MIN = 0.1
+POLL_INTERVAL_MAX = 2.0
+
+# time a canceled job gets to terminate before it is killed (seconds)
+CANCEL_GRACE      = 1.0
+
+# max number of pidfds to keep open -- more jobs get polled
+MAX_PIDFDS        = 256
+
+# where job records are persisted
+JOB_RECORDS       = "~/.saga/adaptors/local_job"
+
+FINAL_STATES      = [saga.job.DONE, saga.job.FAILED, saga.job.CANCELED]
+
+
+# --------------------------------------------------------------------
+# the adaptor name
+#
+_ADAPTOR_NAME          = "saga.adaptor.job.local"
+_ADAPTOR_SCHEMAS       = ["fork", "local"]
+_ADAPTOR_OPTIONS       = [
+    {
+    'category'         : 'saga.adaptor.job.local',
+    'name'             : 'persist',
+    'type'             : bool,
+    'default'          : True,
+    'valid_options'    : [True, False],
+    'documentation'    : '''Keep a record of all jobs in ~/.saga/adaptors/local_job/,
+                          so that job services in other application instances
+                          can list the jobs and reconnect to them.  Disabling
+                          this option keeps job state in memory only.''',
+    'env_variable'     : None
+    },
+    {
+    'category'         : 'saga.adaptor.job.local',
+    'name'             : 'purge_on_start',
+    'type'             : bool,
+    'default'          : True,
+    'valid_options'    : [True, False],
+    'documentation'    : '''Purge the records of all jobs which are in final state
+                          when the first job service instance is created.  Note
+                          that this will purge *all* suitable records, including
+                          the ones of jobs managed by another, live application
+                          instance.''',
+    'env_variable'     : None
+    }
+]
+
+# --------------------------------------------------------------------
+# the adaptor capabilities & supported attributes
+#
+_ADAPTOR_CAPABILITIES  = {
+    "jdes_attributes"  : [saga.job.EXECUTABLE,
+                          saga.job.ARGUMENTS,
+                          saga.job.ENVIRONMENT,
+                          saga.job.WORKING_DIRECTORY,
+                          saga.job.INPUT,
+                          saga.job.OUTPUT,
+                          saga.job.ERROR,
+                          saga.job.WALL_TIME_LIMIT,
+                          saga.job.TOTAL_CPU_COUNT],
+    "job_attributes"   : [saga.job.EXIT_CODE,
+                          saga.job.EXECUTION_HOSTS,
+                          saga.job.CREATED,
+                          saga.job.STARTED,
+                          saga.job.FINISHED],
+    "metrics"          : [saga.job.STATE,
+                          saga.job.STATE_DETAIL],
+    "contexts"         : {}
+}
+
+# --------------------------------------------------------------------
+# the adaptor documentation
+#
+_ADAPTOR_DOC           = {
+    "name"             : _ADAPTOR_NAME,
+    "cfg_options"      : _ADAPTOR_OPTIONS,
+    "capabilities"     : _ADAPTOR_CAPABILITIES,
+    "description"      : """
+        The local job adaptor.  This adaptor runs jobs on the local host, as
+        child processes of the application -- without a shell connection and
+        without wrapper scripts.  Each job runs in its own process group (so
+        that suspend and cancel also apply to the processes it spawns), and
+        its command line is interpreted by /bin/sh, like for the shell job
+        adaptor.  A different POSIX shell can be specified via the resource
+        manager URL, like::
+
+          js = saga.job.Service ("fork://localhost/bin/bash")
+
+        The state of the jobs is kept in memory, and is updated by a single
+        thread which reaps the jobs as they finish (via pidfds on Linux, and
+        via polling elsewhere).  If the 'persist' option is enabled, job records
+        are also written to disk, so that other applications can reconnect to
+        the jobs.  Note though that the exit code of a job is only known if the
+        application which started the job was alive when the job finished.
+
+        If this adaptor is disabled, the shell job adaptor serves fork:// and
+        local:// URLs.
+        """,
+    "schemas"          : {"fork"   :"run jobs on local host as child processes",
+                          "local"  :"alias for fork://"}
+}
+
+# --------------------------------------------------------------------
+# the adaptor info is used to register the adaptor with SAGA
+
+_ADAPTOR_INFO          = {
+    "name"             : _ADAPTOR_NAME,
+    "version"          : "v0.1",
+    "schemas"          : _ADAPTOR_SCHEMAS,
+    "capabilities"     : _ADAPTOR_CAPABILITIES,
+    "cpis"             : [
+        {
+        "type"         : "saga.job.Service",
+        "class"        : "LocalJobService"
+        },
+        {
+        "type"         : "saga.job.Job",
+        "class"        : "LocalJob"
+        }
+    ]
+}
+
+
+###############################################################################
+#
+# Jobs are started via posix_spawn(3): unlike fork(2), it does not copy the
+# page tables of the application, which is the main cost of starting a job
+# from a large Python process.
+#
+# A pidfd (Linux >= 5.3) becomes readable when the process it refers to
+# terminates -- so the reaper thread can wait for any number of jobs in
+# a single poll call, without polling them (and without SIGCHLD handlers,
+# which only work in the main thread, and would interfer with the
+# application).
+#
+# Python 2 has no bindings for either call, so they are used via ctypes (on
+# Linux only, as the flag values differ between platforms).  Without them,
+# jobs are started via subprocess, and are polled.
+#
+_NR_PIDFD_OPEN         = 434
+_POSIX_SPAWN_SETPGROUP = 0x02
+_POSIX_SPAWN_SETSIGDEF = 0x04
+
+_libc         = None
+_syscall      = None
+_posix_spawn  = None
+_addclosefrom = None
+_environ      = None
+
+if  sys.platform.startswith ('linux') :
+    try :
+        _libc        = ctypes.CDLL (None, use_errno=True)
+        _syscall     = _libc.syscall
+        _posix_spawn = _libc.posix_spawn
+        _environ     = ctypes.c_void_p.in_dll (_libc, 'environ')
+    except Exception :
+        _posix_spawn = None
+
+    # glibc >= 2.34 -- otherwise, open fds are closed one by one
+    try :
+        _addclosefrom = _libc.posix_spawn_file_actions_addclosefrom_np
+    except Exception :
+        _addclosefrom = None
+
+
+# --------------------------------------------------------------------
+#
+def _spawn_setup (devnull) :
+    """ returns the posix_spawn attributes and stdio fd for jobs, or None """
+
+    if  not _posix_spawn :
+        return None
+
+    attr = ctypes.create_string_buffer (1024)  # posix_spawnattr_t
+    sigs = ctypes.create_string_buffer (1024)  # sigset_t
+
+    # jobs lead their own process group, and get default handlers for the
+    # signals Python ignores
+    _libc.posix_spawnattr_init      (attr)
+    _libc.posix_spawnattr_setflags  (attr, ctypes.c_short (_POSIX_SPAWN_SETPGROUP |
+                                                           _POSIX_SPAWN_SETSIGDEF))
+    _libc.posix_spawnattr_setpgroup (attr, 0)
+
+    _libc.sigemptyset (sigs)
+    _libc.sigaddset   (sigs, signal.SIGPIPE)
+    _libc.sigaddset   (sigs, signal.SIGXFSZ)
+    _libc.posix_spawnattr_setsigdefault (attr, sigs)
+
+    return (attr, devnull)
+
+
+# --------------------------------------------------------------------
+#
+def _spawn_actions (devnull) :
+    """ returns the posix_spawn file actions for a job """
+
+    acts = ctypes.create_string_buffer (1024)  # posix_spawn_file_actions_t
+
+    # jobs have their stdio connected to /dev/null, and inherit no other fds
+    # of the application -- those are collected per spawn, as they change
+    _libc.posix_spawn_file_actions_init (acts)
+    for fd in [0, 1, 2] :
+        _libc.posix_spawn_file_actions_adddup2 (acts, devnull, fd)
+
+    if  _addclosefrom :
+        _addclosefrom (acts, 3)
+
+    else :
+        for fd in _open_fds () :
+            if  fd > 2 :
+                _libc.posix_spawn_file_actions_addclose (acts, fd)
+
+    return acts
+
+
+# --------------------------------------------------------------------
+#
+def _open_fds () :
+    """ returns the fds open in this process """
+
+    for path in ['/proc/self/fd', '/dev/fd'] :
+        try :
+            return [int (fd) for fd in os.listdir (path)]
+        except OSError :
+            pass
+
+    return range (subprocess.MAXFD)
+
+
+# --------------------------------------------------------------------
+#
+def _spawn (setup, argv) :
+    """ start a process via posix_spawn, and return its pid """
+
+    attr, devnull = setup
+
+    acts = _spawn_actions (devnull)
+    args = (ctypes.c_char_p * (len (argv) + 1)) (*argv)
+    pid  = ctypes.c_int ()
+
+    try :
+        ret = _posix_spawn (ctypes.byref (pid), argv[0], acts, attr, args, _environ)
+    finally :
+        _libc.posix_spawn_file_actions_destroy (acts)
+
+    if  ret != 0 :
+        raise OSError (ret, os.strerror (ret))
+
+    return pid.value
+
+
+# --------------------------------------------------------------------
+#
+def _pidfd_open (pid) :
+    """ returns a pidfd for the given child process, or None """
+
+    if  not _syscall :
+        return None
+
+    fd = _syscall (_NR_PIDFD_OPEN, pid, 0)
+
+    if  fd < 0 :
+        return None
+
+    return fd
+
+
+# --------------------------------------------------------------------
+#
+def _proc_stat (pid) :
+    """ returns (state, start time) of a process from /proc, or None """
+
+    try :
+        with open ('/proc/%d/stat' % pid) as f :
+            stat = f.read ()
+    except IOError :
+        return None
+
+    # the command name may contain spaces, so split after it
+    fields = stat[stat.rfind (')') + 2:].split ()
+
+    return (fields[0], fields[19])
+
+
+###############################################################################
+# The adaptor class
+
+class Adaptor (saga.adaptors.base.Base):
+    """
+    This is the actual adaptor class, which gets loaded by SAGA (i.e. by the
+    SAGA engine), and which registers the CPI implementation classes which
+    provide the adaptor's functionality.
+
+    The adaptor instance also holds the state of all jobs of this
+    application: jobs are identified by pid, which is unique on the host, so
+    job services for different URLs can share the same records.
+    """
+
+
+    # ----------------------------------------------------------------
+    #
+    def __init__ (self) :
+
+        saga.adaptors.base.Base.__init__ (self, _ADAPTOR_INFO, _ADAPTOR_OPTIONS)
+
+        self.id_re = re.compile ('^\[(.*)\]-\[(.*?)\]$')
+        self.opts  = self.get_config ()
+
+        self.persist        = self.opts['persist'].get_value ()
+        self.purge_on_start = self.opts['purge_on_start'].get_value ()
+        self.base           = os.path.expanduser (JOB_RECORDS)
+
+        # the reaper thread, and the fds it watches, are only created when the
+        # first job is run.
+        self.jobs     = {}      # pid   -> job info
+        self.pidfds   = {}      # pidfd -> pid
+        self.polled   = set ()  # pids of jobs without pidfd
+        self.timed    = {}      # pid   -> (time, signal) for wall time limits
+        self.cond     = threading.Condition (threading.RLock ())
+        self.thread   = None
+        self.poller   = None
+        self.scale    = None
+        self.devnull  = None
+        self.spawn    = None
+        self.purged   = False
+        self.stopped  = False
+
+
+    # ----------------------------------------------------------------
+    #
+    def sanity_check (self) :
+
+        pass
+
+
+    # ----------------------------------------------------------------
+    #
+    def parse_id (self, id) :
+        # split the id '[rm]-[pid]' in its parts, and return them.
+
+        match = self.id_re.match (id)
+
+        if  not match or len (match.groups()) != 2 :
+            raise saga.BadParameter ("Cannot parse job id '%s'" % id)
+
+        try :
+            return (match.group(1), int (match.group (2)))
+        except ValueError :
+            raise saga.BadParameter ("Cannot parse job id '%s'" % id)
+
+
+    # ----------------------------------------------------------------
+    #
+    def _start (self) :
+
+        # called with the lock held
+        if  self.thread :
+            return
+
+        fds = list ()
+
+        if  hasattr (select, 'epoll') :
+            self.poller = select.epoll ()
+            self.scale  = 1.0
+            fds.append (self.poller.fileno ())
+        else :
+            self.poller = select.poll ()
+            self.scale  = 1000.0   # poll timeouts are in milliseconds
+
+        # a pipe to wake up the reaper thread when the set of jobs changes
+        self.wake_r, self.wake_w = os.pipe ()
+        self.devnull = os.open (os.devnull, os.O_RDWR)
+
+        # none of those must leak into jobs (or other children)
+        for fd in fds + [self.wake_r, self.wake_w, self.devnull] :
+            fcntl.fcntl (fd, fcntl.F_SETFD, fcntl.FD_CLOEXEC)
+
+        self.poller.register (self.wake_r, select.POLLIN)
+        self.spawn = _spawn_setup (self.devnull)
+
+        self.thread = threading.Thread (target=self._reap)
+        self.thread.setDaemon (True)
+        self.thread.start ()
+
+        atexit.register (self._stop)
+
+
+    # ----------------------------------------------------------------
+    #
+    def _stop (self) :
+
+        # stop the reaper before the interpreter tears down the modules it
+        # uses -- the jobs keep running.
+        with self.cond :
+            self.stopped = True
+
+        os.write (self.wake_w, 'x')
+        self.thread.join (1.0)
+
+
+    # ----------------------------------------------------------------
+    #
+    def purge (self) :
+        """ remove the records of final jobs, once per application """
+
+        with self.cond :
+
+            if  self.purged or not self.persist or not self.purge_on_start :
+                return
+
+            self.purged = True
+
+            for pid in self._list_records () :
+
+                info = self._load (pid)
+                if  info :
+                    self._refresh (info)
+
+                if  not info or info['state'] in FINAL_STATES :
+                    self._unlink (pid)
+
+
+    # ----------------------------------------------------------------
+    #
+    def run (self, cmd, shell, wall_time=None) :
+        """
+        run the given command line as a job, and return its pid.  The job is
+        canceled after `wall_time` seconds, if given.
+        """
+
+        with self.cond :
+            self._start ()
+
+        created = time.time ()
+
+        # the job becomes leader of its own process group.  'proc' is True
+        # until the job is reaped, or refers to the subprocess.Popen instance
+        try :
+            if  self.spawn :
+                proc = True
+                pid  = _spawn (self.spawn, [shell, "-c", cmd])
+
+            else :
+                proc = subprocess.Popen ([shell, "-c", cmd],
+                                         stdin      = self.devnull,
+                                         stdout     = self.devnull,
+                                         stderr     = self.devnull,
+                                         close_fds  = True,
+                                         preexec_fn = os.setpgrp)
+                pid  = proc.pid
+
+        except OSError as e :
+            raise saga.NoSuccess ("failed to run job '%s': %s" % (cmd, e))
+
+        info = {'pid'        : pid,
+                'proc'       : proc,
+                'state'      : saga.job.RUNNING,
+                'exit_code'  : None,
+                'created'    : created,
+                'started'    : time.time (),
+                'finished'   : None,
+                'start_time' : None,
+                'owned'      : True}
+
+        stat = _proc_stat (pid)
+        if  stat :
+            info['start_time'] = stat[1]
+
+        with self.cond :
+
+            self.jobs[pid] = info
+
+            fd = None
+            if  len (self.pidfds) < MAX_PIDFDS :
+                fd = _pidfd_open (pid)
+
+            if  fd is not None :
+                fcntl.fcntl (fd, fcntl.F_SETFD, fcntl.FD_CLOEXEC)
+                self.pidfds[fd] = pid
+                info['pidfd']   = fd
+                self.poller.register (fd, select.POLLIN)
+            else :
+                info['pidfd']   = None
+                self.polled.add (pid)
+
+            if  wall_time :
+                self.timed[pid] = (info['started'] + wall_time, signal.SIGTERM)
+
+            self._save (info)
+
+        os.write (self.wake_w, 'x')
+
+        return pid
+
+
+    # ----------------------------------------------------------------
+    #
+    def job_info (self, pid) :
+        """
+        Return the info for the given job, which is refreshed if the job is
+        not owned by this application.  Raises BadParameter for unknown jobs.
+        """
+
+        with self.cond :
+
+            info = self.jobs.get (pid)
+
+            if  not info :
+                info = self._load (pid)
+                if  not info :
+                    raise saga.BadParameter ("job id [%s] unknown" % pid)
+
+                self.jobs[pid] = info
+
+            if  info['owned'] :
+                self._check (pid)
+            else :
+                self._refresh (info)
+
+            return info
+
+
+    # ----------------------------------------------------------------
+    #
+    def list (self) :
+
+        with self.cond :
+
+            pids = set (self.jobs.keys ())
+
+            if  self.persist :
+                pids.update (self._list_records ())
+
+            return sorted (pids)
+
+
+    # ----------------------------------------------------------------
+    #
+    def suspend (self, pid) :
+
+        with self.cond :
+
+            info = self.job_info (pid)
+
+            if  info['state'] != saga.job.RUNNING :
+                raise saga.IncorrectState ("job [%s] in incorrect state (%s != %s)" \
+                                        % (pid, info['state'], saga.job.RUNNING))
+
+            self._signal (info, signal.SIGSTOP)
+            info['state'] = saga.job.SUSPENDED
+            self._save (info)
+
+
+    # ----------------------------------------------------------------
+    #
+    def resume (self, pid) :
+
+        with self.cond :
+
+            info = self.job_info (pid)
+
+            if  info['state'] != saga.job.SUSPENDED :
+                raise saga.IncorrectState ("job [%s] in incorrect state (%s != %s)" \
+                                        % (pid, info['state'], saga.job.SUSPENDED))
+
+            self._signal (info, signal.SIGCONT)
+            info['state'] = saga.job.RUNNING
+            self._save (info)
+
+
+    # ----------------------------------------------------------------
+    #
+    def cancel (self, pids, timeout=None) :
+        """
+        Terminate the given jobs, and kill them if they are still alive
+        after `timeout` seconds (CANCEL_GRACE by default).
+        """
+
+        if  timeout is None or timeout < 0 :
+            timeout = CANCEL_GRACE
+
+        with self.cond :
+
+            infos = list ()
+
+            for pid in pids :
+
+                info = self.job_info (pid)
+
+                if  info['state'] in FINAL_STATES :
+                    raise saga.IncorrectState ("job [%s] in incorrect state (%s)" \
+                                            % (pid, info['state']))
+
+                # suspended jobs need to continue to see the signal
+                self._signal (info, signal.SIGTERM)
+                self._signal (info, signal.SIGCONT)
+
+                info['state']    = saga.job.CANCELED
+                info['finished'] = time.time ()
+                self._save (info)
+
+                infos.append (info)
+
+            # the reaper keeps the state, but records the exit code.  Jobs
+            # owned by other applications cannot be waited for, but are
+            # polled -- they get the same grace period.
+            deadline = time.time () + timeout
+            interval = POLL_INTERVAL_MIN
+
+            while True :
+
+                alive = [info for info in infos if self._alive (info)]
+                if  not alive :
+                    break
+
+                remaining = deadline - time.time ()
+                if  remaining <= 0 :
+                    break
+
+                if  [info for info in alive if not info['owned']] :
+                    self.cond.wait (min (remaining, interval))
+                    interval = min (interval * 2, POLL_INTERVAL_MAX)
+                else :
+                    self.cond.wait (remaining)
+
+            for info in alive :
+                self._signal (info, signal.SIGKILL)
+
+
+    # ----------------------------------------------------------------
+    #
+    def wait (self, pids, timeout, any=False) :
+        """
+        Wait until all (or any) of the given jobs reached a final state.
+        Returns the pids of the final jobs, or None on timeout.
+        """
+
+        deadline = None
+        if  timeout >= 0 :
+            deadline = time.time () + timeout
+
+        interval = POLL_INTERVAL_MIN
+
+        with self.cond :
+
+            while True :
+
+                infos = [self.job_info (pid) for pid in pids]
+                final = [info['pid'] for info in infos if info['state'] in FINAL_STATES]
+
+                if  final and (any or len (final) == len (pids)) :
+                    return final
+
+                if  deadline is not None and deadline <= time.time () :
+                    return None
+
+                # jobs of this application are reaped and notified, jobs of
+                # other applications need polling
+                delay = None
+
+                if  [info for info in infos if not info['owned']] :
+                    delay    = interval
+                    interval = min (interval * 2, POLL_INTERVAL_MAX)
+
+                if  deadline is not None :
+                    remaining = deadline - time.time ()
+                    if  delay is None or remaining < delay :
+                        delay = remaining
+
+                self.cond.wait (delay)
+
+
+    # ----------------------------------------------------------------
+    #
+    def _signal (self, info, sig) :
+
+        # signal the job's process group
+        try :
+            os.killpg (info['pid'], sig)
+
+        except OSError as e :
+            if  e.errno != errno.ESRCH :
+                raise saga.NoSuccess ("failed to signal job [%s]: %s" % (info['pid'], e))
+
+
+    # ----------------------------------------------------------------
+    #
+    def _check (self, pid) :
+
+        # reap the job if it finished -- called with the lock held
+        info = self.jobs.get (pid)
+
+        if  not info or not info['proc'] :
+            return False
+
+        try :
+            ret, status = os.waitpid (pid, os.WNOHANG)
+
+        except OSError as e :
+            if  e.errno != errno.ECHILD :
+                raise
+            # somebody else reaped the job: the exit code is lost
+            ret, status = pid, None
+
+        if  ret == 0 :
+            return False
+
+        if  status is None :
+            exit_code = None
+        elif os.WIFSIGNALED (status) :
+            # report like the shell does
+            exit_code = 128 + os.WTERMSIG (status)
+        else :
+            exit_code = os.WEXITSTATUS (status)
+
+        # keep subprocess from reaping the job again
+        if  info['proc'] is not True :
+            info['proc'].returncode = exit_code
+
+        info['proc'] = None
+
+        info['exit_code'] = exit_code
+
+        if  info['state'] != saga.job.CANCELED :
+            info['finished'] = time.time ()
+
+            if  exit_code == 0 :
+                info['state'] = saga.job.DONE
+            else :
+                info['state'] = saga.job.FAILED
+
+        fd = info.pop ('pidfd', None)
+        if  fd is not None :
+            del self.pidfds[fd]
+            self.poller.unregister (fd)
+            os.close (fd)
+
+        self.polled.discard (pid)
+        self.timed.pop (pid, None)
+        self._save (info)
+
+        self.cond.notify_all ()
+
+        return True
+
+
+    # ----------------------------------------------------------------
+    #
+    def _reap (self) :
+
+        interval = POLL_INTERVAL_MIN
+
+        while True :
+
+            with self.cond :
+
+                timeout = None
+                if  self.polled :
+                    timeout = interval
+
+                # wake up for the next wall time limit
+                if  self.timed :
+                    due     = min (self.timed.values ())[0] - time.time ()
+                    timeout = max (0.0, min (due, timeout or due))
+
+            try :
+                if  timeout is not None :
+                    events = self.poller.poll (timeout * self.scale)
+                else :
+                    events = self.poller.poll ()
+            except (IOError, OSError, select.error) as e :
+                if  e.args[0] == errno.EINTR :
+                    continue
+                raise
+
+            with self.cond :
+
+                if  self.stopped :
+                    return
+
+                for fd, _ in events :
+
+                    if  fd == self.wake_r :
+                        # a new job -- poll soon
+                        os.read (self.wake_r, 65536)
+                        interval = POLL_INTERVAL_MIN
+                        continue
+
+                    if  fd in self.pidfds :
+                        self._check (self.pidfds[fd])
+
+                # jobs without pidfd are polled, less often as long as none of
+                # them finishes
+                finished = False
+                for pid in list (self.polled) :
+                    finished |= self._check (pid)
+
+                if  finished :
+                    interval = POLL_INTERVAL_MIN
+                else :
+                    interval = min (interval * 2, POLL_INTERVAL_MAX)
+
+                self._expire (time.time ())
+
+
+    # ----------------------------------------------------------------
+    #
+    def _expire (self, now) :
+
+        # cancel jobs which exceeded their wall time limit, and kill them if
+        # they are still alive after CANCEL_GRACE -- called with the lock held
+        for pid, (due, sig) in self.timed.items () :
+
+            if  due > now :
+                continue
+
+            info = self.jobs.get (pid)
+
+            if  not info or not info['proc'] :
+                del self.timed[pid]
+                continue
+
+            self._signal (info, sig)
+
+            if  sig == signal.SIGKILL :
+                del self.timed[pid]
+                continue
+
+            # suspended jobs need to continue to see the signal
+            self._signal (info, signal.SIGCONT)
+
+            self._logger.info ("job [%s] exceeded its wall time limit" % pid)
+
+            info['state']    = saga.job.CANCELED
+            info['finished'] = now
+            self._save (info)
+
+            self.timed[pid] = (now + CANCEL_GRACE, signal.SIGKILL)
+            self.cond.notify_all ()
+
+
+    # ----------------------------------------------------------------
+    #
+    def _alive (self, info, stat=None) :
+
+        # whether the process of a job still runs, whatever its state says
+        if  info['owned'] :
+            return bool (info['proc'])
+
+        if  stat is None :
+            stat = _proc_stat (info['pid'])
+
+        if  stat :
+            # make sure the pid was not reused by another process
+            return not (stat[0] in 'ZX' or
+                        (info['start_time'] and stat[1] != info['start_time']))
+
+        try :
+            os.kill (info['pid'], 0)
+        except OSError as e :
+            return (e.errno == errno.EPERM)
+
+        return True
+
+
+    # ----------------------------------------------------------------
+    #
+    def _refresh (self, info) :
+
+        # update the state of a job owned by another application -- we can't
+        # wait for it, but can check if it is still alive
+        if  info['state'] in FINAL_STATES :
+            return
+
+        pid  = info['pid']
+        stat = _proc_stat (pid)
+
+        if  self._alive (info, stat) :
+
+            if  stat and stat[0] == 'T' :
+                info['state'] = saga.job.SUSPENDED
+            elif stat :
+                info['state'] = saga.job.RUNNING
+
+            return
+
+        # the owner may have recorded the final state
+        record = self._load (pid)
+        if  record and record['state'] in FINAL_STATES :
+            info.update (record)
+            return
+
+        info['state']    = saga.job.DONE
+        info['finished'] = time.time ()
+
+
+    # ----------------------------------------------------------------
+    #
+    def _list_records (self) :
+
+        if  not os.path.isdir (self.base) :
+            return []
+
+        return [int (name) for name in os.listdir (self.base) if name.isdigit ()]
+
+
+    # ----------------------------------------------------------------
+    #
+    def _save (self, info) :
+
+        if  not self.persist :
+            return
+
+        record = dict ([(key, info.get (key)) for key in \
+                        ['pid', 'state', 'exit_code', 'created',
+                         'started', 'finished', 'start_time']])
+
+        path = "%s/%s" % (self.base, info['pid'])
+        tmp  = "%s/.%s.%s" % (self.base, info['pid'], threading.current_thread ().ident)
+
+        try :
+            if  not os.path.isdir (self.base) :
+                os.makedirs (self.base)
+
+            # replace the record atomically, for concurrent readers
+            with open (tmp, 'w') as f :
+                json.dump (record, f)
+
+            os.rename (tmp, path)
+
+        except (IOError, OSError) as e :
+            self._logger.warning ("cannot store job record %s: %s" % (path, e))
+
+
+    # ----------------------------------------------------------------
+    #
+    def _load (self, pid) :
+
+        if  not self.persist :
+            return None
+
+        try :
+            with open ("%s/%s" % (self.base, pid)) as f :
+                record = json.load (f)
+
+        except (IOError, ValueError) :
+            return None
+
+        record['pid']   = pid
+        record['proc']  = None
+        record['owned'] = False
+
+        return record
+
+
+    # ----------------------------------------------------------------
+    #
+    def _unlink (self, pid) :
+
+        try :
+            os.unlink ("%s/%s" % (self.base, pid))
+        except OSError :
+            pass
+
+
+###############################################################################
+#
+class LocalJobService (saga.adaptors.cpi.job.Service) :
+    """ Implements saga.adaptors.cpi.job.Service """
+
+    # ----------------------------------------------------------------
+    #
+    def __init__ (self, api, adaptor) :
+
+        _cpi_base = super  (LocalJobService, self)
+        _cpi_base.__init__ (api, adaptor)
+
+
+    # ----------------------------------------------------------------
+    #
+    @SYNC_CALL
+    def init_instance (self, adaptor_state, rm_url, session) :
+        """ Service instance constructor """
+
+        self.rm      = rm_url
+        self.session = session
+        self.shell   = "/bin/sh"
+
+        if  self.rm.host and self.rm.host not in ['localhost', '127.0.0.1'] :
+            raise saga.BadParameter ("Can only run jobs on localhost, not on %s" \
+                                  % self.rm.host)
+
+        if  self.rm.path and self.rm.path != '/' and self.rm.path != '.' :
+            self.shell = self.rm.path
+
+        self._adaptor.purge ()
+
+        return self.get_api ()
+
+
+    # ----------------------------------------------------------------
+    #
+    def close (self) :
+
+        # the jobs are not bound to the service instance
+        pass
+
+
+    # ----------------------------------------------------------------
+    #
+    def _jd2cmd (self, jd) :
+
+        exe = jd.executable
+        arg = ""
+        env = ""
+        cwd = ""
+        io  = ""
+
+        if  jd.attribute_exists (ARGUMENTS) :
+            for a in jd.arguments :
+                arg += "%s " % a
+
+        if  jd.attribute_exists (ENVIRONMENT) :
+            for e in jd.environment :
+                env += "export %s=%s; "  %  (e, jd.environment[e])
+
+        if  jd.attribute_exists (WORKING_DIRECTORY) :
+            cwd = "mkdir -p %s && cd %s && " % (jd.working_directory, jd.working_directory)
+
+        if  jd.attribute_exists (INPUT) :
+            io += "<%s " % jd.input
+
+        if  jd.attribute_exists (OUTPUT) :
+            io += "1>%s " % jd.output
+
+        if  jd.attribute_exists (ERROR) :
+            io += "2>%s " % jd.error
+
+        # the shell replaces itself with simple commands, so usually no
+        # additional process is created
+        if  io :
+            io = "exec %s&& " % io
+
+        cmd = "%s%s%s%s %s" % (env, cwd, io, exe, arg)
+
+        return cmd
+
+
+    # ----------------------------------------------------------------
+    #
+    def _job_id (self, pid) :
+
+        return "[%s]-[%s]" % (self.rm, pid)
+
+
+    # ----------------------------------------------------------------
+    #
+    def _job_run (self, jd) :
+        """ runs a job, and returns the job id """
+
+        # all cores of this host are available to the job, but not more
+        if  jd.attribute_exists (TOTAL_CPU_COUNT) and jd.total_cpu_count :
+            if  int (jd.total_cpu_count) > multiprocessing.cpu_count () :
+                raise saga.BadParameter ("this host has only %d cores, not %s" \
+                                      % (multiprocessing.cpu_count (), jd.total_cpu_count))
+
+        # the wall time limit is given in minutes
+        wall_time = None
+        if  jd.attribute_exists (WALL_TIME_LIMIT) and jd.wall_time_limit :
+            wall_time = float (jd.wall_time_limit) * 60
+
+        cmd    = self._jd2cmd (jd)
+        pid    = self._adaptor.run (cmd, self.shell, wall_time)
+        job_id = self._job_id (pid)
+
+        self._logger.debug ("started job %s" % job_id)
+
+        return job_id
+
+
+    # ----------------------------------------------------------------
+    #
+    @SYNC_CALL
+    def run_job (self, cmd, host) :
+        """ Implements saga.adaptors.cpi.job.Service.run_job()
+        """
+
+        if not cmd :
+            raise saga.BadParameter._log (self._logger, "run_job needs a command to run")
+
+        if  host and host != self.rm.host :
+            raise saga.BadParameter._log (self._logger, "Can only run jobs on %s, not on %s" \
+                                       % (self.rm.host, host))
+
+        cmd_quoted = cmd.replace ("'", "\\\\'")
+
+        jd = saga.job.Description ()
+
+        jd.executable = "/bin/sh"
+        jd.arguments  = ["-c", "'%s'" % cmd_quoted]
+
+        job = self.create_job (jd)
+        job.run ()
+
+        return job
+
+
+    # ----------------------------------------------------------------
+    #
+    @SYNC_CALL
+    def create_job (self, jd) :
+        """ Implements saga.adaptors.cpi.job.Service.create_job()
+        """
+
+        # this dict is passed on to the job adaptor class -- use it to pass any
+        # state information you need there.
+        adaptor_state = { "job_service"     : self,
+                          "job_description" : jd,
+                          "job_schema"      : self.rm.schema }
+
+        return saga.job.Job (_adaptor=self._adaptor, _adaptor_state=adaptor_state)
+
+
+    # ----------------------------------------------------------------
+    @SYNC_CALL
+    def get_url (self) :
+        """ Implements saga.adaptors.cpi.job.Service.get_url()
+        """
+        return self.rm
+
+
+    # ----------------------------------------------------------------
+    #
+    @SYNC_CALL
+    def list (self):
+        """ Implements saga.adaptors.cpi.job.Service.list()
+        """
+
+        return [self._job_id (pid) for pid in self._adaptor.list ()]
+
+
+    # ----------------------------------------------------------------
+    #
+    @SYNC_CALL
+    def get_job (self, jobid):
+        """ Implements saga.adaptors.cpi.job.Service.get_job()
+        """
+
+        rm, pid = self._adaptor.parse_id (jobid)
+
+        # raises BadParameter for unknown jobs
+        self._adaptor.job_info (pid)
+
+        # this dict is passed on to the job adaptor class -- use it to pass any
+        # state information you need there.
+        adaptor_state = { "job_service"     : self,
+                          "job_id"          : self._job_id (pid),
+                          "job_schema"      : self.rm.schema }
+
+        return saga.job.Job (_adaptor=self._adaptor, _adaptor_state=adaptor_state)
+
+
+    # ----------------------------------------------------------------
+    #
+    @SYNC_CALL
+    def container_run (self, jobs) :
+        """
+        Jobs are started right away, so there is nothing to bulk -- but
+        failures are recorded on the respective jobs, and don't prevent the
+        other jobs from running.
+        """
+
+        self._logger.debug ("container run: %s"  %  str(jobs))
+
+        for job in jobs :
+
+            try :
+                job._adaptor._id = self._job_run (job._adaptor.jd)
+
+            except saga.SagaException as e :
+                job._adaptor._state     = saga.job.FAILED
+                job._adaptor._exception = e
+
+
+    # ----------------------------------------------------------------
+    #
+    @SYNC_CALL
+    def container_wait (self, jobs, mode, timeout) :
+
+        self._logger.debug ("container wait: %s"  %  str(jobs))
+
+        pids  = dict ()
+        for job in jobs :
+            if  job._adaptor._id :
+                rm, pid   = self._adaptor.parse_id (job._adaptor._id)
+                pids[pid] = job
+
+        if  not pids :
+            return None
+
+        final = self._adaptor.wait (pids.keys (), timeout, any=(mode == saga.task.ANY))
+
+        if  not final :
+            return None
+
+        for pid in final :
+            pids[pid]._adaptor.get_state ()
+
+        return pids[final[0]]
+
+
+    # ----------------------------------------------------------------
+    #
+    @SYNC_CALL
+    def container_cancel (self, jobs, timeout) :
+
+        self._logger.debug ("container cancel: %s"  %  str(jobs))
+
+        pids = list ()
+        for job in jobs :
+            if  job._adaptor._id :
+                rm, pid = self._adaptor.parse_id (job._adaptor._id)
+                if  self._adaptor.job_info (pid)['state'] not in FINAL_STATES :
+                    pids.append (pid)
+
+        # all jobs are terminated at once, and share the grace period
+        self._adaptor.cancel (pids, timeout)
+
+        for job in jobs :
+            job._adaptor.get_state ()
+
+
+    # ----------------------------------------------------------------
+    #
+    @SYNC_CALL
+    def container_get_states (self, jobs) :
+
+        self._logger.debug ("container get_state: %s"  %  str(jobs))
+
+        # no need to bulk anything: states are known locally
+        return [job._adaptor.get_state () for job in jobs]
+
+
+###############################################################################
+#
+class LocalJob (saga.adaptors.cpi.job.Job) :
+    """ Implements saga.adaptors.cpi.job.Job
+    """
+    # ----------------------------------------------------------------
+    #
+    def __init__ (self, api, adaptor) :
+
+        _cpi_base = super  (LocalJob, self)
+        _cpi_base.__init__ (api, adaptor)
+
+
+    # ----------------------------------------------------------------
+    #
+    @SYNC_CALL
+    def init_instance (self, job_info):
+        """ Implements saga.adaptors.cpi.job.Job.init_instance()
+        """
+
+        if  'job_description' in job_info :
+            # comes from job.service.create_job()
+            self.js = job_info["job_service"]
+            self.jd = job_info["job_description"]
+
+            # initialize job attribute values
+            self._id              = None
+            self._state           = saga.job.NEW
+            self._exit_code       = None
+            self._exception       = None
+            self._created         = time.time ()
+            self._started         = None
+            self._finished        = None
+
+        elif 'job_id' in job_info :
+            # initialize job attribute values
+            self.js               = job_info["job_service"]
+            self.jd               = None
+            self._id              = job_info['job_id']
+            self._state           = saga.job.UNKNOWN
+            self._exit_code       = None
+            self._exception       = None
+            self._created         = None
+            self._started         = None
+            self._finished        = None
+
+        else :
+            # don't know what to do...
+            raise saga.BadParameter ("Cannot create job, insufficient information")
+
+        # the js is responsible for job bulk operations
+        self._container = self.js
+
+        return self.get_api ()
+
+
+    # ----------------------------------------------------------------
+    #
+    def _pid (self) :
+
+        rm, pid = self._adaptor.parse_id (self._id)
+        return pid
+
+
+    # ----------------------------------------------------------------
+    #
+    @SYNC_CALL
+    def get_description (self):
+        return self.jd
+
+
+    # ----------------------------------------------------------------
+    #
+    @SYNC_CALL
+    def get_state (self):
+        """ Implements saga.adaptors.cpi.job.Job.get_state() """
+
+        # may not yet have backend representation, state is 'NEW' (or
+        # 'FAILED' if it did not start in a container)
+        if self._id == None :
+            return self._state
+
+        info = self._adaptor.job_info (self._pid ())
+
+        self._exit_code = info['exit_code']
+        self._started   = info['started']
+        self._finished  = info['finished']
+
+        if  self._created is None :
+            self._created = info['created']
+
+        if  self._state != info['state'] :
+            self._state  = info['state']
+            self._api ()._attributes_i_set ('state', self._state, self._api ()._UP)
+
+        return self._state
+
+
+    # ----------------------------------------------------------------
+    #
+    @SYNC_CALL
+    def get_created (self) :
+
+        # no need to refresh stats -- this is set locally
+        return self._created
+
+
+    # ----------------------------------------------------------------
+    #
+    @SYNC_CALL
+    def get_started (self) :
+
+        self.get_state () # refresh stats
+        return self._started
+
+
+    # ----------------------------------------------------------------
+    #
+    @SYNC_CALL
+    def get_finished (self) :
+
+        self.get_state () # refresh stats
+        return self._finished
+
+
+    # ----------------------------------------------------------------
+    #
+    @SYNC_CALL
+    def get_service_url (self):
+
+        if not self.js :
+            raise saga.IncorrectState ("Job Service URL unknown")
+        else :
+            return self.js.get_url ()
+
+
+    # ----------------------------------------------------------------
+    #
+    @SYNC_CALL
+    def wait (self, timeout):
+        """
+        Jobs of this application are reaped as soon as they finish, so
+        waiting for them does not need to poll.
+        """
+
+        if  self._id == None :
+            raise saga.IncorrectState ("cannot wait for job which was not started")
+
+        if  self._adaptor.wait ([self._pid ()], timeout) is None :
+            return False
+
+        self.get_state ()
+        return True
+
+
+    # ----------------------------------------------------------------
+    #
+    @SYNC_CALL
+    def get_id (self) :
+        """ Implements saga.adaptors.cpi.job.Job.get_id() """
+        return self._id
+
+
+    # ----------------------------------------------------------------
+    #
+    @SYNC_CALL
+    def get_exit_code (self) :
+        """ Implements saga.adaptors.cpi.job.Job.get_exit_code() """
+
+        if  self._exit_code == None and self._id != None :
+            self.get_state ()
+
+        return self._exit_code
+
+
+    # ----------------------------------------------------------------
+    #
+    @SYNC_CALL
+    def get_execution_hosts (self) :
+        """ Implements saga.adaptors.cpi.job.Job.get_execution_hosts()
+        """
+        return [self.js.get_url ().host]
+
+
+    # ----------------------------------------------------------------
+    #
+    @SYNC_CALL
+    def run (self):
+
+        if  self._id != None :
+            raise saga.IncorrectState ("job was already started")
+
+        self._id = self.js._job_run (self.jd)
+        self.get_state ()
+
+
+    # ----------------------------------------------------------------
+    #
+    @SYNC_CALL
+    def suspend (self):
+
+        self._adaptor.suspend (self._pid ())
+        self.get_state ()
+
+
+    # ----------------------------------------------------------------
+    #
+    @SYNC_CALL
+    def resume (self):
+
+        self._adaptor.resume (self._pid ())
+        self.get_state ()
+
+
+    # ----------------------------------------------------------------
+    #
+    @SYNC_CALL
+    def cancel (self, timeout):
+
+        self._adaptor.cancel ([self._pid ()], timeout)
+        self.get_state ()
+
+
+    # ----------------------------------------------------------------
+    #
+    @SYNC_CALL
+    def re_raise (self):
+        # nothing to do here actually, as run () is synchronous...
+        return self._exception
+
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
@@ -9,9 +9,9 @@ __license__   = "MIT"
 
 import saga.utils.which
 import saga.utils.pty_shell
-import saga.utils.threads   as sut
 
 import saga.adaptors.base
+import saga.adaptors.poller
 import saga.adaptors.cpi.job
 
 from saga.job.constants import *
@@ -19,7 +19,6 @@ from saga.job.constants import *
 import re
 import os 
 import time
-import threading
 
 from copy import deepcopy
 from cgi  import parse_qs
@@ -27,66 +26,10 @@ from cgi  import parse_qs
 SYNC_CALL = saga.adaptors.cpi.decorators.SYNC_CALL
 ASYNC_CALL = saga.adaptors.cpi.decorators.ASYNC_CALL
 
-SYNC_WAIT_UPDATE_INTERVAL = 1  # seconds
-MONITOR_UPDATE_INTERVAL = 3  # seconds
-
-
-# --------------------------------------------------------------------
-#
-class _job_state_monitor(threading.Thread):
-    """ thread that periodically monitors job states
-    """
-    def __init__(self, job_service):
-
-        self.logger = job_service._logger
-        self.js = job_service
-        self._stop = sut.Event()
-
-        super(_job_state_monitor, self).__init__()
-        self.setDaemon(True)
-
-    def stop(self):
-        self._stop.set()
-
-
-    def stopped(self):
-        return self._stop.isSet()
-
-    def run(self):
-        while self.stopped() is False:
-            try:
-                # do bulk updates here! we don't want to pull information
-                # job by job. that would be too inefficient!
-                jobs = self.js.jobs
-                job_keys = jobs.keys()
-
-                for job in job_keys:
-                    # if the job hasn't been started, we can't update its
-                    # state. we can tell if a job has been started if it
-                    # has a job id
-                    if jobs[job]['job_id'] is not None:
-                        # we only need to monitor jobs that are not in a
-                        # terminal state, so we can skip the ones that are 
-                        # either done, failed or canceled
-                        state = jobs[job]['state']
-                        if (state != saga.job.DONE) and (state != saga.job.FAILED) and (state != saga.job.CANCELED):
-
-                            job_info = self.js._job_get_info(job)
-                            self.logger.info("Job monitoring thread updating Job %s (state: %s)" % (job, job_info['state']))
-
-                            if job_info['state'] != jobs[job]['state']:
-                                # fire job state callback if 'state' has changed
-                                if job._api() is not None:
-                                    job._api()._attributes_i_set('state', job_info['state'], job._api()._UP, True)
-                                else:
-                                    self.logger.warning("api() object is 'None' for job object %s - can't fire callback." % str(job))
-
-                            # update job info
-                            self.js.jobs[job] = job_info
-
-                time.sleep(MONITOR_UPDATE_INTERVAL)
-            except Exception as e:
-                self.logger.warning("Exception caught in job monitoring thread: %s" % e)
+# job states are polled in bulk, with an interval between these bounds
+# (see saga.adaptors.poller)
+POLL_INTERVAL_MIN = 1   # seconds
+POLL_INTERVAL_MAX = 30  # seconds
 
 
 # --------------------------------------------------------------------
@@ -390,7 +333,7 @@ class PBSJobService (saga.adaptors.cpi.job.Service):
     #
     def __init__(self, api, adaptor):
 
-        self._mt  = None
+        self.poller = None
         _cpi_base = super(PBSJobService, self)
         _cpi_base.__init__(api, adaptor)
 
@@ -407,11 +350,9 @@ class PBSJobService (saga.adaptors.cpi.job.Service):
     #
     def close(self):
 
-        if  self.mt :
-            self.mt.stop()
-            self.mt.join(10)  # don't block forever on join()
-
-        self._logger.info("Job monitoring thread stopped.")
+        if  self.poller :
+            self.poller.unregister()
+            self.poller = None
 
         self.finalize(True)
 
@@ -439,10 +380,6 @@ class PBSJobService (saga.adaptors.cpi.job.Service):
         self.shell   = None
         self.jobs    = dict()
 
-        # the monitoring thread - one per service instance
-        self.mt = _job_state_monitor(job_service=self)
-        self.mt.start()
-
         rm_scheme = rm_url.scheme
         pty_url   = deepcopy(rm_url)
 
@@ -478,6 +415,12 @@ class PBSJobService (saga.adaptors.cpi.job.Service):
       # self.shell.set_finalize_hook(self.finalize)
 
         self.initialize()
+
+        # job states are refreshed by the poller for the target host
+        self.poller = saga.adaptors.poller.register(self.rm, self._poll_jobs,
+                                                    POLL_INTERVAL_MIN,
+                                                    POLL_INTERVAL_MAX)
+
         return self.get_api()
 
 
@@ -623,6 +566,9 @@ class PBSJobService (saga.adaptors.cpi.job.Service):
             self.jobs[job_obj]['state'] = saga.job.PENDING
             job_obj._api()._attributes_i_set('state', self.jobs[job_obj]['state'], job_obj._api()._UP, True)
 
+            # make sure the poller picks up the new job quickly
+            if self.poller:
+                self.poller.poke()
 
             # return the job id
             return job_id
@@ -765,6 +711,50 @@ class PBSJobService (saga.adaptors.cpi.job.Service):
         # return the new job info dict
         return curr_info
 
+    # ----------------------------------------------------------------
+    #
+    def _poll_jobs(self):
+        """ bulk fetch callable for the job state poller: updates all jobs
+            which are not in a final state, and fires state callbacks.
+        """
+        active  = False
+        changed = False
+
+        for job in self.jobs.keys():
+            # if the job hasn't been started, we can't update its
+            # state. we can tell if a job has been started if it
+            # has a job id
+            if self.jobs[job]['job_id'] is None:
+                continue
+
+            # we only need to monitor jobs that are not in a
+            # terminal state, so we can skip the ones that are
+            # either done, failed or canceled
+            state = self.jobs[job]['state']
+            if state in [saga.job.DONE, saga.job.FAILED, saga.job.CANCELED]:
+                continue
+
+            active   = True
+            job_info = self._job_get_info(job)
+            self._logger.info("Job state poller updating Job %s (state: %s)" % (job, job_info['state']))
+
+            if job_info['state'] != state:
+                changed = True
+
+                # fire job state callback if 'state' has changed
+                if job._api() is not None:
+                    job._api()._attributes_i_set('state', job_info['state'], job._api()._UP, True)
+                else:
+                    self._logger.warning("api() object is 'None' for job object %s - can't fire callback." % str(job))
+
+            # update job info
+            self.jobs[job] = job_info
+
+        if not active:
+            return None
+
+        return changed
+
     # ----------------------------------------------------------------
     #
     def _job_get_state(self, job_obj):
@@ -837,6 +827,10 @@ class PBSJobService (saga.adaptors.cpi.job.Service):
         time_now   = time_start
         rm, pid    = self._adaptor.parse_id(job_obj._id)
 
+        # someone is waiting -- make sure the job state is fresh
+        if self.poller:
+            self.poller.poke()
+
         while True:
             #state = self._job_get_state(job_id=job_id, job_obj=job_obj)
             state = self.jobs[job_obj]['state']  # this gets updated in the bg.
@@ -846,15 +840,18 @@ class PBSJobService (saga.adaptors.cpi.job.Service):
                state == saga.job.CANCELED:
                     return True
 
-            # avoid busy poll
-            time.sleep(SYNC_WAIT_UPDATE_INTERVAL)
-
             # check if we hit timeout
             if timeout >= 0:
                 time_now = time.time()
                 if time_now - time_start > timeout:
                     return False
 
+                # wait for the next job state update
+                saga.adaptors.poller.wait(self.poller, timeout - (time_now - time_start),
+                                          POLL_INTERVAL_MIN)
+            else:
+                saga.adaptors.poller.wait(self.poller, None, POLL_INTERVAL_MIN)
+
     # ----------------------------------------------------------------
     #
     @SYNC_CALL
@@ -913,6 +910,10 @@ class PBSJobService (saga.adaptors.cpi.job.Service):
 
         # throw it into our job dictionary.
         self.jobs[job._adaptor] = job_info
+
+        if self.poller:
+            self.poller.poke()
+
         return job
 
     # ----------------------------------------------------------------
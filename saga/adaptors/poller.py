@@ -0,0 +1,433 @@
+
+__author__    = "Andre Merzky, Ole Weidner"
+__copyright__ = "Copyright 2012-2013, The SAGA Project"
+__license__   = "MIT"
+
+
+"""
+Provides a latency aware polling scheduler for job adaptors.
+
+Most job backends cannot push state notifications, so adaptors need to poll.
+Instead of running their own loops with hard-coded sleeps, adaptors register
+a *bulk fetch* callable with the poller for the backend host::
+
+    self.poller = saga.adaptors.poller.register (self.rm, self._poll_jobs)
+
+All callables registered for the same host are served by a single timer
+thread.  A bulk fetch callable is expected to update the state of *all* jobs
+it is responsible for, and to return
+
+  * ``True``  if any state change was observed,
+  * ``False`` if nothing changed, and
+  * ``None``  if there is nothing to watch at the moment.
+
+The poll interval of each callable adapts to what it observes: it is reset to
+the minimal interval on any state change, and grows exponentially (up to the
+maximal interval) while jobs remain pending.  The minimal interval is bound by
+the measured cost of the fetch, so that a slow (WAN) backend is not kept
+busy with polling.  Adaptors can announce expected completion times via
+:func:`PollClient.expect`, and the poller will poll right at that time.  Callables
+which returned ``None`` are not polled again until they are poked (for example
+on job submission).
+
+Threads which wait for job state changes should block in
+:func:`PollClient.wait`, which returns as soon as the next fetch completed.
+
+For ad-hoc polling loops which cannot be served by a bulk fetch, the
+:class:`Backoff` class provides the same interval adaptation in the calling
+thread.
+"""
+
+import time
+import threading
+
+import saga.url            as surl
+import saga.utils.misc     as sumisc
+import saga.utils.logger   as sul
+import saga.utils.threads  as sut
+
+# default interval bounds (seconds), and interval growth factor
+INTERVAL_MIN = 0.5
+INTERVAL_MAX = 30.0
+BACKOFF      = 1.5
+
+# polling should not keep a backend busy for more than this fraction of time
+DUTY_CYCLE   = 0.1
+
+# weight of a new cost measurement in the cost moving average
+COST_WEIGHT  = 0.3
+
+_pollers      = dict ()
+_pollers_lock = threading.RLock ()
+
+
+# ------------------------------------------------------------------------------
+#
+def register (url, fetch, interval_min=INTERVAL_MIN, interval_max=INTERVAL_MAX) :
+    """
+    Register a bulk fetch callable with the poller for the host of the given
+    URL, and return a :class:`PollClient` handle for it.
+    """
+
+    host = surl.Url (url).host
+    if  not host :
+        host = 'localhost'
+
+    with _pollers_lock :
+
+        if  host not in _pollers :
+            _pollers[host] = Poller (host)
+
+        return _pollers[host].register (fetch, interval_min, interval_max)
+
+
+# ------------------------------------------------------------------------------
+#
+def wait (client, timeout=None, interval=INTERVAL_MIN) :
+    """
+    Block until the next fetch of the given :class:`PollClient` completed, or
+    until timeout (seconds) expired.  Adaptors drop their client when they get
+    closed -- for a `None` client, this sleeps for one poll interval instead
+    (but not beyond the timeout), so that waiting threads keep polling.
+    """
+
+    if  client :
+        client.wait (timeout)
+
+    elif timeout is None or timeout < 0 :
+        time.sleep (interval)
+
+    else :
+        time.sleep (max (0, min (timeout, interval)))
+
+
+# ------------------------------------------------------------------------------
+#
+class PollClient (object) :
+    """
+    Handle for a bulk fetch callable registered with a :class:`Poller`.
+    """
+
+    # --------------------------------------------------------------------------
+    #
+    def __init__ (self, poller, fetch, interval_min, interval_max) :
+
+        self._poller      = poller
+        self.fetch        = fetch
+        self.interval_min = interval_min
+        self.interval_max = interval_max
+        self.interval     = interval_min
+        self.cost         = None        # moving average of fetch duration
+        self.next_poll    = time.time ()
+        self.idle         = False
+        self.deadlines    = list ()     # expected completion times
+        self.generation   = 0           # number of completed fetches
+
+
+    # --------------------------------------------------------------------------
+    #
+    def poke (self) :
+        """
+        Reset the poll interval, and trigger a fetch right away.
+        """
+
+        self._poller.poke (self)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def expect (self, deadline) :
+        """
+        Announce that some job is expected to change state at the given time
+        (seconds since epoch) -- the poller will poll at that time.
+        """
+
+        self._poller.expect (self, deadline)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def wait (self, timeout=None) :
+        """
+        Block until the next fetch completed, or until timeout (seconds)
+        expired.
+        """
+
+        self._poller.wait (self, timeout)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def unregister (self) :
+
+        self._poller.unregister (self)
+
+
+# ------------------------------------------------------------------------------
+#
+class Poller (object) :
+    """
+    The Poller runs the bulk fetch callables of all clients for one host, in
+    a single thread.  The thread is started when the first client registers,
+    and terminates when the last client unregisters.
+    """
+
+    # --------------------------------------------------------------------------
+    #
+    def __init__ (self, host) :
+
+        self.host     = host
+        self._clients = list ()
+        self._cond    = threading.Condition (threading.RLock ())
+        self._thread  = None
+        self._logger  = sul.getLogger ('Poller')
+
+
+    # --------------------------------------------------------------------------
+    #
+    def register (self, fetch, interval_min=INTERVAL_MIN, interval_max=INTERVAL_MAX) :
+
+        client = PollClient (self, fetch, interval_min, interval_max)
+
+        with self._cond :
+
+            self._clients.append (client)
+
+            if  not self._thread :
+                self._thread = sut.Thread (target=self._run,
+                                           name="Poller (%s)" % self.host)
+                self._thread.daemon = True
+                self._thread.start ()
+
+            self._cond.notify_all ()
+
+        return client
+
+
+    # --------------------------------------------------------------------------
+    #
+    def unregister (self, client) :
+
+        thread = None
+
+        with self._cond :
+
+            if  client in self._clients :
+                self._clients.remove (client)
+
+            if  not self._clients :
+                thread = self._thread
+
+            # release waiters
+            client.generation += 1
+            self._cond.notify_all ()
+
+        # let the thread finish if it has no work left -- but don't block
+        # forever on a running fetch
+        if  thread and thread is not threading.current_thread () :
+            thread.join (10)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def poke (self, client) :
+
+        with self._cond :
+            client.idle      = False
+            client.interval  = self._floor (client)
+            client.next_poll = time.time ()
+            self._cond.notify_all ()
+
+
+    # --------------------------------------------------------------------------
+    #
+    def expect (self, client, deadline) :
+
+        with self._cond :
+            client.deadlines.append (deadline)
+            client.deadlines.sort ()
+            self._cond.notify_all ()
+
+
+    # --------------------------------------------------------------------------
+    #
+    def wait (self, client, timeout=None) :
+
+        with self._cond :
+
+            generation = client.generation
+            start      = time.time ()
+
+            while client.generation == generation :
+
+                if  client not in self._clients :
+                    return
+
+                if  timeout is None or timeout < 0 :
+                    # wait in chunks, to keep the thread interruptible
+                    self._cond.wait (1.0)
+
+                else :
+                    remaining = start + timeout - time.time ()
+                    if  remaining <= 0 :
+                        return
+                    self._cond.wait (remaining)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _floor (self, client) :
+        # the minimal interval for a client: don't spend more than DUTY_CYCLE
+        # of the time on fetching
+
+        if  client.cost is None :
+            # nothing fetched yet: a fetch takes at least a round trip
+            return min (client.interval_max,
+                        max (client.interval_min,
+                             sumisc.get_host_latency (self.host) / DUTY_CYCLE))
+
+        return min (client.interval_max,
+                    max (client.interval_min, client.cost / DUTY_CYCLE))
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _next (self, now) :
+        # find the client which is due next, and return it with its poll time
+
+        due    = None
+        due_at = None
+
+        for client in self._clients :
+
+            if  client.idle :
+                continue
+
+            poll_at = client.next_poll
+
+            if  client.deadlines and client.deadlines[0] < poll_at :
+                poll_at = max (client.deadlines[0], now)
+
+            if  due_at is None or poll_at < due_at :
+                due    = client
+                due_at = poll_at
+
+        return due, due_at
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _run (self) :
+
+        while True :
+
+            with self._cond :
+
+                if  not self._clients :
+                    self._thread = None
+                    return
+
+                now            = time.time ()
+                client, due_at = self._next (now)
+
+                if  client is None :
+                    self._cond.wait (INTERVAL_MAX)
+                    continue
+
+                if  due_at > now :
+                    self._cond.wait (due_at - now)
+                    continue
+
+            # run the fetch outside of the lock, so that clients can poke and
+            # wait while it is in progress
+            start = time.time ()
+
+            try :
+                changed = client.fetch ()
+
+            except Exception as e :
+                self._logger.warning ("poll on %s failed: %s" % (self.host, e))
+                changed = False
+
+            now  = time.time ()
+            cost = now - start
+
+            with self._cond :
+
+                if  client.cost is None :
+                    client.cost = cost
+                else :
+                    client.cost = (1 - COST_WEIGHT) * client.cost \
+                                +      COST_WEIGHT  * cost
+
+                floor = self._floor (client)
+
+                if  changed is None :
+                    # nothing to watch -- sleep until poked
+                    client.idle     = True
+                    client.interval = floor
+
+                elif changed :
+                    client.interval = floor
+
+                else :
+                    client.interval = max (floor, min (client.interval * BACKOFF,
+                                                       client.interval_max))
+
+                client.next_poll = now + client.interval
+
+                # deadlines which passed have been served by this poll
+                while client.deadlines and client.deadlines[0] <= now :
+                    client.deadlines.pop (0)
+
+                client.generation += 1
+                self._cond.notify_all ()
+
+
+# ------------------------------------------------------------------------------
+#
+class Backoff (object) :
+    """
+    Poll interval generator for polling loops which run in the calling thread::
+
+        backoff = Backoff ()
+        while not final (get_state ()) :
+            backoff.sleep ()
+
+    The time between two sleep() calls is taken as the cost of the poll, and
+    bounds the minimal interval just like for :class:`Poller` clients.
+    """
+
+    # --------------------------------------------------------------------------
+    #
+    def __init__ (self, interval_min=INTERVAL_MIN, interval_max=INTERVAL_MAX) :
+
+        self.interval_min = interval_min
+        self.interval_max = interval_max
+        self.interval     = interval_min
+        self._last        = time.time ()
+
+
+    # --------------------------------------------------------------------------
+    #
+    def sleep (self, deadline=None) :
+        """
+        Sleep for the current interval, but not beyond the given deadline
+        (seconds since epoch).
+        """
+
+        now   = time.time ()
+        floor = max (self.interval_min, (now - self._last) / DUTY_CYCLE)
+        delay = min (self.interval_max, max (floor, self.interval))
+
+        if  deadline is not None :
+            delay = max (0.0, min (delay, deadline - now))
+
+        time.sleep (delay)
+
+        self.interval = min (self.interval_max, max (floor, self.interval) * BACKOFF)
+        self._last    = time.time ()
+
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
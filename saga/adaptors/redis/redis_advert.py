@@ -3,12 +3,15 @@
 
 import traceback
 
+from   urlparse import parse_qs
+
 import saga.url
 import saga.adaptors.base
 import saga.adaptors.cpi.advert
 import saga.exceptions as se
 import saga.utils.misc as sumisc
 
+import redis_cache     as rc
 import redis_namespace as rns
 
 SYNC_CALL  = saga.adaptors.cpi.decorators.SYNC_CALL
@@ -21,7 +24,45 @@ ASYNC_CALL = saga.adaptors.cpi.decorators.ASYNC_CALL
 
 _ADAPTOR_NAME          = 'saga.adaptors.advert.redis'
 _ADAPTOR_SCHEMAS       = ['redis']
-_ADAPTOR_OPTIONS       = []
+_ADAPTOR_OPTIONS       = [
+    { 
+    'category'         : 'saga.adaptors.advert.redis',
+    'name'             : 'cache_size', 
+    'type'             : int, 
+    'default'          : rc.CACHE_DEFAULT_SIZE,
+    'documentation'    : '''Maximal number of entries in the client side cache of
+                          a redis namespace (least recently used entries are
+                          evicted).  Can be overwritten per namespace by
+                          a 'cache_size' query in the URL.''',
+    'env_variable'     : None
+    },
+    { 
+    'category'         : 'saga.adaptors.advert.redis',
+    'name'             : 'cache_ttl', 
+    'type'             : float, 
+    'default'          : -1.0,
+    'documentation'    : '''Time (in seconds) for which entries in the client side
+                          cache of a redis namespace are valid.  Set to 0 to
+                          disable the cache.  If negative, entries are valid
+                          until they change on the server (with
+                          cache_invalidation), or for %s seconds (without).
+                          Can be overwritten per namespace by a 'cache_ttl'
+                          query in the URL.''' % rc.CACHE_DEFAULT_TTL,
+    'env_variable'     : None
+    },
+    { 
+    'category'         : 'saga.adaptors.advert.redis',
+    'name'             : 'cache_invalidation', 
+    'type'             : bool, 
+    'default'          : True,
+    'valid_options'    : [True, False],
+    'documentation'    : '''Listen to change announcements of other clients, and drop
+                          changed entries from the client side cache right away.
+                          Changes are always announced, so this only needs to
+                          be disabled if that channel is too busy.''',
+    'env_variable'     : None
+    }
+]
 _ADAPTOR_CAPABILITIES  = {}
 
 _ADAPTOR_DOC           = {
@@ -66,6 +107,11 @@ class Adaptor (saga.adaptors.base.Base):
 
         saga.adaptors.base.Base.__init__ (self, _ADAPTOR_INFO, _ADAPTOR_OPTIONS)
 
+        self.opts       = self.get_config ()
+        self.cache_size = int   (self.opts['cache_size'].get_value ())
+        self.cache_ttl  = float (self.opts['cache_ttl' ].get_value ())
+        self.cache_inv  = bool  (self.opts['cache_invalidation'].get_value ())
+
         # the adaptor *singleton* creates a (single) instance of a bulk handler
         # (BulkDirectory), which implements container_* bulk methods.
         self._bulk  = BulkDirectory ()
@@ -97,10 +143,28 @@ class Adaptor (saga.adaptors.base.Base):
             else :
                 hash = "redis://%s:%d"        %  (                host, port)
        
-        if not hash in self._redis :
-            self._redis[hash] = rns.redis_ns_server (url)
+        # the cache of a namespace can be tuned by URL query, like
+        # 'redis://host/?cache_size=1000&cache_ttl=5.0'
+        cache_size = self.cache_size
+        cache_ttl  = self.cache_ttl
+
+        if url.query :
+            query = parse_qs (url.query)
+            try :
+                if 'cache_size' in query : cache_size = int   (query['cache_size'][0])
+                if 'cache_ttl'  in query : cache_ttl  = float (query['cache_ttl' ][0])
+            except ValueError as e :
+                raise se.BadParameter ("invalid cache settings in %s: %s" % (url, e))
 
-        return self._redis[hash]
+        # handles with different cache settings are distinct -- they still
+        # share the connection pool of the server
+        key = (hash, cache_size, cache_ttl)
+
+        if not key in self._redis :
+            self._redis[key] = rns.redis_ns_server (url, cache_size, cache_ttl,
+                                                    self.cache_inv)
+
+        return self._redis[key]
 
 
     # ----------------------------------------------------------------
@@ -261,6 +325,25 @@ class RedisDirectory (saga.adaptors.cpi.advert.Directory) :
         self._nsdir.manage_callback (key, id, cb, self.get_api ())
 
 
+    # ----------------------------------------------------------------
+    #
+    @SYNC_CALL
+    def set_attributes (self, attributes) :
+
+        self._nsdir.set_keys (attributes)
+
+        for key in attributes :
+            self._api ()._attributes_i_set (key, attributes[key], self._api ()._UP)
+
+
+    # ----------------------------------------------------------------
+    #
+    @SYNC_CALL
+    def get_attributes (self, keys) :
+
+        return self._nsdir.get_keys (keys)
+
+
     # ----------------------------------------------------------------
     #
     @SYNC_CALL
@@ -327,6 +410,34 @@ class RedisDirectory (saga.adaptors.cpi.advert.Directory) :
         return ret
 
 
+    # ----------------------------------------------------------------
+    #
+    @SYNC_CALL
+    def find (self, npat, flags) :
+
+        return self.find_adverts (npat, None, None, flags)
+
+
+    # ----------------------------------------------------------------
+    #
+    @SYNC_CALL
+    def find_adverts (self, name_pattern, attr_pattern, obj_type, flags) :
+
+        if  obj_type :
+            raise se.NotImplemented ("find() does not support object types")
+
+        recursive = bool (flags & saga.advert.RECURSIVE)
+        paths     = self._nsdir.find (name_pattern, attr_pattern, recursive)
+
+        ret = []
+        for path in paths :
+            url      = saga.url.Url (self._url)
+            url.path = path
+            ret.append (url)
+
+        return ret
+
+
     # ----------------------------------------------------------------
     #
     @SYNC_CALL
@@ -495,6 +606,25 @@ class RedisEntry (saga.adaptors.cpi.advert.Entry) :
         return self._nsentry.manage_callback (key, id, cb, self.get_api ())
 
 
+    # ----------------------------------------------------------------
+    #
+    @SYNC_CALL
+    def set_attributes (self, attributes) :
+
+        self._nsentry.set_keys (attributes)
+
+        for key in attributes :
+            self._api ()._attributes_i_set (key, attributes[key], self._api ()._UP)
+
+
+    # ----------------------------------------------------------------
+    #
+    @SYNC_CALL
+    def get_attributes (self, keys) :
+
+        return self._nsentry.get_keys (keys)
+
+
     # ----------------------------------------------------------------
     #
     @SYNC_CALL
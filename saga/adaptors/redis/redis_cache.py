@@ -13,6 +13,17 @@ TTL = 'ttl'
 ######################################################################
 #
 class Cache :
+    """
+    A size bounded LRU cache whose entries expire after `ttl` seconds (a ttl
+    of 0 disables the cache, a ttl of None lets entries live until they are
+    evicted or discarded).
+
+    Entries are kept in two ordered dicts: `dict` is in LRU order (hits move
+    the entry to the end, and the least recently used entry gets evicted if
+    the cache is full), `expiry` is in order of expiration.  As all entries
+    have the same ttl, that is the order of insertion -- so expired entries
+    are swept from its front on every cache operation, in amortized O(1).
+    """
 
     # ----------------------------------------------------------------
     #
@@ -21,30 +32,66 @@ class Cache :
         if int (size) < 1 :
             raise AttributeError ('size < 1 or not a number')
 
-        if int (ttl) < 0 :
-            raise AttributeError ('ttl < 0 or not a number')
-
-        self.size   = size
-        self.ttl    = ttl
-        self.dict   = rod.OrderedDict ()
-        self.lock   = sut.RLock ()
-        self.logger = logger
-        self.hit    = 0
-        self.miss   = 0
-
-        # start a thread which, with low priority, cleans out the dict now and
-        # then (pops items until a live one is found
+        if ttl is not None :
+            if float (ttl) < 0 :
+                raise AttributeError ('ttl < 0 or not a number')
+            ttl = float (ttl)
+
+        self.size      = int   (size)
+        self.ttl       = ttl
+        self.dict      = rod.OrderedDict ()
+        self.expiry    = rod.OrderedDict ()
+        self.lock      = sut.RLock ()
+        self.logger    = logger
+        self.hit       = 0
+        self.miss      = 0
+        self.evicted   = 0
+        self.expired   = 0
 
     # ----------------------------------------------------------------
     #
     def _dump (self) :
         print " ---------------------------------------------- "
         print " CACHE STATISTICS : "
-        print " size: %5d" % len(self.dict)
-        print " hit : %5d" % self.hit 
-        print " miss: %5d" % self.miss
+        print " size   : %5d" % len(self.dict)
+        print " hit    : %5d" % self.hit
+        print " miss   : %5d" % self.miss
+        print " evicted: %5d" % self.evicted
+        print " expired: %5d" % self.expired
         print self.dict.keys()
         print " ---------------------------------------------- "
+
+    # ----------------------------------------------------------------
+    #
+    def stats (self) :
+        """
+        Return the cache counters, as dict.
+        """
+
+        with self.lock :
+            return {'size'    : len (self.dict),
+                    'hit'     : self.hit,
+                    'miss'    : self.miss,
+                    'evicted' : self.evicted,
+                    'expired' : self.expired}
+
+    # ----------------------------------------------------------------
+    #
+    def _sweep (self, now) :
+
+        # pop expired entries off the front of the expiry queue -- every
+        # entry is swept at most once, so this is O(1) amortized
+        while self.expiry :
+
+            key = iter (self.expiry).next ()
+
+            if  self.expiry[key] > now :
+                break
+
+            del self.expiry[key]
+            del self.dict[key]
+            self.expired += 1
+
     # ----------------------------------------------------------------
     #
     def get (self, key) :
@@ -53,21 +100,17 @@ class Cache :
 
         with self.lock:
 
-            # check if we have a live entry
-            if key in self.dict :
+            self._sweep (time.time ())
 
-                now = time.time ()
+            # anything left in the dict is live
+            if key in self.dict :
 
-                if self.ttl and self.dict[key][TTL] > now :
-                    # if yes, cache hit!
-                    # return data -- doh!
-                    self.hit += 1
-                    return self.dict[key][VAL]
+                # cache hit -- promote to most recently used
+                entry = self.dict.pop (key)
+                self.dict[key] = entry
+                self.hit += 1
 
-                else :
-                    # entry timed out
-                    self.miss += 1
-                    del self.dict[key]
+                return entry[VAL]
 
             # cache entry not found, or timed out
             self.miss += 1
@@ -78,15 +121,31 @@ class Cache :
     #
     def set (self, key, value) :
 
+        if self.ttl == 0 :
+            return
+
         with self.lock :
 
-            # remove superfluous(?) entries
+            now = time.time ()
+
+            self._sweep (now)
+
+            # re-insert existing keys, to renew their position in both orders
+            if key in self.dict :
+                del self.dict[key]
+                self.expiry.pop (key, None)
+
+            # evict least recently used entries
             while len (self.dict) >= self.size :
-                self.dict.popitem (last=False)
+                old, _ = self.dict.popitem (last=False)
+                self.expiry.pop (old, None)
+                self.evicted += 1
 
-            self.dict[key]      = {}
-            self.dict[key][VAL] = value
-            self.dict[key][TTL] = time.time () + self.ttl
+            if self.ttl is None :
+                self.dict[key]   = {VAL : value, TTL : None}
+            else :
+                self.dict[key]   = {VAL : value, TTL : now + self.ttl}
+                self.expiry[key] = now + self.ttl
 
 
     # ----------------------------------------------------------------
@@ -95,6 +154,16 @@ class Cache :
 
         with self.lock :
             del self.dict[key]
+            self.expiry.pop (key, None)
+
+
+    # ----------------------------------------------------------------
+    #
+    def discard (self, key) :
+
+        with self.lock :
+            if key in self.dict :
+                self.delete (key)
 
 
     # ----------------------------------------------------------------
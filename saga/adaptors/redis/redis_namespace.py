@@ -44,11 +44,16 @@ TODO:
 
 import re
 import os
+import json
 import time
+import uuid
 import string
+import fnmatch
+import threading
 import redis
 
 import redis_cache
+import redis_ordered_dict    as rod
 
 from   saga.exceptions       import *
 from   saga.advert.constants import *
@@ -72,6 +77,10 @@ KEYS   = 'keys'
 VALS   = 'vals'
 
 MON    = 'saga-advert-events'
+INV    = 'saga-advert-changes'
+
+# number of threads which invoke callbacks
+DISPATCH_THREADS = 2
 
 # --------------------------------------------------------------------
 #
@@ -85,10 +94,57 @@ def redis_ns_name (path) :
     if path == '/' or path == '//' : return '/'
     return os.path.split (path)[1]
 
+def redis_ns_channel (path) :
+    # the pubsub channel for events on path
+    return MON+':'+path
+
+# process wide connection pools, per redis server
+_pools      = {}
+_pools_lock = threading.Lock ()
+
+def redis_ns_pool (host, port, db, password) :
+    # the connection pool for the given server
+    with _pools_lock :
+        key = (host, port, db, password)
+        if not key in _pools :
+            _pools[key] = redis.ConnectionPool (host=host, port=port, db=db,
+                                                password=password)
+        return _pools[key]
+
+def redis_ns_escape (path) :
+    # escape glob characters for redis MATCH patterns
+    return re.sub (r'([*?\[\]\\])', r'\\\1', path)
+
+def redis_ns_attr_pattern (pattern) :
+    # parse an attribute pattern like 'key_1=val_1, key_2=val*, key_3' into
+    # a list of (key, val) tuples, where val is None if only the key matters
+    attrs = []
+
+    for elem in re.split (r'[,\s]+', pattern or '') :
+
+        if not elem :
+            continue
+
+        key, sep, val = elem.partition ('=')
+
+        if not key :
+            raise BadParameter ("invalid attribute pattern '%s'" % pattern)
+
+        if not sep or val == '*' :
+            val = None
+
+        attrs.append ((key, val))
+
+    return attrs
+
 
 # --------------------------------------------------------------------
 #
 class redis_ns_monitor (sut.SagaThread) :
+    """
+    Listens to the event channels the server subscribed to, and hands
+    attribute events on to the dispatcher.
+    """
 
     # ----------------------------------------------------------------
     #
@@ -111,69 +167,143 @@ class redis_ns_monitor (sut.SagaThread) :
 
         try :
         
-            callbacks = self.r.callbacks
-            sub       = self.pub.listen ()
+            for info in self.pub.listen () :
 
-            while sub :
+                # skip (un)subscribe confirmations
+                if  info['type'] != 'message' :
+                    continue
 
-                info = sub.next ()
-                data = info['data']
+                data  = info['data']
 
-                if not type (data) == type ("") :
-                    self.logger.warn ("ignoring event : %s"  %  data)
+                if  info['channel'] == INV :
+                    self.r.invalidate (data)
                     continue
 
-                # FIXME: need proper regex parsing
-                elems = data.split ()
+                elems = data.split (' ', 2)
+
                 if not len (elems) == 3 :
                     self.logger.warn ("ignoring event args : %s"  %  data)
                     continue
 
-
                 self.logger.debug ("sub %s"  %  data)
-                event = elems[0]
-                path  = elems[1]
-                args  = elems[2:]
+                event, path, args = elems
 
-                if path in callbacks :
-                    
-                    if event == 'ATTRIBUTE' :
+                if event == 'ATTRIBUTE' :
 
-                        for arg in args :
-                            
-                            # args are formatted like '[key=val]'
-                            match = self.pat[event].match (string.join (args, ' '))
+                    # args are formatted like '[key=val]'
+                    match = self.pat[event].match (args)
 
-                            if  not match :
-                                self.logger.warn ("event parse error for %s" % args)
-                                continue
+                    if  not match :
+                        self.logger.warn ("event parse error for %s" % args)
+                        continue
 
-                            # FIXME: error check
-                            key     = match.group ('key')
-                            val     = match.group ('val')
+                    self.r.dispatcher.push (path, match.group ('key'), match.group ('val'))
 
-                            if key in callbacks[path] :
-                                for idx in callbacks[path][key] :
+                elif event == 'ATTRIBUTES' :
 
-                                    cb  = callbacks[path][key][idx][0]
-                                    obj = callbacks[path][key][idx][1]
+                    # args are a json dict of key/val pairs
+                    try :
+                        for key, val in json.loads (args).iteritems () :
+                            self.r.dispatcher.push (path, key, val)
 
-                                    obj.set_attribute (key, val, obj._UP)
-
-                    if event == 'ATTRIBUTES' :
-                        self.logger.warn ("unknown event type %s" % event)
-                        pass
+                    except ValueError :
+                        self.logger.warn ("event parse error for %s" % args)
+                        continue
 
         except Exception as e :
-            self.logger.critical ("redis monitoring thread crashed - disable callback handling (%s)") % str(e)
+            self.logger.critical ("redis monitoring thread crashed - disable callback handling (%s)" % str(e))
             return
 
 
+# --------------------------------------------------------------------
+#
+class redis_ns_dispatcher (object) :
+    """
+    Invokes the callbacks for attribute events, on a pool of threads.  Events
+    are queued per (path, key), and a burst of updates to the same attribute
+    is coalesced into a single invocation with the latest value.  Callbacks
+    for the same attribute never run concurrently.
+    """
+
+    # ----------------------------------------------------------------
+    #
+    def __init__ (self, r, threads=DISPATCH_THREADS) :
+
+        self.r         = r
+        self.logger    = r.logger
+        self.pending   = rod.OrderedDict ()
+        self.busy      = set ()
+        self.cond      = threading.Condition ()
+        self.coalesced = 0
+        self.workers   = []
+
+        for _ in range (threads) :
+            worker = sut.SagaThread (self.work)
+            worker.setDaemon (True)
+            worker.start ()
+            self.workers.append (worker)
+
+
+    # ----------------------------------------------------------------
+    #
+    def push (self, path, key, val) :
+
+        with self.cond :
+
+            # an update which is still pending is replaced, but keeps its
+            # place in the queue
+            if  (path, key) in self.pending :
+                self.coalesced += 1
+
+            self.pending[(path, key)] = val
+            self.cond.notify ()
+
+
+    # ----------------------------------------------------------------
+    #
+    def work (self) :
+
+        while True :
+
+            with self.cond :
+
+                item = None
+                while not item :
+                    for item in self.pending :
+                        if  item not in self.busy :
+                            break
+                    else :
+                        item = None
+                        self.cond.wait ()
+
+                val = self.pending.pop (item)
+                self.busy.add (item)
+
+            path, key = item
+
+            try :
+                with self.r.cb_lock :
+                    targets = self.r.callbacks.get (path, {}).get (key, {}).values ()
+
+                for cb, obj in targets :
+                    obj.set_attribute (key, val, obj._UP)
+
+            except Exception as e :
+                self.logger.error ("callback for %s:%s failed: %s" % (path, key, e))
+
+            finally :
+                with self.cond :
+                    self.busy.discard (item)
+                    self.cond.notify_all ()
+
+
 # --------------------------------------------------------------------
 #
 class redis_ns_server (redis.Redis) :
 
-    def __init__ (self, url) :
+    def __init__ (self, url, cache_size=redis_cache.CACHE_DEFAULT_SIZE,
+                             cache_ttl=redis_cache.CACHE_DEFAULT_TTL,
+                             invalidation=True) :
 
         if url.scheme != 'redis' :
             raise BadParameter ("scheme in url is not supported (%s != redis://...)" %  url)
@@ -183,54 +313,102 @@ class redis_ns_server (redis.Redis) :
         self.port       = 6379
         self.db         = 0
         self.password   = None
-        self.errors     = 'strict'
+        self.origin     = uuid.uuid4 ().hex
 
         if url.host     : self.host     = url.host
         if url.port     : self.port     = url.port
         if url.username : self.username = url.username
         if url.password : self.password = url.password
 
-        # create redis client 
-        t1 = time.time ()
-        redis.Redis.__init__   (self, 
-                                host      = self.host,
-                                port      = self.port,
-                                db        = self.db,
-                                password  = self.password,
-                                 errors    = self.errors)
-        t2 = time.time ()
+        # create redis client, on the connection pool shared by all clients
+        # for that server
+        redis.Redis.__init__ (self, connection_pool=redis_ns_pool (self.host,
+                                                                   self.port,
+                                                                   self.db,
+                                                                   self.password))
 
         # add a logger 
         self.logger = getLogger ("redis-%s"  % self.host)
 
-        # create a cache dict and attach to redis client instance.  Cache
-        # lifetime is set to 10 times the redis-connect latency.
-        self.cache = redis_cache.Cache (logger=self.logger, ttl=((t2-t1)*10))
-
-        # create a second client to manage the (blocking) 
-        # pubsub communication for event notifications
-        self.r2 = redis.Redis  (host      = self.host,
-                                port      = self.port,
-                                db        = self.db,
-                                password  = self.password,
-                                errors    = self.errors)
-
-        # set up pubsub endpoint, and start a thread to monitor channels
+        # create a cache dict and attach to redis client instance.  If all
+        # writers announce their changes on the INV channel, we drop changed
+        # entries from the cache as soon as we hear about it -- so the entries
+        # can live until then (a negative ttl).  Otherwise, they are
+        # considered fresh for the ttl only.
+        self.invalidation = invalidation
+
+        if  cache_ttl < 0 :
+            if  invalidation : cache_ttl = None
+            else             : cache_ttl = redis_cache.CACHE_DEFAULT_TTL
+
+        self.cache = redis_cache.Cache (logger=self.logger, size=cache_size,
+                                        ttl=cache_ttl)
+
+        # count the invalidations: an entry fetched while its path got
+        # invalidated may be stale already, and must not be cached.  A single
+        # counter for all paths keeps this bounded -- an invalidation of
+        # another path just skips caching an entry now and then.
+        self.epoch = 0
+
+        # set up pubsub endpoint, and start a thread to monitor channels.
+        # Events are published on one channel per path, and we only
+        # subscribe to the channels of paths which have callbacks registered.
+        # The MON channel itself is idle -- it only keeps the subscription
+        # (and thus the monitor) alive while no path is watched.
         self.callbacks = {}
-        self.pub = self.r2.pubsub ()
+        self.cb_lock   = threading.RLock ()
+        self.pub = self.pubsub ()
         self.pub.subscribe (MON)
-        # FIXME: create one pubsub channel per path (for paths which have
-        #        callbacks registered)
 
-        self.monitor = redis_ns_monitor (self, self.pub)
+        if  invalidation :
+            self.pub.subscribe (INV)
+
+        self.dispatcher = redis_ns_dispatcher (self)
+        self.monitor    = redis_ns_monitor    (self, self.pub)
         self.monitor.start ()
 
 
+    def changed (self, p, paths) :
+
+        # announce the change of the given paths, in pipeline p.  All clients
+        # announce their changes, even if they do not listen themselves.
+        p.publish (INV, "%s %s" % (self.origin, ' '.join (paths)))
+
+
+    def invalidate (self, data) :
+
+        # drop the cache entries for paths changed by other clients
+        elems = data.split ()
+
+        if  not elems or elems[0] == self.origin :
+            return
+
+        # only the monitor thread counts, so no need to lock
+        self.epoch += 1
+
+        for path in elems[1:] :
+            self.logger.debug ("invalidate %s" % path)
+            for kind in [NODE, DATA, KIDS] :
+                self.cache.discard (kind+':'+path)
+
+
+    def subscribe_path (self, path) :
+
+        self.logger.debug ("subscribe %s" % path)
+        self.pub.subscribe (redis_ns_channel (path))
+
+
+    def unsubscribe_path (self, path) :
+
+        self.logger.debug ("unsubscribe %s" % path)
+        self.pub.unsubscribe (redis_ns_channel (path))
+
+
 
     def __del__ (self) :
 
         if self.pub :
-            self.pub.unsubscribe (MON)
+            self.pub.unsubscribe ()
 
 
 # --------------------------------------------------------------------
@@ -419,6 +597,9 @@ class redis_ns_entry :
         # FIXME: avoid duplicated entries!
         if path != '/' :
             p.sadd (KIDS+':'+parent, path)
+            self.r.changed (p, [path, parent])
+        else :
+            self.r.changed (p, [path])
     
         # add new index entries
         for key in self.data :
@@ -432,7 +613,7 @@ class redis_ns_entry :
     
         # issue notification about entry creation to parent dir
         self.logger.debug ("pub CREATE %s [%s]"  %  (parent, name))
-        self.r.publish   (MON, "CREATE %s [%s]"  %  (parent, name))
+        self.r.publish   (redis_ns_channel (parent), "CREATE %s [%s]"  %  (parent, name))
     
         # refresh cache state
         self.cache.set (NODE+':'+path, self.node)
@@ -497,6 +678,8 @@ class redis_ns_entry :
 
 
         try :
+            epoch = self.r.epoch
+
             p = self.r.pipeline ()
             p.hgetall  (NODE+':'+path)
             p.hgetall  (DATA+':'+path)
@@ -518,11 +701,18 @@ class redis_ns_entry :
                 self.valid = False
                 raise IncorrectState ("backend entry seems to be gone or corrupted")
 
-            # cache our newly found entries
+            # cache our newly found entries -- unless the path got
+            # invalidated meanwhile: the entries may be stale then, and the
+            # invalidation would be lost.  The check follows the set, as
+            # the monitor counts before it discards.
             self.cache.set (NODE+':'+path, self.node)
             self.cache.set (DATA+':'+path, self.data)
             self.cache.set (KIDS+':'+path, self.kids)
 
+            if  self.r.epoch != epoch :
+                for kind in [NODE, DATA, KIDS] :
+                    self.cache.discard (kind+':'+path)
+
             # fetched from redis ok
             self.valid = True
 
@@ -532,6 +722,93 @@ class redis_ns_entry :
 
 
 
+    # ----------------------------------------------------------------
+    #
+    def find (self, name_pattern, attr_pattern, recursive) :
+        """
+        Return the paths of all entries below this directory whose names match
+        the name_pattern glob, and whose attributes match the attr_pattern
+        (see redis_ns_attr_pattern).
+
+        Candidates are selected on the server: exact key=val patterns intersect
+        the KEYS and VALS index sets (and the KIDS set, if not recursive), and
+        without those, a SCAN MATCH over the node keys narrows by name.  Only
+        the candidates are then checked, with a single pipeline.
+        """
+
+        path = self.path
+        self.logger.debug ("redis_ns_entry.find %s [%s] [%s]" \
+                        % (path, name_pattern, attr_pattern))
+
+        if  not self.node[TYPE] == DIR :
+            raise IncorrectState ("'find()' is only supported on directories")
+
+        attrs  = redis_ns_attr_pattern (attr_pattern)
+        prefix = path.rstrip ('/') + '/'
+
+        if  name_pattern in [None, '', '*'] :
+            name_pattern = None
+
+        # build the set of index sets to intersect
+        sets = []
+
+        if  not recursive :
+            sets.append (KIDS+':'+path)
+
+        for key, val in attrs :
+            sets.append (KEYS+':'+str(key))
+            if  val is not None and not re.search (r'[*?\[]', val) :
+                sets.append (VALS+':'+str(val))
+
+        if  sets :
+            candidates = self.r.sinter (sets)
+
+        else :
+            # no index to use -- scan the node keys below this dir.  A name
+            # glob gets pushed into the MATCH pattern (which also matches
+            # across '/', so the name gets checked again below).
+            match = NODE+':'+redis_ns_escape (prefix) + '*'
+            if  name_pattern :
+                match += name_pattern
+
+            candidates = [key[len(NODE)+1:] for key in self.r.scan_iter (match=match, count=1000)]
+
+        # filter candidates by location and name
+        paths = []
+        for cand in candidates :
+
+            if  not cand.startswith (prefix) or cand == prefix :
+                continue
+
+            if  name_pattern and not fnmatch.fnmatchcase (redis_ns_name (cand.rstrip ('/')), name_pattern) :
+                continue
+
+            paths.append (cand)
+
+        # the index sets can be stale, and 'VALS:val' does not tell what key
+        # holds the val -- so check the data of the remaining candidates
+        if  attrs and paths :
+
+            p = self.r.pipeline (transaction=False)
+            for cand in paths :
+                p.hgetall (DATA+':'+cand)
+
+            found = []
+            for cand, data in zip (paths, p.execute ()) :
+
+                for key, val in attrs :
+                    if  key not in data :
+                        break
+                    if  val is not None and not fnmatch.fnmatchcase (str(data[key]), val) :
+                        break
+                else :
+                    found.append (cand)
+
+            paths = found
+
+        return sorted (paths)
+
+
     # ----------------------------------------------------------------
     #
     def get_data (self) :
@@ -592,7 +869,7 @@ class redis_ns_entry :
 
             # nothing changed - so just trigger the set event
             self.logger.debug ("Pub ATTRIBUTE %s [%s=%s]"  %  (path, key, val))
-            self.r.publish   (MON, "ATTRIBUTE %s [%s=%s]"  %  (path, key, val))
+            self.r.publish   (redis_ns_channel (path), "ATTRIBUTE %s [%s=%s]"  %  (path, key, val))
 
             # nothing else to do
             return
@@ -614,13 +891,15 @@ class redis_ns_entry :
     
         # always add new value index entry
         p.sadd (VALS+':'+str(val), path)
+
+        self.r.changed (p, [path])
     
         # FIXME: eval return types / values
         vals = p.execute ()
     
         # issue notification about key creation/update
         self.logger.debug ("PUB ATTRIBUTE %s [%s=%s]"  %  (path, key, val))
-        self.r.publish   (MON, "ATTRIBUTE %s [%s=%s]"  %  (path, key, val))
+        self.r.publish   (redis_ns_channel (path), "ATTRIBUTE %s [%s=%s]"  %  (path, key, val))
     
         # update cache
         self.data[key] = val
@@ -629,27 +908,99 @@ class redis_ns_entry :
 
     # ----------------------------------------------------------------
     #
-    def manage_callback (self, key, id, cb, obj) :
-        # FIXME: this needs a shared lock with the monitor thread!
+    def set_keys (self, data) :
+        """
+        Set several keys at once: the data and the indexes are updated in a
+        single MULTI/EXEC pipeline, and a single ATTRIBUTES event is published.
+        """
+    
+        path = self.path
+        self.logger.debug ("set_keys %s: %s" % (path, data.keys ()))
     
-        self.logger.debug ("redis_ns_entry.manage__callback %s : %s" % (self.path, key))
+        self.fetch () # refresh cache/state as needed
+
+        changed = dict ()
+        for key in data :
+            if not key in self.data or self.data[key] != data[key] :
+                changed[key] = data[key]
+
+        if changed :
+
+            p = self.r.pipeline ()
+            p.hmset  (NODE+':'+path, {'mtime': time.time()})
+            p.hmset  (DATA+':'+path, changed)
+    
+            for key in changed :
+
+                if key in self.data :
+                    # we keep the key index entry around
+                    p.srem (VALS+':'+str(self.data[key]), path)
+                else :
+                    p.sadd (KEYS+':'+str(key), path)
+
+                p.sadd (VALS+':'+str(changed[key]), path)
+
+            self.r.changed (p, [path])
+            p.execute ()
+
+        # issue one notification for all keys (also for unchanged ones, like
+        # set_key does)
+        if data :
+            event = json.dumps (data)
+            self.logger.debug ("PUB ATTRIBUTES %s %s"  %  (path, event))
+            self.r.publish   (redis_ns_channel (path), "ATTRIBUTES %s %s"  %  (path, event))
     
-        if not self.path in self.callbacks :
-            self.callbacks[self.path] = {}
-            if not key in self.callbacks[self.path] :
-                self.callbacks[self.path][key] = {}
+        # update cache
+        self.data.update (changed)
+        self.cache.set (DATA+':'+path, self.data)
+
+
+    # ----------------------------------------------------------------
+    #
+    def get_keys (self, keys) :
     
-        if id == None :
-            del self.callbacks[self.path][key]
+        self.logger.debug ("redis_ns_entry.get_keys %s" % (keys))
     
-        if cb :
-            self.callbacks[self.path][key][id] = [cb, obj]
-        else :
-            # cb == None: remove that callback
-            # FIXME: if we have no callbacks for key, remove [key]
-            # FIXME: if we have no keys for path, remove [path]
-            # FIXME: if we remove a [path], unsubscribe for its notifications
-            del self.callbacks[self.path][key][id]
+        self.fetch () # refresh cache/state as needed
+
+        for key in keys :
+            if not key in self.data :
+                raise BadParameter ("no such attribute (%s)" %  key)
+
+        return dict ([(key, self.data[key]) for key in keys])
+
+
+    # ----------------------------------------------------------------
+    #
+    def manage_callback (self, key, id, cb, obj) :
+    
+        path = self.path
+        self.logger.debug ("redis_ns_entry.manage__callback %s : %s" % (path, key))
+    
+        with self.r.cb_lock :
+
+            if cb :
+                if not path in self.callbacks :
+                    # first callback for path: subscribe to its events
+                    self.callbacks[path] = {}
+                    self.r.subscribe_path (path)
+
+                self.callbacks[path].setdefault (key, {})[id] = [cb, obj]
+
+            elif path in self.callbacks :
+                # cb == None: remove that callback (id == None: all for key)
+                kcbs = self.callbacks[path].get (key, {})
+
+                if id == None : kcbs.clear ()
+                else          : kcbs.pop   (id, None)
+
+                if not kcbs :
+                    self.callbacks[path].pop (key, None)
+
+                if not self.callbacks[path] :
+                    # last callback for path is gone: unsubscribe
+                    del self.callbacks[path]
+                    self.r.unsubscribe_path (path)
 
   
 
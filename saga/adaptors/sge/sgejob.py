@@ -11,6 +11,7 @@ import saga.utils.which
 import saga.utils.pty_shell
 
 import saga.adaptors.base
+import saga.adaptors.poller
 import saga.adaptors.cpi.job
 
 from saga.job.constants import *
@@ -18,12 +19,25 @@ from saga.job.constants import *
 import os
 import re
 import time
-from copy import deepcopy
-from cgi import parse_qs
+import threading
+
+from copy      import deepcopy
+from cgi       import parse_qs
+from cStringIO import StringIO
+
+try:
+    import xml.etree.cElementTree as ElementTree
+except ImportError:
+    import xml.etree.ElementTree  as ElementTree
 
 SYNC_CALL = saga.adaptors.cpi.decorators.SYNC_CALL
 ASYNC_CALL = saga.adaptors.cpi.decorators.ASYNC_CALL
 
+# job states are polled in bulk, with an interval between these bounds
+# (see saga.adaptors.poller)
+POLL_INTERVAL_MIN = 1   # seconds
+POLL_INTERVAL_MAX = 30  # seconds
+
 
 # --------------------------------------------------------------------
 #
@@ -61,6 +75,101 @@ def _sge_to_saga_jobstate(sgejs):
         return saga.job.UNKNOWN
 
 
+# --------------------------------------------------------------------
+#
+def _parse_qstat_xml(xml):
+    """ parses the output of 'qstat -xml' into a dict of job infos, keyed by
+        SGE job id.  The document is parsed incrementally, and every job
+        element is discarded once it has been evaluated, so that the memory
+        footprint does not grow with the size of the queue.
+    """
+    jobs = dict()
+
+    for _, elem in ElementTree.iterparse(StringIO(xml)):
+
+        if elem.tag != 'job_list':
+            continue
+
+        pid = elem.findtext('JB_job_number')
+
+        # array jobs are reported once per task -- the first entry wins
+        if pid and pid not in jobs:
+
+            exec_hosts = None
+            queue_name = elem.findtext('queue_name')
+            if queue_name and '@' in queue_name:
+                exec_hosts = [queue_name.split('@', 1)[1]]
+
+            jobs[pid] = {
+                'state':        _sge_to_saga_jobstate(elem.findtext('state')),
+                'exec_hosts':   exec_hosts,
+                'create_time':  elem.findtext('JB_submission_time'),
+                'start_time':   elem.findtext('JAT_start_time')
+            }
+
+        elem.clear()
+
+    return jobs
+
+
+# --------------------------------------------------------------------
+#
+def _parse_qacct(out):
+    """ parses the output of one or more 'qacct -j <id>' calls into a dict of
+        job infos, keyed by SGE job id.  qacct separates the records by
+        a line of '=' characters, and reports one 'key value' pair per line.
+    """
+    jobs   = dict()
+    record = None
+
+    for line in out.split('\n'):
+        line = line.strip()
+
+        if line.startswith('====='):
+            record = dict()
+            continue
+
+        elems = line.split(None, 1)
+        if record is None or len(elems) != 2:
+            continue
+
+        record[elems[0]] = elems[1].strip()
+        if elems[0] == 'jobnumber':
+            jobs[elems[1].strip()] = record
+
+    infos = dict()
+    for pid, record in jobs.iteritems():
+
+        try:
+            returncode = int(record.get('exit_status', ''))
+        except ValueError:
+            returncode = None
+
+        # 'failed' is '0' for jobs which the scheduler ran successfully, and
+        # something like '100 : assumedly after job' otherwise.
+        failed = not record.get('failed', '0').startswith('0')
+
+        if failed or returncode:
+            state = saga.job.FAILED
+        else:
+            state = saga.job.DONE
+
+        exec_hosts = None
+        if record.get('hostname'):
+            exec_hosts = [record['hostname']]
+
+        infos[pid] = {
+            'state':        state,
+            'exec_hosts':   exec_hosts,
+            'returncode':   returncode,
+            'create_time':  record.get('qsub_time'),
+            'start_time':   record.get('start_time'),
+            'end_time':     record.get('end_time')
+        }
+
+    return infos
+
+
 # --------------------------------------------------------------------
 # simple parser for getting memory requirements flags and multipliers from the memreqs part of the job.Service url
 #
@@ -319,19 +428,17 @@ class SGEJobService (saga.adaptors.cpi.job.Service):
     #
     def __init__(self, api, adaptor):
 
+        self.poller = None
         _cpi_base = super(SGEJobService, self)
         _cpi_base.__init__(api, adaptor)
 
         self._adaptor = adaptor
 
-
-
-
     # ----------------------------------------------------------------
     #
     def __del__(self):
 
-        self.finalize(kill_shell=True)
+        self.close()
 
     # ----------------------------------------------------------------
     #
@@ -347,9 +454,17 @@ class SGEJobService (saga.adaptors.cpi.job.Service):
         self.queue   = None
         self.memreqs = None
         self.shell   = None
+        self.user    = None
         self.mandatory_memreqs = list()
 
-
+        # the job table is updated in bulk by the job state poller: one
+        # 'qstat -xml' call for all jobs of the user, plus one batched 'qacct'
+        # call for the jobs which left the queue since the last update.
+        # 'qstat_jobs' holds the complete result of the last qstat call (and
+        # also serves list()), 'jobs' holds the infos of the jobs we know.
+        self.qstat_jobs = dict()
+        self.qstat_time = None
+        self.table_lock = threading.RLock()
 
         rm_scheme = rm_url.scheme
         pty_url   = deepcopy(rm_url)
@@ -388,14 +503,24 @@ class SGEJobService (saga.adaptors.cpi.job.Service):
 
         self.initialize()
 
+        # the job table is refreshed by the poller for the target host
+        self.poller = saga.adaptors.poller.register(self.rm, self._poll_jobs,
+                                                    POLL_INTERVAL_MIN,
+                                                    POLL_INTERVAL_MAX)
+
         return self.get_api ()
 
 
+
     # ----------------------------------------------------------------
     #
     def close (self) :
-        if  self.shell :
-            self.shell.finalize (True)
+
+        if  self.poller :
+            self.poller.unregister()
+            self.poller = None
+
+        self.finalize(kill_shell=True)
 
 
     # ----------------------------------------------------------------
@@ -432,6 +557,23 @@ class SGEJobService (saga.adaptors.cpi.job.Service):
 
         self._logger.info("Found SGE tools: %s" % self._commands)
 
+        # qacct is optional -- if it is available, we use it to collect the
+        # exit codes and timestamps of jobs which left the queue.
+        ret, out, _ = self.shell.run_sync("which qacct")
+        if ret == 0:
+            self._commands['qacct'] = {"path":    out.strip(),
+                                       "version": "?"}
+        else:
+            self._logger.warning("Couldn't find 'qacct' -- no exit codes \
+will be available for finished jobs.")
+
+        # all job state queries are filtered by the user name
+        ret, out, _ = self.shell.run_sync("whoami")
+        if ret != 0:
+            message = "Error determining user name: %s" % out
+            log_error_and_raise(message, saga.NoSuccess, self._logger)
+        self.user = out.strip()
+
         # determine the available processing elements
         ret, out, _ = self.shell.run_sync('%s -spl' %
                       (self._commands['qconf']['path']))
@@ -565,145 +707,232 @@ class SGEJobService (saga.adaptors.cpi.job.Service):
             self._logger.info("Submitted SGE job with id: %s" % job_id)
 
             # add job to internal list of known jobs.
-            self.jobs[job_id] = {
-                'state':        saga.job.PENDING,
-                'exec_hosts':   None,
-                'returncode':   None,
-                'create_time':  None,
-                'start_time':   None,
-                'end_time':     None,
-                'gone':         False
-            }
+            with self.table_lock:
+                self.jobs[job_id] = {
+                    'state':        saga.job.PENDING,
+                    'exec_hosts':   None,
+                    'returncode':   None,
+                    'create_time':  None,
+                    'start_time':   None,
+                    'end_time':     None,
+                    'gone':         False,
+                    'wall_time_limit': jd.wall_time_limit
+                }
+
+            # the qstat table does not know the new job, yet
+            with self.table_lock:
+                self.qstat_time = None
+
+            # make sure the poller picks up the new job quickly
+            if self.poller:
+                self.poller.poke()
 
             return job_id
 
     # ----------------------------------------------------------------
     #
-    def _retrieve_job(self, job_id):
-        """ see if we can get some info about a job that we don't
-            know anything about
+    def _qstat(self):
+        """ runs 'qstat -xml' once for all jobs of the user, and stores the
+            result in the qstat table.
         """
-        rm, pid = self._adaptor.parse_id(job_id)
-
-        # run the SGE 'qstat' command to get some infos about our job
-        ret, out, _ = self.shell.run_sync("echo -n \"JID: \" && %s | grep %s \
-                && %s -f -j %s | egrep '(submission_time)'" \
-                % (self._commands['qstat']['path'], pid,
-                   self._commands['qstat']['path'], pid))
+        ret, out, _ = self.shell.run_sync("%s -xml -u %s" \
+            % (self._commands['qstat']['path'], self.user))
 
         if ret != 0:
-            message = "Couldn't reconnect to job '%s': %s" % (job_id, out)
+            message = "Error retrieving job info via 'qstat': %s" % out
             log_error_and_raise(message, saga.NoSuccess, self._logger)
-        else:
-            # the job seems to exist on the backend. let's gather some data
-            job_info = {
-                'state':        saga.job.UNKNOWN,
-                'exec_hosts':   None,
-                'returncode':   None,
-                'create_time':  None,
-                'start_time':   None,
-                'end_time':     None,
-                'gone':         False
-            }
 
-            results = out.split('\n')
-            for result in results:
-                if 'JID:' in result:
-                    job_state = _sge_to_saga_jobstate(out.split()[5])
-                    job_info['state'] = job_state
-                elif 'submission_time:' in result:
-                    val = result.replace('submission_time:', '')
-                    job_info['create_time'] = val.strip()
+        try:
+            qstat_jobs = _parse_qstat_xml(out)
+        except Exception as e:
+            message = "Couldn't parse 'qstat -xml' output: %s" % e
+            log_error_and_raise(message, saga.NoSuccess, self._logger)
 
-            return job_info
+        with self.table_lock:
+            self.qstat_jobs = qstat_jobs
+            self.qstat_time = time.time()
+
+        return qstat_jobs
 
     # ----------------------------------------------------------------
     #
-    def _job_get_info(self, job_id):
-        """ get job attributes via qstat
+    def _qacct(self, pids):
+        """ runs 'qacct' for all given job ids in as few shell commands as
+            the command line length permits, and returns the job infos for
+            those jobs which are known to qacct.
         """
+        if not pids or 'qacct' not in self._commands:
+            return dict()
 
-        # if we don't have the job in our dictionary, we don't want it
-        if job_id not in self.jobs:
-            message = "Unkown job ID: %s. Can't update state." % job_id
-            log_error_and_raise(message, saga.NoSuccess, self._logger)
+        # qacct accepts only one job id per call, so we loop on the remote
+        # side.  We don't care about the exit code: unknown ids are simply
+        # not reported.
+        cmd   = "for pid in %%s; do %s -j $pid; done 2>/dev/null" \
+              % self._commands['qacct']['path']
+        infos = dict()
 
-        # prev. info contains the info collect when _job_get_info
-        # was called the last time
-        prev_info = self.jobs[job_id]
+        for batch in self.shell._arg_batches(pids, len(cmd)):
+            ret, out, _ = self.shell.run_sync(cmd % ' '.join(batch))
+            infos.update(_parse_qacct(out))
 
-        # if the 'gone' flag is set, there's no need to query the job
-        # state again. it's gone forever
-        if prev_info['gone'] is True:
-            self._logger.warning("Job information is not available anymore.")
-            return prev_info
+        return infos
 
-        # curr. info will contain the new job info collect. it starts off
-        # as a copy of prev_info
-        curr_info = deepcopy(prev_info)
+    # ----------------------------------------------------------------
+    #
+    def _has_active_jobs(self):
+        """ returns True if any known job is not yet in a final state
+        """
+        with self.table_lock:
+            for info in self.jobs.values():
+                if info['gone'] is not True and info['state'] not in \
+                    [saga.job.DONE, saga.job.FAILED, saga.job.CANCELED]:
+                    return True
+        return False
 
-        rm, pid = self._adaptor.parse_id(job_id)
+    # ----------------------------------------------------------------
+    #
+    def _poll_jobs(self):
+        """ bulk fetch callable for the job state poller
+        """
+        if not self._has_active_jobs():
+            return None
 
-        # run the SGE 'qstat' command to get some infos about our job
-        ret, out, _ = self.shell.run_sync("echo -n \"JID: \" && %s | grep %s \
-                && %s -f -j %s | egrep '(submission_time)'" \
-                % (self._commands['qstat']['path'], pid,
-                   self._commands['qstat']['path'], pid))
+        return self._update_job_table()
 
-        if ret != 0:
-            # Let's see if the previous job state was runnig or pending. in
-            # that case, the job is gone now, which can either mean DONE,
-            # or FAILED. the only thing we can do is set it to 'DONE'
-            if prev_info['state'] in [saga.job.RUNNING, saga.job.PENDING]:
-                curr_info['state'] = saga.job.DONE
+    # ----------------------------------------------------------------
+    #
+    def _update_job_table(self):
+        """ updates the infos of all known, non-final jobs in one sweep.
+            Returns True if any job changed its state.
+        """
+        qstat_jobs = self._qstat()
+        changed    = False
+        finished   = dict()
+
+        with self.table_lock:
+
+            for job_id, prev_info in self.jobs.items():
+
+                if prev_info['gone'] is True or prev_info['state'] in \
+                    [saga.job.DONE, saga.job.FAILED, saga.job.CANCELED]:
+                    continue
+
+                rm, pid = self._adaptor.parse_id(job_id)
+
+                if pid not in qstat_jobs:
+                    # the job left the queue -- ask qacct about it, below
+                    finished[pid] = job_id
+                    continue
+
+                curr_info = deepcopy(prev_info)
+                for key, val in qstat_jobs[pid].iteritems():
+                    if val is not None:
+                        curr_info[key] = val
+
+                if curr_info['state'] != prev_info['state']:
+                    changed = True
+
+                    # jobs are expected to end before their wall time limit
+                    # -- make sure we poll at that time.
+                    if curr_info['state'] == saga.job.RUNNING and \
+                       curr_info.get('wall_time_limit') and self.poller:
+                        self.poller.expect(time.time() + \
+                                           60 * int(curr_info['wall_time_limit']))
+
+                self.jobs[job_id] = curr_info
+
+        if not finished:
+            return changed
+
+        acct_jobs = self._qacct(finished.keys())
+
+        with self.table_lock:
+
+            for pid, job_id in finished.iteritems():
+
+                curr_info = deepcopy(self.jobs[job_id])
                 curr_info['gone'] = True
-                self._logger.warning("Previously running job has \
+                changed = True
+
+                if pid in acct_jobs:
+                    for key, val in acct_jobs[pid].iteritems():
+                        if val is not None:
+                            curr_info[key] = val
+
+                elif curr_info['state'] in [saga.job.RUNNING, saga.job.PENDING]:
+                    # the job is gone, which can either mean DONE, or FAILED.
+                    # Without accounting information, the only thing we can
+                    # do is set it to 'DONE'
+                    curr_info['state'] = saga.job.DONE
+                    self._logger.warning("Previously running job has \
 disappeared. This probably means that the backend doesn't store informations \
 about finished jobs. Setting state to 'DONE'.")
-            else:
-                curr_info['gone'] = True
 
+                self.jobs[job_id] = curr_info
+
+        return changed
+
+    # ----------------------------------------------------------------
+    #
+    def _retrieve_job(self, job_id):
+        """ see if we can get some info about a job that we don't
+            know anything about
+        """
+        rm, pid = self._adaptor.parse_id(job_id)
+
+        job_info = {
+            'state':        saga.job.UNKNOWN,
+            'exec_hosts':   None,
+            'returncode':   None,
+            'create_time':  None,
+            'start_time':   None,
+            'end_time':     None,
+            'gone':         False
+        }
+
+        qstat_jobs = self._qstat()
+
+        if pid in qstat_jobs:
+            job_info.update(qstat_jobs[pid])
         else:
-            results = out.split('\n')
-            for result in results:
-                if 'JID:' in result:
-                    job_state = _sge_to_saga_jobstate(out.split()[5])
-                    curr_info['state'] = job_state
-                elif 'submission_time:' in result:
-                    val = result.replace('submission_time:', '')
-                    curr_info['create_time'] = val.strip()
-
-        # return the new job info dict
-        return curr_info
+            acct_jobs = self._qacct([pid])
+
+            if pid not in acct_jobs:
+                message = "Couldn't reconnect to job '%s': unknown job id" % job_id
+                log_error_and_raise(message, saga.NoSuccess, self._logger)
+
+            job_info.update(acct_jobs[pid])
+            job_info['gone'] = True
+
+        return job_info
 
     # ----------------------------------------------------------------
     #
-    def _job_get_state(self, job_id):
-        """ get the job's state
+    def _job_get_info(self, job_id):
+        """ get job attributes from the job table
         """
-        # check if we have already reach a terminal state
-        if self.jobs[job_id]['state'] == saga.job.CANCELED \
-        or self.jobs[job_id]['state'] == saga.job.FAILED \
-        or self.jobs[job_id]['state'] == saga.job.DONE:
-            return self.jobs[job_id]['state']
 
-        # check if we can / should update
-        if (self.jobs[job_id]['gone'] is not True):
-            self.jobs[job_id] = self._job_get_info(job_id=job_id)
+        # if we don't have the job in our dictionary, we don't want it
+        if job_id not in self.jobs:
+            message = "Unkown job ID: %s. Can't update state." % job_id
+            log_error_and_raise(message, saga.NoSuccess, self._logger)
+
+        # the job table is kept up to date by the monitoring thread
+        return self.jobs[job_id]
 
-        return self.jobs[job_id]['state']
+    # ----------------------------------------------------------------
+    #
+    def _job_get_state(self, job_id):
+        """ get the job's state
+        """
+        return self._job_get_info(job_id)['state']
 
     # ----------------------------------------------------------------
     #
     def _job_get_exit_code(self, job_id):
         """ get the job's exit code
         """
-        # check if we can / should update
-        if (self.jobs[job_id]['gone'] is not True) \
-        and (self.jobs[job_id]['returncode'] is None):
-            self.jobs[job_id] = self._job_get_info(job_id=job_id)
-
-        ret = self.jobs[job_id]['returncode']
+        ret = self._job_get_info(job_id)['returncode']
 
         # FIXME: 'None' should cause an exception
         if ret == None : return None
@@ -714,48 +943,28 @@ about finished jobs. Setting state to 'DONE'.")
     def _job_get_execution_hosts(self, job_id):
         """ get the job's exit code
         """
-        # check if we can / should update
-        if (self.jobs[job_id]['gone'] is not True) \
-        and (self.jobs[job_id]['exec_hosts'] is None):
-            self.jobs[job_id] = self._job_get_info(job_id=job_id)
-
-        return self.jobs[job_id]['exec_hosts']
+        return self._job_get_info(job_id)['exec_hosts']
 
     # ----------------------------------------------------------------
     #
     def _job_get_create_time(self, job_id):
         """ get the job's creation time
         """
-        # check if we can / should update
-        if (self.jobs[job_id]['gone'] is not True) \
-        and (self.jobs[job_id]['create_time'] is None):
-            self.jobs[job_id] = self._job_get_info(job_id=job_id)
-
-        return self.jobs[job_id]['create_time']
+        return self._job_get_info(job_id)['create_time']
 
     # ----------------------------------------------------------------
     #
     def _job_get_start_time(self, job_id):
         """ get the job's start time
         """
-        # check if we can / should update
-        if (self.jobs[job_id]['gone'] is not True) \
-        and (self.jobs[job_id]['start_time'] is None):
-            self.jobs[job_id] = self._job_get_info(job_id=job_id)
-
-        return self.jobs[job_id]['start_time']
+        return self._job_get_info(job_id)['start_time']
 
     # ----------------------------------------------------------------
     #
     def _job_get_end_time(self, job_id):
         """ get the job's end time
         """
-        # check if we can / should update
-        if (self.jobs[job_id]['gone'] is not True) \
-        and (self.jobs[job_id]['end_time'] is None):
-            self.jobs[job_id] = self._job_get_info(job_id=job_id)
-
-        return self.jobs[job_id]['end_time']
+        return self._job_get_info(job_id)['end_time']
 
     # ----------------------------------------------------------------
     #
@@ -772,7 +981,8 @@ about finished jobs. Setting state to 'DONE'.")
             log_error_and_raise(message, saga.NoSuccess, self._logger)
 
         # assume the job was succesfully canceld
-        self.jobs[job_id]['state'] = saga.job.CANCELED
+        with self.table_lock:
+            self.jobs[job_id]['state'] = saga.job.CANCELED
 
     # ----------------------------------------------------------------
     #
@@ -784,8 +994,12 @@ about finished jobs. Setting state to 'DONE'.")
         time_now   = time_start
         rm, pid    = self._adaptor.parse_id(job_id)
 
+        # someone is waiting -- make sure the job table is fresh
+        if self.poller:
+            self.poller.poke()
+
         while True:
-            state = self._job_get_state(job_id=job_id)
+            state = self._job_get_state(job_id=job_id)  # updated in the bg.
 
             if state == saga.job.UNKNOWN :
                 log_error_and_raise("cannot get job state", saga.IncorrectState, self._logger)
@@ -794,15 +1008,18 @@ about finished jobs. Setting state to 'DONE'.")
                state == saga.job.FAILED or \
                state == saga.job.CANCELED:
                     return True
-            # avoid busy poll
-            time.sleep(0.5)
-
             # check if we hit timeout
             if timeout >= 0:
                 time_now = time.time()
                 if time_now - time_start > timeout:
                     return False
 
+                # wait for the next job table update
+                saga.adaptors.poller.wait(self.poller, timeout - (time_now - time_start),
+                                          POLL_INTERVAL_MIN)
+            else:
+                saga.adaptors.poller.wait(self.poller, None, POLL_INTERVAL_MIN)
+
     # ----------------------------------------------------------------
     #
     @SYNC_CALL
@@ -829,7 +1046,12 @@ about finished jobs. Setting state to 'DONE'.")
 
         # try to get some information about this job and throw it into
         # our job dictionary.
-        self.jobs[jobid] = self._retrieve_job(jobid)
+        job_info = self._retrieve_job(jobid)
+        with self.table_lock:
+            self.jobs[jobid] = job_info
+
+        if self.poller:
+            self.poller.poke()
 
         # this dict is passed on to the job adaptor class -- use it to pass any
         # state information you need there.
@@ -858,21 +1080,20 @@ about finished jobs. Setting state to 'DONE'.")
     def list(self):
         """ implements saga.adaptors.cpi.job.Service.list()
         """
-        ids = []
+        # the qstat table is refreshed by the poller while jobs are active --
+        # we only need to query ourself if it is outdated.
+        max_age = POLL_INTERVAL_MIN
+        if self.poller and not self.poller.idle:
+            max_age = self.poller.interval
 
-        ret, out, _ = self.shell.run_sync("%s | grep `whoami`"\
-            % self._commands['qstat']['path'])
-        if ret != 0 and len(out) > 0:
-            message = "Failed to list jobs via 'qstat': %s" % out
-            log_error_and_raise(message, saga.NoSuccess, self._logger)
-        elif ret != 0 and len(out) == 0:
-            # qstat | grep `whoami` exits with 1 if the list is empty
-            pass
-        else:
-            jobid = "[%s]-[%s]" % (self.rm, out.split()[0])
-            ids.append(jobid)
+        with self.table_lock:
+            qstat_jobs = self.qstat_jobs
+            qstat_time = self.qstat_time
+
+        if qstat_time is None or time.time() - qstat_time > max_age:
+            qstat_jobs = self._qstat()
 
-        return ids
+        return ["[%s]-[%s]" % (self.rm, pid) for pid in qstat_jobs]
 
   # # ----------------------------------------------------------------
   # #
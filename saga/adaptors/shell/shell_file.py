@@ -29,6 +29,14 @@ ASYNC_CALL = saga.adaptors.cpi.decorators.ASYNC_CALL
 #
 _PTY_TIMEOUT = 2.0
 
+# 'find -printf' format for directory listings: type, size, mtime, name and
+# link target of each entry.  The name directive ('P' or 'p') is filled in.
+_FIND_FORMAT = "%%y %%s %%T@ %%%s\\t%%l\\n"
+
+# bulk operations are sent to the shell in command lines of at most that size
+# (the tty line discipline usually limits lines to 4096 characters)
+_BULK_CMD_MAX = 2048
+
 # --------------------------------------------------------------------
 # the adaptor name
 #
@@ -45,6 +53,31 @@ _ADAPTOR_OPTIONS       = [
                           enabling this option will create a local thread and a remote 
                           shell process.''',
     'env_variable'     : None
+    },
+    { 
+    'category'         : 'saga.adaptor.shell_file',
+    'name'             : 'stat_cache_ttl', 
+    'type'             : float, 
+    'default'          : 10.0,
+    'documentation'    : '''Time (in seconds) for which entry metadata (type, size,
+                          mtime, link target) obtained by Directory.list() are
+                          used to answer is_dir(), is_entry(), is_link() and
+                          get_size() on the listed entries.  Set to 0 to
+                          disable the metadata cache.''',
+    'env_variable'     : None
+    },
+    { 
+    'category'         : 'saga.adaptor.shell_file',
+    'name'             : 'sync_check', 
+    'type'             : str, 
+    'default'          : 'mtime',
+    'valid_options'    : ['mtime', 'md5', 'sha1'],
+    'documentation'    : '''Decides which files are considered unchanged on copies
+                          with the SYNCHRONIZE flag: 'mtime' compares size and
+                          modification time of source and target, 'md5' and 'sha1'
+                          compare size and checksum (the checksums of all files
+                          on a host are collected in one batched command).''',
+    'env_variable'     : None
     }
 ]
 
@@ -171,6 +204,12 @@ class Adaptor (saga.adaptors.base.Base):
         self.opts  = self.get_config ()
 
         self.notifications = self.opts['enable_notifications'].get_value ()
+        self.stat_cache_ttl = float (self.opts['stat_cache_ttl'].get_value ())
+        self.sync_check     = str   (self.opts['sync_check'].get_value ())
+
+        # the adaptor *singleton* creates a (single) instance of a bulk handler
+        # (ShellBulk), which implements the container_* bulk methods.
+        self._bulk = ShellBulk ()
 
     # ----------------------------------------------------------------
     #
@@ -182,6 +221,300 @@ class Adaptor (saga.adaptors.base.Base):
 
 
 
+###############################################################################
+#
+class ShellBulk (saga.adaptors.cpi.filesystem.Directory) :
+    """
+    Implements the container_* bulk methods for copy, remove and get_size
+    tasks of ShellDirectory and ShellFile instances.  The tasks are grouped by
+    target host, and the operations of each group are sent to the host as a few
+    long command lines (or, for staging to and from remote hosts, as a single
+    call to stage_many_to_remote / stage_many_from_remote), instead of running
+    one command per task.  Results and errors are reported per task.
+    """
+
+    # ----------------------------------------------------------------
+    #
+    def __init__ (self) :
+        pass
+
+
+    # ----------------------------------------------------------------
+    #
+    def container_wait (self, tasks, mode, timeout) :
+
+        # bulk tasks are completed on run -- threaded fallback tasks are
+        # waited for individually
+        for task in tasks :
+            task.wait ()
+
+
+    # ----------------------------------------------------------------
+    #
+    def container_cancel (self, tasks, timeout) :
+
+        for task in tasks :
+            task.cancel ()
+
+
+    # ----------------------------------------------------------------
+    #
+    def container_copy (self, tasks) :
+
+        stage_to   = dict ()  # tasks staging to a remote host, by host
+        stage_from = dict ()  # tasks staging from a remote host, by host
+        cmds       = list ()
+
+        for task in tasks :
+
+            c      = task._method_context
+            cwdurl = saga.Url (c['cwd'])
+            src    = saga.Url (c['src'])
+            tgt    = saga.Url (c['tgt'])
+            flags  = c['flags']
+
+            if sumisc.url_is_relative (src) : src = sumisc.url_make_absolute (cwdurl, src)
+            if sumisc.url_is_relative (tgt) : tgt = sumisc.url_make_absolute (cwdurl, tgt)
+
+            if  isinstance (task._adaptor, ShellDirectory) :
+                task._adaptor._stat_cache_drop (tgt.path)
+
+            rec_flag = ""
+            if flags & saga.filesystem.RECURSIVE : 
+                rec_flag  += "-r "
+
+            # parent creation and synchronization are not bulked
+            if  flags & (CREATE_PARENTS | SYNCHRONIZE) :
+                task.run ()
+
+            elif sumisc.url_is_compatible (cwdurl, src) and \
+                 sumisc.url_is_compatible (cwdurl, tgt) :
+                cmds.append ((task, "cp %s %s %s" % (rec_flag, src.path, tgt.path), None))
+
+            # recursive staging has its own optimizations (tar streams)
+            elif rec_flag or sumisc.url_is_local (cwdurl) :
+                task.run ()
+
+            elif sumisc.url_is_local (src) and sumisc.url_is_compatible (cwdurl, tgt) :
+                stage_to.setdefault (self._host (cwdurl), []).append ((task, src.path, tgt.path))
+
+            elif sumisc.url_is_local (tgt) and sumisc.url_is_compatible (cwdurl, src) :
+                stage_from.setdefault (self._host (cwdurl), []).append ((task, src.path, tgt.path))
+
+            else :
+                task.run ()
+
+        self._run_cmds (cmds)
+
+        for group in stage_to.values () :
+            self._run_stage (group, group[0][0]._adaptor.shell.stage_many_to_remote)
+
+        for group in stage_from.values () :
+            self._run_stage (group, group[0][0]._adaptor.shell.stage_many_from_remote)
+
+
+    # ----------------------------------------------------------------
+    #
+    def container_copy_self (self, tasks) :
+
+        self.container_copy (tasks)
+
+
+    # ----------------------------------------------------------------
+    #
+    def container_remove (self, tasks) :
+
+        cmds = list ()
+
+        for task in tasks :
+
+            c      = task._method_context
+            cwdurl = saga.Url (c['cwd'])
+            tgt    = saga.Url (c['tgt'])
+
+            if sumisc.url_is_relative (tgt) : tgt = sumisc.url_make_absolute (cwdurl, tgt)
+
+            if  not sumisc.url_is_compatible (cwdurl, tgt) :
+                task.run ()  # fails in the usual way
+                continue
+
+            if  isinstance (task._adaptor, ShellDirectory) :
+                task._adaptor._stat_cache_drop (tgt.path)
+
+            rec_flag = ""
+            if c['flags'] & saga.filesystem.RECURSIVE : 
+                rec_flag  += "-r "
+
+            cmds.append ((task, "rm -f %s %s" % (rec_flag, tgt.path), None))
+
+        self._run_cmds (cmds)
+
+
+    # ----------------------------------------------------------------
+    #
+    def container_remove_self (self, tasks) :
+
+        self.container_remove (tasks)
+
+
+    # ----------------------------------------------------------------
+    #
+    def container_get_size (self, tasks) :
+
+        cmds = list ()
+
+        for task in tasks :
+
+            c      = task._method_context
+            cwdurl = saga.Url (c['cwd'])
+            tgt    = saga.Url (c['tgt'])
+
+            tgt_abs = sumisc.url_make_absolute (cwdurl, tgt)
+
+            if  task._method_type == 'get_size_self' :
+                # ShellFile.get_size_self: byte count
+                cmds.append ((task, "wc -c %s | xargs | cut -f 1 -d ' '" % tgt_abs.path, 1))
+                continue
+
+            # ShellDirectory.get_size: du for directories, cache for files
+            info = task._adaptor._stat_cache_get (tgt_abs.path)
+            if  info and info['type'] == 'f' :
+                task._set_result (info['size'])
+                task._set_state  (saga.task.DONE)
+                continue
+
+            cmds.append ((task, "du -ks %s | xargs | cut -f 1 -d ' '" % tgt_abs.path, 1024))
+
+        self._run_cmds (cmds)
+
+
+    # ----------------------------------------------------------------
+    #
+    def container_get_size_self (self, tasks) :
+
+        self.container_get_size (tasks)
+
+
+    # ----------------------------------------------------------------
+    #
+    def _host (self, url) :
+
+        return (url.schema, url.username, url.host, url.port)
+
+
+    # ----------------------------------------------------------------
+    #
+    def _run_cmds (self, cmds) :
+        """
+        Run (task, command, unit) tuples on the hosts of the tasks.  Commands
+        for the same host are chained into as few command lines as possible,
+        and the exit code and output of each command is separated by
+        a marker.  If unit is set, the task result is the command output times
+        unit, otherwise None.
+        """
+
+        groups = dict ()
+
+        for task, cmd, unit in cmds :
+            cwdurl = saga.Url (task._method_context['cwd'])
+            groups.setdefault (self._host (cwdurl), []).append ((task, cmd, unit))
+
+        for group in groups.values () :
+
+            shell = group[0][0]._adaptor.shell
+
+            while group :
+
+                batch = [group.pop (0)]
+                line  = "{ %s ; } 2>&1 ; echo SAGA_BULK_$?" % batch[0][1]
+
+                while group :
+                    more = "%s ; { %s ; } 2>&1 ; echo SAGA_BULK_$?" % (line, group[0][1])
+                    if  len (more) > _BULK_CMD_MAX :
+                        break
+                    batch.append (group.pop (0))
+                    line = more
+
+                try :
+                    ret, out, _ = shell.run_sync (line)
+                    results     = self._split_results (out)
+
+                    if  len (results) != len (batch) :
+                        raise saga.NoSuccess ("bulk operation failed (%s): %s" % (ret, out))
+
+                except Exception as e :
+                    for task, _, _ in batch :
+                        task._set_exception (e)
+                        task._set_state     (saga.task.FAILED)
+                    continue
+
+                for (task, cmd, unit), (ret, out) in zip (batch, results) :
+
+                    try :
+                        if  ret != 0 :
+                            raise saga.NoSuccess ("%s failed (%s): (%s)" % (cmd, ret, out))
+
+                        if  unit :
+                            try :
+                                task._set_result (int (out) * unit)
+                            except ValueError :
+                                raise saga.NoSuccess ("%s failed: (%s)" % (cmd, out))
+                        else :
+                            task._set_result (None)
+
+                        task._set_state (saga.task.DONE)
+
+                    except saga.SagaException as e :
+                        task._set_exception (e)
+                        task._set_state     (saga.task.FAILED)
+
+
+    # ----------------------------------------------------------------
+    #
+    def _split_results (self, out) :
+        # split bulk output into (exit code, output) tuples, at the markers
+
+        results = list ()
+        lines   = list ()
+
+        for line in out.splitlines () :
+
+            match = re.match (r'^(.*)SAGA_BULK_(\d+)$', line)
+
+            if  match :
+                if  match.group (1) :
+                    lines.append (match.group (1))
+                results.append ((int (match.group (2)), "\n".join (lines).strip ()))
+                lines = list ()
+
+            else :
+                lines.append (line)
+
+        return results
+
+
+    # ----------------------------------------------------------------
+    #
+    def _run_stage (self, group, stage_many) :
+        """
+        Stage the files of (task, src, tgt) tuples in one go.  If that fails,
+        the tasks are run one by one, so that the errors end up with the
+        right tasks.
+        """
+
+        try :
+            stage_many ([(src, tgt) for _, src, tgt in group])
+
+        except Exception as e :
+            for task, _, _ in group :
+                task.run ()
+            return
+
+        for task, _, _ in group :
+            task._set_result (None)
+            task._set_state  (saga.task.DONE)
+
+
 ###############################################################################
 #
 class ShellDirectory (saga.adaptors.cpi.filesystem.Directory) :
@@ -255,19 +588,33 @@ class ShellDirectory (saga.adaptors.cpi.filesystem.Directory) :
         self.cwdurl      = saga.Url (url) # deep copy
         self.cwdurl.path = self.cwd
 
-        self.shell = sups.PTYShell     (self.url, self.session, self._logger)
+        # entry metadata from list(), by absolute path: (timestamp, info)
+        self.stat_cache  = dict ()
+        self.find_printf = None  # unknown until the first list()
+
+        self.shell = sups.get_shell    (self.url, self.session, self._logger)
+
+        # bulk operations on tasks are handled by the adaptor's ShellBulk
+        self._container = self._adaptor._bulk
 
       # self.shell.set_initialize_hook (self.initialize)
       # self.shell.set_finalize_hook   (self.finalize)
 
-        self.initialize ()
+        try :
+            self.initialize ()
+
+        except Exception :
+            # don't keep a shell we failed to initialize in the cache
+            sups.release_shell (self.shell)
+            self.shell = None
+            raise
 
         # we create a local shell handle, too, if only to support copy and move
         # to and from local file systems (mkdir for staging target, remove of move
         # source).  Not that we do not perform a cd on the local shell -- all
         # operations are assumed to be performed on absolute paths.
-        self.local = sups.PTYShell ('fork://localhost/', saga.Session(default=True), 
-                                    self._logger)
+        self.local = sups.get_shell ('fork://localhost/', saga.Session(default=True),
+                                     self._logger, shared=True)
 
         return self.get_api ()
 
@@ -302,9 +649,13 @@ class ShellDirectory (saga.adaptors.cpi.filesystem.Directory) :
     def finalize (self, kill = False) :
 
         if  kill and self.shell :
-            self.shell.finalize (True)
+            sups.release_shell (self.shell)
             self.shell = None
 
+        if  kill and self.local :
+            sups.release_shell (self.local)
+            self.local = None
+
         self.valid = False
 
 
@@ -360,6 +711,56 @@ class ShellDirectory (saga.adaptors.cpi.filesystem.Directory) :
 
         # FIXME: eval flags
 
+        # we list all entries with a single find command, which also reports
+        # type, size, mtime and link target for each entry -- those are kept
+        # in the metadata cache, so that the usual follow-up calls (is_dir,
+        # get_size, ...) on the listed entries don't need a roundtrip each.
+        # Where find does not support '-printf' (BSD), we fall back to ls.
+        # Once we know that find works, the listing is parsed while it
+        # streams in, so that huge directories don't need to be held in
+        # memory as a whole.
+        if  self.find_printf is not False :
+
+            if  None == npat :
+                cmd = "find . -mindepth 1 -maxdepth 1 ! -name '.*' -printf '%s'\n" \
+                    % (_FIND_FORMAT % 'P')
+            else :
+                if  not npat.startswith ('/') :
+                    npat = "./%s" % npat
+                cmd = "find %s -maxdepth 0 -printf '%s'\n" \
+                    % (npat, _FIND_FORMAT % 'p')
+
+            if  self.find_printf :
+                errors = []
+                with self.shell.run_stream (cmd) as out :
+                    entries = self._stat_cache_fill (out, errors)
+
+                ret = out.exit_code
+                out = "\n".join (errors)
+
+            else :
+                ret, out, _ = self.shell.run_sync (cmd)
+                entries     = None
+
+            if  ret != 0 and self.find_printf is None and 'printf' in out :
+                self._logger.info ("find does not support -printf, using ls")
+                self.find_printf = False
+
+            else :
+                if  ret != 0 :
+                    raise saga.NoSuccess ("failed to list(): (%s)(%s)" \
+                                       % (ret, out))
+
+                self.find_printf = True
+                if  entries is None :
+                    entries = self._stat_cache_fill (out.split ("\n"))
+
+                self.entries = []
+                for name in sorted (entries) :
+                    self.entries.append (saga.Url (name))
+
+                return self.entries
+
         if  None == npat :
             npat = ""
         else :
@@ -367,9 +768,9 @@ class ShellDirectory (saga.adaptors.cpi.filesystem.Directory) :
                 
         ret, out, _ = self.shell.run_sync ("/bin/ls -C1 %s\n" % npat)
             
-            if  ret != 0 :
-                raise saga.NoSuccess ("failed to list(): (%s)(%s)" \
-                                   % (ret, out))
+        if  ret != 0 :
+            raise saga.NoSuccess ("failed to list(): (%s)(%s)" \
+                               % (ret, out))
 
         lines = filter (None, out.split ("\n"))
         self._logger.debug (lines)
@@ -382,6 +783,84 @@ class ShellDirectory (saga.adaptors.cpi.filesystem.Directory) :
         return self.entries
    
    
+    # ----------------------------------------------------------------
+    #
+    def _stat_cache_fill (self, lines, errors=None) :
+        """
+        Parses the lines of a 'find -printf' listing, stores the entry
+        metadata in the cache, and returns the entry names.  Lines which
+        cannot be parsed are appended to `errors`, if given.
+        """
+
+        now   = time.time ()
+        names = []
+
+        for line in lines :
+
+            line = line.rstrip ("\n")
+
+            if  not line :
+                continue
+
+            try :
+                info, link = line.split ('\t', 1)
+                etype, size, mtime, name = info.split (' ', 3)
+            except ValueError :
+                self._logger.warning ("cannot parse listing entry '%s'" % line)
+                if  errors is not None :
+                    errors.append (line)
+                continue
+
+            if  name.startswith ('./') :
+                name = name[2:]
+
+            path = os.path.normpath (os.path.join (self.url.path, name))
+
+            self.stat_cache[path] = (now, {'type'  : etype, 
+                                           'size'  : int   (size),
+                                           'mtime' : float (mtime),
+                                           'link'  : link})
+            names.append (name)
+
+        return names
+
+
+    # ----------------------------------------------------------------
+    #
+    def _stat_cache_get (self, path) :
+        """
+        Returns the cached metadata for the given absolute path, or None if
+        there are none, or if they expired.
+        """
+
+        entry = self.stat_cache.get (os.path.normpath (path))
+
+        if  not entry :
+            return None
+
+        if  time.time () - entry[0] > self._adaptor.stat_cache_ttl :
+            del (self.stat_cache[os.path.normpath (path)])
+            return None
+
+        return entry[1]
+
+
+    # ----------------------------------------------------------------
+    #
+    def _stat_cache_drop (self, path) :
+        """
+        Removes the cached metadata for the given path, and for everything
+        below it.
+        """
+
+        path   = os.path.normpath (path)
+        prefix = path.rstrip ('/') + '/'
+
+        for key in self.stat_cache.keys () :
+            if  key == path or key.startswith (prefix) :
+                del (self.stat_cache[key])
+
+
     # ----------------------------------------------------------------
     #
     @SYNC_CALL
@@ -417,6 +896,8 @@ class ShellDirectory (saga.adaptors.cpi.filesystem.Directory) :
         if flags & saga.filesystem.CREATE_PARENTS : 
             self._create_parent (cwdurl, tgt)
 
+        self._stat_cache_drop (tgt.path)
+
 
         # print cwdurl
         # print src
@@ -428,10 +909,14 @@ class ShellDirectory (saga.adaptors.cpi.filesystem.Directory) :
             sumisc.url_is_compatible (cwdurl, tgt) :
 
             # print "shell cp"
-            ret, out, _ = self.shell.run_sync ("cp %s %s %s\n" % (rec_flag, src.path, tgt.path))
-            if  ret != 0 :
-                raise saga.NoSuccess ("copy (%s -> %s) failed (%s): (%s)" \
-                                   % (src, tgt, ret, out))
+            if  flags & SYNCHRONIZE :
+                self.shell.sync_on_remote (src.path, tgt.path, rec_flag, self._adaptor.sync_check)
+
+            else :
+                ret, out, _ = self.shell.run_sync ("cp %s %s %s\n" % (rec_flag, src.path, tgt.path))
+                if  ret != 0 :
+                    raise saga.NoSuccess ("copy (%s -> %s) failed (%s): (%s)" \
+                                       % (src, tgt, ret, out))
 
 
         # src and tgt are on different hosts, we need to find out which of them
@@ -448,13 +933,19 @@ class ShellDirectory (saga.adaptors.cpi.filesystem.Directory) :
                    sumisc.url_is_compatible (cwdurl, tgt) :
 
                     # print "from local to remote"
-                    self.shell.stage_to_remote (src.path, tgt.path, rec_flag)
+                    if  flags & SYNCHRONIZE :
+                        self.shell.sync_to_remote (src.path, tgt.path, rec_flag, self._adaptor.sync_check)
+                    else :
+                        self.shell.stage_to_remote (src.path, tgt.path, rec_flag)
 
                 elif sumisc.url_is_local (tgt)          and \
                      sumisc.url_is_compatible (cwdurl, src) :
 
                     # print "from remote to loca"
-                    self.shell.stage_from_remote (src.path, tgt.path, rec_flag)
+                    if  flags & SYNCHRONIZE :
+                        self.shell.sync_from_remote (src.path, tgt.path, rec_flag, self._adaptor.sync_check)
+                    else :
+                        self.shell.stage_from_remote (src.path, tgt.path, rec_flag)
 
                 else :
                     # print "from remote to other remote -- fail"
@@ -479,7 +970,10 @@ class ShellDirectory (saga.adaptors.cpi.filesystem.Directory) :
 
                     # print "from local to remote"
                     tmp_shell = sups.PTYShell (tgt, self.session, self._logger)
-                    tmp_shell.stage_to_remote (src.path, tgt.path, rec_flag)
+                    if  flags & SYNCHRONIZE :
+                        tmp_shell.sync_to_remote (src.path, tgt.path, rec_flag, self._adaptor.sync_check)
+                    else :
+                        tmp_shell.stage_to_remote (src.path, tgt.path, rec_flag)
 
                 elif sumisc.url_is_local (tgt) :
 
@@ -490,7 +984,10 @@ class ShellDirectory (saga.adaptors.cpi.filesystem.Directory) :
 
                     # print "from remote to local"
                     tmp_shell = sups.PTYShell (src, self.session, self._logger)
-                    tmp_shell.stage_from_remote (src.path, tgt.path, rec_flag)
+                    if  flags & SYNCHRONIZE :
+                        tmp_shell.sync_from_remote (src.path, tgt.path, rec_flag, self._adaptor.sync_check)
+                    else :
+                        tmp_shell.stage_from_remote (src.path, tgt.path, rec_flag)
 
                 else :
 
@@ -516,6 +1013,7 @@ class ShellDirectory (saga.adaptors.cpi.filesystem.Directory) :
         # need to re-initialize for new location
         self.url   = tgt
         self.flags = flags
+        self.stat_cache.clear ()
         self.initialize ()
    
    
@@ -563,6 +1061,8 @@ class ShellDirectory (saga.adaptors.cpi.filesystem.Directory) :
 
         if  sumisc.url_is_compatible (cwdurl, tgt) :
 
+            self._stat_cache_drop (tgt.path)
+
             ret, out, _ = self.shell.run_sync ("rm -f %s %s\n" % (rec_flag, tgt.path))
             if  ret != 0 :
                 raise saga.NoSuccess ("remove (%s) failed (%s): (%s)" \
@@ -601,6 +1101,8 @@ class ShellDirectory (saga.adaptors.cpi.filesystem.Directory) :
         if  flags & saga.filesystem.CREATE_PARENTS : 
             options += "-p"
 
+        self._stat_cache_drop (tgt_abs.path)
+
         self.shell.run_sync ("mkdir %s %s" % (options, tgt_abs.path))
 
    
@@ -625,6 +1127,12 @@ class ShellDirectory (saga.adaptors.cpi.filesystem.Directory) :
 
         tgt_abs = sumisc.url_make_absolute (cwdurl, tgt)
 
+        # the size of directories is computed by du -- only use the cache for
+        # plain files
+        info = self._stat_cache_get (tgt_abs.path)
+        if  info and info['type'] == 'f' :
+            return info['size']
+
         ret, out, _ = self.shell.run_sync ("du -ks %s  | xargs | cut -f 1 -d ' '\n" % tgt.path)
         if  ret != 0 :
             raise saga.NoSuccess ("get size for (%s) failed (%s): (%s)" \
@@ -637,6 +1145,75 @@ class ShellDirectory (saga.adaptors.cpi.filesystem.Directory) :
             raise saga.NoSuccess ("could not get file size: %s" % out)
 
         return size
+
+
+    # ----------------------------------------------------------------
+    #
+    # copy, remove and get_size tasks are executed in bulks by ShellBulk, if
+    # they are run via a saga.task.Container.
+    #
+    @ASYNC_CALL
+    def copy_async (self, src, tgt, flags, ttype) :
+
+        c = { 'cwd'   : self.url,
+              'src'   : src,
+              'tgt'   : tgt,
+              'flags' : flags }
+
+        return saga.task.Task (self, 'copy', c, ttype)
+
+
+    # ----------------------------------------------------------------
+    #
+    @ASYNC_CALL
+    def remove_async (self, tgt, flags, ttype) :
+
+        c = { 'cwd'   : self.url,
+              'tgt'   : tgt,
+              'flags' : flags }
+
+        return saga.task.Task (self, 'remove', c, ttype)
+
+
+    # ----------------------------------------------------------------
+    #
+    @ASYNC_CALL
+    def get_size_async (self, tgt, ttype) :
+
+        c = { 'cwd'   : self.url,
+              'tgt'   : tgt }
+
+        return saga.task.Task (self, 'get_size', c, ttype)
+
+
+    # ----------------------------------------------------------------
+    #
+    def task_run (self, task) :
+
+        call = task._method_type
+        c    = task._method_context
+
+        try :
+            if   call == 'copy'     : result = self.copy     (c['src'], c['tgt'], c['flags'])
+            elif call == 'remove'   : result = self.remove   (c['tgt'], c['flags'])
+            elif call == 'get_size' : result = self.get_size (c['tgt'])
+            else :
+                raise saga.NotImplemented ("Cannot handle %s tasks" % call)
+
+            task._set_result (result)
+            task._set_state  (saga.task.DONE)
+
+        except saga.SagaException as e :
+            task._set_exception (e)
+            task._set_state     (saga.task.FAILED)
+
+
+    # ----------------------------------------------------------------
+    #
+    def task_wait (self, task, timeout) :
+
+        # tasks are completed on run
+        pass
    
 
     # ----------------------------------------------------------------
@@ -661,6 +1238,10 @@ class ShellDirectory (saga.adaptors.cpi.filesystem.Directory) :
 
         tgt_abs = sumisc.url_make_absolute (cwdurl, tgturl)
 
+        info = self._stat_cache_get (tgt_abs.path)
+        if  info :
+            return info['type'] == 'd'
+
         ret, out, _ = self.shell.run_sync ("test -d %s && test ! -h %s" % (tgt_abs.path, tgt_abs.path))
 
         return True if ret == 0 else False
@@ -688,6 +1269,10 @@ class ShellDirectory (saga.adaptors.cpi.filesystem.Directory) :
 
         tgt_abs = sumisc.url_make_absolute (cwdurl, tgturl)
 
+        info = self._stat_cache_get (tgt_abs.path)
+        if  info :
+            return info['type'] == 'f'
+
         ret, out, _ = self.shell.run_sync ("test -f %s && test ! -h %s" % (tgt_abs.path, tgt_abs.path))
 
         return True if ret == 0 else False
@@ -715,6 +1300,10 @@ class ShellDirectory (saga.adaptors.cpi.filesystem.Directory) :
 
         tgt_abs = sumisc.url_make_absolute (cwdurl, tgturl)
 
+        info = self._stat_cache_get (tgt_abs.path)
+        if  info :
+            return info['type'] == 'l'
+
         ret, out, _ = self.shell.run_sync ("test -h %s" % tgt_abs.path)
 
         return True if ret == 0 else False
@@ -829,21 +1418,33 @@ class ShellFile (saga.adaptors.cpi.filesystem.File) :
             self.cwdurl.path = self.cwd
 
 
-        # FIXME: get ssh Master connection from _adaptor dict
-        self.shell = sups.PTYShell (self.url, self.session, self._logger)
+        # file position for read/write/seek
+        self.pos = 0
+
+        self.shell = sups.get_shell (self.url, self.session, self._logger)
+
+        # bulk operations on tasks are handled by the adaptor's ShellBulk
+        self._container = self._adaptor._bulk
 
       # self.shell.set_initialize_hook (self.initialize)
       # self.shell.set_finalize_hook   (self.finalize)
 
-        self.initialize ()
+        try :
+            self.initialize ()
+
+        except Exception :
+            # don't keep a shell we failed to initialize in the cache
+            sups.release_shell (self.shell)
+            self.shell = None
+            raise
 
 
         # we create a local shell handle, too, if only to support copy and move
         # to and from local file systems (mkdir for staging target, remove of move
         # source).  Not that we do not perform a cd on the local shell -- all
         # operations are assumed to be performed on absolute paths.
-        self.local = sups.PTYShell ('fork://localhost/', saga.Session(default=True), 
-                                    self._logger)
+        self.local = sups.get_shell ('fork://localhost/', saga.Session(default=True),
+                                     self._logger, shared=True)
 
         return self.get_api ()
 
@@ -896,11 +1497,11 @@ class ShellFile (saga.adaptors.cpi.filesystem.File) :
     def finalize (self, kill = False) :
 
         if  kill and self.shell :
-            self.shell.finalize (True)
+            sups.release_shell (self.shell)
             self.shell = None
 
         if  kill and self.local :
-            self.local.finalize (True)
+            sups.release_shell (self.local)
             self.local = None
 
         self.valid = False
@@ -958,10 +1559,14 @@ class ShellFile (saga.adaptors.cpi.filesystem.File) :
             sumisc.url_is_compatible (cwdurl, tgt) :
 
             # print "shell cp"
-            ret, out, _ = self.shell.run_sync ("cp %s %s %s\n" % (rec_flag, src.path, tgt.path))
-            if  ret != 0 :
-                raise saga.NoSuccess ("copy (%s -> %s) failed (%s): (%s)" \
-                                   % (src, tgt, ret, out))
+            if  flags & SYNCHRONIZE :
+                self.shell.sync_on_remote (src.path, tgt.path, rec_flag, self._adaptor.sync_check)
+
+            else :
+                ret, out, _ = self.shell.run_sync ("cp %s %s %s\n" % (rec_flag, src.path, tgt.path))
+                if  ret != 0 :
+                    raise saga.NoSuccess ("copy (%s -> %s) failed (%s): (%s)" \
+                                       % (src, tgt, ret, out))
 
 
         # src and tgt are on different hosts, we need to find out which of them
@@ -978,13 +1583,19 @@ class ShellFile (saga.adaptors.cpi.filesystem.File) :
                    sumisc.url_is_compatible (cwdurl, tgt) :
 
                     # print "from local to remote"
-                    self.shell.stage_to_remote (src.path, tgt.path, rec_flag)
+                    if  flags & SYNCHRONIZE :
+                        self.shell.sync_to_remote (src.path, tgt.path, rec_flag, self._adaptor.sync_check)
+                    else :
+                        self.shell.stage_to_remote (src.path, tgt.path, rec_flag)
 
                 elif sumisc.url_is_local (tgt)          and \
                      sumisc.url_is_compatible (cwdurl, src) :
 
                     # print "from remote to loca"
-                    self.shell.stage_from_remote (src.path, tgt.path, rec_flag)
+                    if  flags & SYNCHRONIZE :
+                        self.shell.sync_from_remote (src.path, tgt.path, rec_flag, self._adaptor.sync_check)
+                    else :
+                        self.shell.stage_from_remote (src.path, tgt.path, rec_flag)
 
                 else :
                     # print "from remote to other remote -- fail"
@@ -1009,7 +1620,10 @@ class ShellFile (saga.adaptors.cpi.filesystem.File) :
 
                     # print "from local to remote"
                     tmp_shell = sups.PTYShell (tgt, self.session, self._logger)
-                    tmp_shell.stage_to_remote (src.path, tgt.path, rec_flag)
+                    if  flags & SYNCHRONIZE :
+                        tmp_shell.sync_to_remote (src.path, tgt.path, rec_flag, self._adaptor.sync_check)
+                    else :
+                        tmp_shell.stage_to_remote (src.path, tgt.path, rec_flag)
 
                 elif sumisc.url_is_local (tgt) :
 
@@ -1020,7 +1634,10 @@ class ShellFile (saga.adaptors.cpi.filesystem.File) :
 
                     # print "from remote to local"
                     tmp_shell = sups.PTYShell (src, self.session, self._logger)
-                    tmp_shell.stage_from_remote (src.path, tgt.path, rec_flag)
+                    if  flags & SYNCHRONIZE :
+                        tmp_shell.sync_from_remote (src.path, tgt.path, rec_flag, self._adaptor.sync_check)
+                    else :
+                        tmp_shell.stage_from_remote (src.path, tgt.path, rec_flag)
 
                 else :
 
@@ -1048,55 +1665,90 @@ class ShellFile (saga.adaptors.cpi.filesystem.File) :
     #
     @SYNC_CALL
     def write (self, string, flags=None):
-	"""
-	This call is intended to write a string to a local or remote file.
-	Since write() uses file staging calls, it cannot be used to randomly
-	write certain parts of a file (i.e. seek()). Together with read(),
-	it was designed to manipulate template files and write them back to
-	the remote directory. Be aware, that writing large files will
-	be very slow compared to native read(2) and write(2) calls.
-	"""
+        """
+        Writes the string at the current file position, and advances the
+        position.  A write at position 0 replaces the complete file content
+        (so that read(), modify, write() works for template files).  If the
+        file was opened with (or flags contain) APPEND, the data are appended
+        to the file.  Only the written bytes are transferred, over the shell
+        channel.
+        """
+
         self._is_valid ()
-        if flags==None:
+
+        if  flags == None :
             flags = self.flags
-        else:
-            self.flags=flags
+        else :
+            self.flags = flags
 
         tgt = saga.Url (self.url)  # deep copy, is absolute
-            
-        if flags==saga.filesystem.APPEND:
-            string = self.read()+string            
-        # FIXME: eval flags
 
-        self.shell.write_to_remote(string,tgt.path)
-                                                    
+        if  flags & saga.filesystem.APPEND :
+            self.pos = self.shell.write_range (string, tgt.path, append=True)
+
+        elif self.pos == 0 :
+            self.shell.write_to_remote (string, tgt.path)
+            self.pos = len (string)
+
+        else :
+            self.shell.write_range (string, tgt.path, offset=self.pos)
+            self.pos += len (string)
+
+        return len (string)
+
+
     # ----------------------------------------------------------------
     #
     @SYNC_CALL
-    def read (self,size=None):
-	"""
-	This call is intended to read a string wit length size from a local
-	or remote file.	Since read() uses file staging calls, it cannot be
-	used to randomly read certain parts of a file (i.e. seek()).
-	Together with write(), it was designed to manipulate template files
-	and write them back to the remote directory. Be aware, that reading
-	large files will be very slow compared to native read(2) and write(2)
-	calls.
-	"""
+    def read (self, size=None):
+        """
+        Reads up to size bytes (or everything up to the end of file) from the
+        current file position, and advances the position.  Reads of a given
+        size only transfer the requested byte range over the shell channel --
+        complete files are staged via the copy channel.
+        """
 
         self._is_valid ()
 
         tgt = saga.Url (self.url)  # deep copy, is absolute
-        
-        out = self.shell.read_from_remote(tgt.path)
 
-        if size!=None:
-            return out[0:size-1]
-        else:
-            return out
+        if  size == None and self.pos == 0 :
+            out = self.shell.read_from_remote (tgt.path)
+        else :
+            out = self.shell.read_range (tgt.path, self.pos, size)
+
+        self.pos += len (out)
+
+        return out
+
+
+    # ----------------------------------------------------------------
+    #
+    @SYNC_CALL
+    def seek (self, offset, whence=saga.filesystem.START):
+
+        self._is_valid ()
+
+        if  whence == saga.filesystem.START :
+            pos = offset
+
+        elif whence == saga.filesystem.CURRENT :
+            pos = self.pos + offset
+
+        elif whence == saga.filesystem.END :
+            pos = self.get_size_self () + offset
+
+        else :
+            raise saga.BadParameter ("invalid seek mode '%s'" % whence)
+
+        if  pos < 0 :
+            raise saga.BadParameter ("cannot seek before start of file (%s)" % pos)
+
+        self.pos = pos
+
+        return self.pos
 
 
-   
     # ----------------------------------------------------------------
     #
     @SYNC_CALL
@@ -1138,6 +1790,75 @@ class ShellFile (saga.adaptors.cpi.filesystem.File) :
             raise saga.NoSuccess ("get size for (%s) failed: (%s)" % (self.url, out))
 
         return size
+
+
+    # ----------------------------------------------------------------
+    #
+    # copy_self, remove_self and get_size_self tasks are executed in bulks by
+    # ShellBulk, if they are run via a saga.task.Container.
+    #
+    @ASYNC_CALL
+    def copy_self_async (self, tgt, flags, ttype) :
+
+        c = { 'cwd'   : self.cwdurl,
+              'src'   : self.url,
+              'tgt'   : tgt,
+              'flags' : flags }
+
+        return saga.task.Task (self, 'copy_self', c, ttype)
+
+
+    # ----------------------------------------------------------------
+    #
+    @ASYNC_CALL
+    def remove_self_async (self, flags, ttype) :
+
+        c = { 'cwd'   : self.cwdurl,
+              'tgt'   : self.url,
+              'flags' : flags }
+
+        return saga.task.Task (self, 'remove_self', c, ttype)
+
+
+    # ----------------------------------------------------------------
+    #
+    @ASYNC_CALL
+    def get_size_self_async (self, ttype) :
+
+        c = { 'cwd'   : self.cwdurl,
+              'tgt'   : self.url }
+
+        return saga.task.Task (self, 'get_size_self', c, ttype)
+
+
+    # ----------------------------------------------------------------
+    #
+    def task_run (self, task) :
+
+        call = task._method_type
+        c    = task._method_context
+
+        try :
+            if   call == 'copy_self'     : result = self.copy_self     (c['tgt'], c['flags'])
+            elif call == 'remove_self'   : result = self.remove_self   (c['flags'])
+            elif call == 'get_size_self' : result = self.get_size_self ()
+            else :
+                raise saga.NotImplemented ("Cannot handle %s tasks" % call)
+
+            task._set_result (result)
+            task._set_state  (saga.task.DONE)
+
+        except saga.SagaException as e :
+            task._set_exception (e)
+            task._set_state     (saga.task.FAILED)
+
+
+    # ----------------------------------------------------------------
+    #
+    def task_wait (self, task, timeout) :
+
+        # tasks are completed on run
+        pass
    
 
     # ----------------------------------------------------------------
@@ -10,6 +10,7 @@ import saga.utils.which
 import saga.utils.pty_shell
 
 import saga.adaptors.base
+import saga.adaptors.poller
 import saga.adaptors.cpi.job
 
 from   saga.job.constants import *
@@ -22,6 +23,10 @@ import shell_wrapper
 SYNC_CALL  = saga.adaptors.cpi.decorators.SYNC_CALL
 ASYNC_CALL = saga.adaptors.cpi.decorators.ASYNC_CALL
 
+# bounds for the state poll interval in wait() (seconds)
+POLL_INTERVAL_MIN = 0.1
+POLL_INTERVAL_MAX = 2.0
+
 
 # --------------------------------------------------------------------
 # the adaptor name
@@ -1145,6 +1150,14 @@ class ShellJob (saga.adaptors.cpi.job.Job) :
 
         time_start = time.time ()
         time_now   = time_start
+        deadline   = None
+
+        if  timeout >= 0 :
+            deadline = time_start + timeout
+
+        # avoid busy poll: the poll interval grows while the job is running,
+        # and is bound by the latency of the state check
+        backoff = saga.adaptors.poller.Backoff (POLL_INTERVAL_MIN, POLL_INTERVAL_MAX)
 
         while True :
 
@@ -1155,9 +1168,7 @@ class ShellJob (saga.adaptors.cpi.job.Job) :
                 state == saga.job.CANCELED     :
                     return True
 
-            # avoid busy poll
-            # FIXME: self-tune by checking call latency
-            time.sleep (0.5)
+            backoff.sleep (deadline)
 
             # check if we hit timeout
             if  timeout >= 0 :
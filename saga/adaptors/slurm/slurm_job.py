@@ -13,6 +13,7 @@ import saga.utils.which
 import saga.utils.pty_shell
 
 import saga.adaptors.base
+import saga.adaptors.poller
 import saga.adaptors.cpi.job
 
 import re
@@ -25,6 +26,10 @@ from copy import deepcopy
 SYNC_CALL  = saga.adaptors.cpi.decorators.SYNC_CALL
 ASYNC_CALL = saga.adaptors.cpi.decorators.ASYNC_CALL
 
+# bounds for the state poll interval in wait() (seconds)
+POLL_INTERVAL_MIN = 0.5
+POLL_INTERVAL_MAX = 10.0
+
 # --------------------------------------------------------------------
 #
 def log_error_and_raise(message, exception, logger):
@@ -1061,6 +1066,14 @@ class SLURMJob (saga.adaptors.cpi.job.Job):
         time_start = time.time()
         time_now   = time_start
         rm, pid    = self._adaptor.parse_id(self._id)
+        deadline   = None
+
+        if timeout >= 0:
+            deadline = time_start + timeout
+
+        # avoid busy poll: the poll interval grows while the job is pending,
+        # and is bound by the latency of the squeue/scontrol calls
+        backoff = saga.adaptors.poller.Backoff(POLL_INTERVAL_MIN, POLL_INTERVAL_MAX)
 
         while True:
             state = self._job_get_state(self._id)
@@ -1073,8 +1086,8 @@ class SLURMJob (saga.adaptors.cpi.job.Job):
                state == saga.job.FAILED or \
                state == saga.job.CANCELED:
                     return True
-            # avoid busy poll
-            time.sleep(0.5)
+
+            backoff.sleep(deadline)
 
             # check if we hit timeout
             if timeout >= 0:
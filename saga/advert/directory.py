@@ -177,6 +177,41 @@ class Directory (nsdir.Directory, sa.Attributes) :
         if tgt  :  return self._adaptor.get_ttl      (tgt, ttype=ttype)
         else    :  return self._adaptor.get_ttl_self (     ttype=ttype)
 
+     
+    # --------------------------------------------------------------------------
+    #
+    @sus.takes   ('Directory', 
+                  dict,
+                  sus.optional (sus.one_of (SYNC, ASYNC, TASK)))
+    @sus.returns ((sus.nothing, st.Task))
+    def set_attributes (self, attributes, ttype=None) : 
+        """
+        attributes :    dict
+        ttype:          saga.task.type enum
+        ret:            None / saga.Task
+
+        Set all given attributes at once -- the backend may update them in
+        a single, atomic operation.
+        """
+        return self._adaptor.set_attributes (attributes, ttype=ttype)
+
+     
+    # --------------------------------------------------------------------------
+    #
+    @sus.takes   ('Directory', 
+                  sus.list_of (basestring),
+                  sus.optional (sus.one_of (SYNC, ASYNC, TASK)))
+    @sus.returns ((dict, st.Task))
+    def get_attributes (self, keys, ttype=None) : 
+        """
+        keys :          list [string]
+        ttype:          saga.task.type enum
+        ret:            dict / saga.Task
+
+        Get the values of all given attributes at once, as dict.
+        """
+        return self._adaptor.get_attributes (keys, ttype=ttype)
+
 
     # --------------------------------------------------------------------------
     #
@@ -200,7 +235,7 @@ class Directory (nsdir.Directory, sa.Attributes) :
         if attr_pattern or obj_type : 
             return self._adaptor.find_adverts (name_pattern, attr_pattern, obj_type, flags, ttype=ttype)
         else :
-            return self._nsdirec.find         (name_pattern,                         flags, ttype=ttype)
+            return self._adaptor.find         (name_pattern,                         flags, ttype=ttype)
 
 
 
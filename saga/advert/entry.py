@@ -218,6 +218,40 @@ class Entry (nsentry.Entry, sa.Attributes) :
         return self._adaptor.delete_object (ttype=ttype)
 
      
+    # --------------------------------------------------------------------------
+    #
+    @sus.takes   ('Entry', 
+                  dict,
+                  sus.optional (sus.one_of (SYNC, ASYNC, TASK)))
+    @sus.returns ((sus.nothing, st.Task))
+    def set_attributes (self, attributes, ttype=None) : 
+        """
+        attributes :    dict
+        ttype:          saga.task.type enum
+        ret:            None / saga.Task
+
+        Set all given attributes at once -- the backend may update them in
+        a single, atomic operation.
+        """
+        return self._adaptor.set_attributes (attributes, ttype=ttype)
+
+     
+    # --------------------------------------------------------------------------
+    #
+    @sus.takes   ('Entry', 
+                  sus.list_of (basestring),
+                  sus.optional (sus.one_of (SYNC, ASYNC, TASK)))
+    @sus.returns ((dict, st.Task))
+    def get_attributes (self, keys, ttype=None) : 
+        """
+        keys :          list [string]
+        ttype:          saga.task.type enum
+        ret:            dict / saga.Task
+
+        Get the values of all given attributes at once, as dict.
+        """
+        return self._adaptor.get_attributes (keys, ttype=ttype)
+
   
   
 # vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
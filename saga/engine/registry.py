@@ -22,7 +22,9 @@ adaptor_registry = [
                     "saga.adaptors.context.x509",
                     "saga.adaptors.context.ssh",
                     "saga.adaptors.context.userpass",
+                    "saga.adaptors.local.localjob",
                     "saga.adaptors.shell.shell_job",
+                    "saga.adaptors.local.localfile",
                     "saga.adaptors.shell.shell_file",
                     "saga.adaptors.shell.shell_resource",
                     "saga.adaptors.redis.redis_advert",
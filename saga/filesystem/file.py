@@ -4,6 +4,8 @@ __copyright__ = "Copyright 2012-2013, The SAGA Project"
 __license__   = "MIT"
 
 
+import types
+
 import saga.utils.signatures     as sus
 import saga.adaptors.base        as sab
 import saga.session              as ss
@@ -153,7 +155,31 @@ class File (nsentry.Entry) :
         ttype:    saga.task.type enum
         ret:      string / bytearray / saga.Task
         '''
-        return self._adaptor.read (ttype=ttype)
+        return self._adaptor.read (size, ttype=ttype)
+
+    # --------------------------------------------------------------------------
+    #
+    @sus.takes   ('File', 
+                  sus.optional (int))
+    @sus.returns (types.GeneratorType)
+    def read_chunks (self, chunk_size=1024*1024) :
+        '''
+        chunk_size: int
+        ret:        generator [string / bytearray]
+
+        Reads the file from the current position to its end, in chunks of
+        (at most) chunk_size bytes.
+        '''
+
+        while True :
+
+            chunk = self._adaptor.read (chunk_size)
+
+            if  chunk :
+                yield chunk
+
+            if  len (chunk) < chunk_size :
+                return
 
     # --------------------------------------------------------------------------
     #
@@ -205,7 +231,7 @@ class File (nsentry.Entry) :
     @sus.takes   ('File', 
                   sus.list_of  (sus.tuple_of (int)),
                   sus.optional (sus.one_of (SYNC, ASYNC, TASK)))
-    @sus.returns ((basestring, st.Task))
+    @sus.returns ((sus.list_of (basestring), st.Task))
     def read_v   (self, iovecs, ttype=None) :
         '''
         iovecs:   list [tuple (int, int)]
@@ -234,6 +234,7 @@ class Entry (sb.Base, sasync.Async) :
     #
     @sus.takes   ('Entry',
                   (surl.Url, basestring),
+                  sus.optional (int),
                   sus.optional (sus.one_of (SYNC, ASYNC, TASK)))
     @sus.returns ((sus.nothing, st.Task))
     def copy     (self, tgt, flags=0, ttype=None) :
@@ -14,6 +14,7 @@ import saga.base             as sbase
 import saga.exceptions       as se
 import saga.attributes       as satt
 import saga.adaptors.base    as sab
+import saga.adaptors.cpi.base as sacb
 import saga.utils.signatures as sus
 
 from   saga.constants     import SYNC, ASYNC, TASK, ALL, ANY, UNKNOWN, CANCELED
@@ -28,7 +29,7 @@ class Task (sbase.SimpleBase, satt.Attributes) :
     # --------------------------------------------------------------------------
     #
     @sus.takes   ('Task', 
-                  sab.Base, 
+                  (sab.Base, sacb.CPIBase),
                   basestring,
                   dict, 
                   sus.one_of (SYNC, ASYNC, TASK))
@@ -377,7 +378,7 @@ class Container (sbase.SimpleBase, satt.Attributes) :
                         m_handle = handle
                         break
 
-                if not handle :
+                if not m_handle :
                     # Hmm, the specified container can't handle the call after
                     # all -- fall back to the unbound handling
                     buckets['unbound'] += tasks
@@ -9,6 +9,7 @@ import os
 import sys
 import time
 import socket
+import threading
 import traceback
 
 import saga
@@ -16,7 +17,15 @@ import saga
 
 """ Provides an assortment of utilities """
 
-_latencies = {}
+# assumed latencies before any measurement (seconds)
+LATENCY_LOCAL  = 0.01
+LATENCY_REMOTE = 0.25
+
+# weight of a new sample in the latency moving average
+LATENCY_WEIGHT = 0.3
+
+_latencies     = dict ()
+_latency_lock  = threading.Lock ()
 
 
 # --------------------------------------------------------------------
@@ -75,57 +84,60 @@ def host_is_valid (host) :
 #
 def get_host_latency (host_url) :
     """ 
-    This call measures the base tcp latency for a connection to the target
-    host.  Note that port 22 is used for connection tests, unless the URL
-    explicitly specifies a different port.  If the used port is blocked, the
-    returned latency can be wrong by orders of magnitude.
+    This call returns the estimated round trip latency (in seconds) for
+    commands sent to the target host, i.e. the moving average of all latencies
+    measured over shell connections to that host (see
+    :func:`set_host_latency`).  As long as nothing was measured, we assume
+    10ms for the local host, and 250ms (a random WAN link) for other hosts.
     """
 
-    try :
-
-        # FIXME see comments to #62bebc9 -- this breaks for some cases, or is at
-        # least annoying.  Thus we disable latency checking for the time being,
-        # and return a constant assumed latency of 250ms (which approximately 
-        # represents a random WAN link).
-        return 0.25
+    host = _latency_host (host_url)
 
+    with _latency_lock :
+        if  host in _latencies :
+            return _latencies[host]
 
-        global _latencies
-
-        if  host_url in _latencies :
-            return _latencies[host_url]
-
-        u = saga.Url (host_url)
+    if  host_is_local (host) :
+        return LATENCY_LOCAL
 
-        if u.host : host = u.host
-        else      : host = 'localhost'
-        if u.port : port = u.port
-        else      : port = 22  #  FIXME: we should guess by protocol 
+    return LATENCY_REMOTE
 
-        import socket
-        import time
 
-        # ensure host is valid
-        ip   = socket.gethostbyname (host)
+# --------------------------------------------------------------------
+#
+def set_host_latency (host_url, latency) :
+    """ 
+    Add a measured round trip latency (in seconds) for the target host to
+    its moving average, and return the new average.
+    """
 
-        start = time.time ()
+    host = _latency_host (host_url)
 
-        s = socket.socket (socket.AF_INET, socket.SOCK_STREAM)
-        s.connect  ((host, port))
-        s.shutdown (socket.SHUT_RDWR)
+    with _latency_lock :
 
-        stop = time.time ()
+        if  host in _latencies :
+            _latencies[host] = (1 - LATENCY_WEIGHT) * _latencies[host] \
+                             +      LATENCY_WEIGHT  * latency
+        else :
+            _latencies[host] = latency
 
-        latency = stop - start
+        return _latencies[host]
 
-        _latencies[host_url] = latency
 
-        return latency
+# --------------------------------------------------------------------
+#
+def _latency_host (host_url) :
 
-    except :
+    # accept plain host names, too
+    if  isinstance (host_url, basestring) and not '://' in host_url :
+        host = host_url
+    else :
+        host = saga.Url (host_url).host
 
-        raise
+    if  not host :
+        host = 'localhost'
 
+    return host
 
 
 # --------------------------------------------------------------------
@@ -1,14 +1,51 @@
 
+import time
+import atexit
+import threading
+
 import saga.utils.threads    as sut
 import saga.utils.singleton  as sus
 import saga.utils.logger     as slog
+import saga.utils.config     as sconf
+
+
+# ------------------------------------------------------------------------------
+#
+_config_options = [
+    {
+    'category'      : 'saga.utils.object_cache',
+    'name'          : 'linger',
+    'type'          : float,
+    'default'       : 0.0,
+    'documentation' : 'time (in seconds) for which unused objects (like ssh '
+                      'shells) are kept for reuse -- 0 removes them right away',
+    'env_variable'  : None
+    },
+    {
+    'category'      : 'saga.utils.object_cache',
+    'name'          : 'linger_size',
+    'type'          : int,
+    'default'       : 10,
+    'documentation' : 'maximal number of unused objects kept for reuse',
+    'env_variable'  : None
+    }
+]
 
 # ------------------------------------------------------------------------------
 #
-class ObjectCache (object) :
+class ObjectCache (sconf.Configurable) :
 
     """ This is a singleton object caching class -- it maintains a reference
-    counted registry of existing objects."""
+    counted registry of existing objects.
+
+    Objects whose reference count drops to zero are usually removed right away.
+    With :func:`set_linger` (or the `saga.utils.object_cache` options `linger`
+    and `linger_size`), they are instead kept alive for some idle time, so
+    that they can be handed out again by :func:`get_obj` (think of warm ssh
+    connections for short lived job services).  The number of such idle
+    objects is limited -- the least recently released ones are removed
+    first.  A finalizer given to :func:`get_obj` is called on objects when
+    they are finally removed."""
 
     __metaclass__ = sus.Singleton
     _lock         = sut.RLock ('ObjectCache')
@@ -20,35 +57,121 @@ class ObjectCache (object) :
         Make sure the object cache dict is initialized, exactly once.
         """
 
+        sconf.Configurable.__init__ (self, 'saga.utils.object_cache', _config_options)
+
         with self._lock :
-            self._cache  = {}
+            self._cache  = {}    # oid     -> {'cnt', 'obj', 'key', 'fin'}
+            self._index  = {}    # id(obj) -> oid
+            self._idle   = {}    # oid     -> time of release
+            self._doomed = []    # (obj, finalizer) of dropped objects
+            self._leases = 0     # counter for exclusive object ids
+            self._linger = 0.0
+            self._size   = 0
+            self._reaper = None
+            self._wakeup = threading.Event ()
             self._logger = slog.getLogger ('saga.utils.object_cache')
 
+        cfg = self.get_config ()
+        self.set_linger (cfg['linger'].get_value (), cfg['linger_size'].get_value ())
 
 
     # --------------------------------------------------------------------------
     #
-    def get_obj (self, oid, creator) :
+    def set_linger (self, linger, size=10) :
+        """
+        Keep objects for `linger` seconds after their reference count dropped
+        to zero, but no more than `size` of them.  A linger time of 0 (the
+        default) removes objects immediately.
+        """
+
+        with self._lock :
+
+            self._linger = float (linger)
+            self._size   = int   (size)
+
+            if  self._linger > 0 and not self._reaper :
+                self._reaper = threading.Thread (target=self._reap)
+                self._reaper.setDaemon (True)
+                self._reaper.start ()
+                atexit.register (self._shutdown)
+
+            self._expire (time.time ())
+            self._wakeup.set ()
+
+        self._finalize ()
+
+
+    # --------------------------------------------------------------------------
+    #
+    def get_obj (self, oid, creator, finalizer=None, shared=True) :
         """
         For a given object id, attempt to retrieve an existing object.  If that
         object exists, increase the reference counter, as there is now one more
-        user for that object.  
-        
+        user for that object.
+
         If that object does not exist, call the given creator, then register and
-        return the object thusly created.
+        return the object thusly created.  The finalizer (if any) is called
+        with the object once it gets removed from the cache.
+
+        Objects which are not `shared` are never handed to two users at once:
+        only a lingering object with the given id is reused, otherwise a new
+        one is created (think of shells which carry a working directory).
         """
 
-        with self._lock :
+        oid = str(oid)
+
+        if  not shared :
 
-            oid = str(oid)
+            with self._lock :
+
+                # the most recently released idle object for that id
+                idle = [uid for uid in self._idle
+                            if self._cache [uid]['key'] == oid]
+
+                if  idle :
+                    return self._get (max (idle, key=self._idle.get))
+
+                self._leases += 1
+                uid = "%s#%d" % (oid, self._leases)
+
+            # exclusive objects are not shared anyway, so we don't block other
+            # users of the cache while creating them (which may take a while)
+            return self._add (uid, oid, creator (), finalizer)
+
+        with self._lock :
 
             if  not oid in self._cache :
+                return self._add (oid, oid, creator (), finalizer)
 
-                obj = creator ()
+            return self._get (oid)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _add (self, oid, key, obj, finalizer) :
+
+        with self._lock :
 
-                self._cache [oid]        = {}
-                self._cache [oid]['cnt'] = 0
-                self._cache [oid]['obj'] = obj
+            self._cache [oid]        = {}
+            self._cache [oid]['cnt'] = 0
+            self._cache [oid]['obj'] = obj
+            self._cache [oid]['key'] = key
+            self._cache [oid]['fin'] = finalizer
+            self._index [id (obj)]   = oid
+
+            return self._get (oid)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _get (self, oid) :
+
+        with self._lock :
+
+            if  oid in self._idle :
+                # lingering object -- revive it
+                self._logger.debug("revive %s" % oid)
+                del self._idle [oid]
 
             self._cache [oid]['cnt'] += 1
 
@@ -58,35 +181,146 @@ class ObjectCache (object) :
 
     # --------------------------------------------------------------------------
     #
-    def rem_obj (self, obj) :
+    def rem_obj (self, obj, linger=True) :
         """
         For a given objects instance, decrease the refcounter as the caller
         stops using that object.  Once the ref counter is '0', remove all traces
-        of the object -- this should make that object eligable for Python's
-        garbage collection.  Returns 'True' if the given object was indeed
-        registered, 'False' otherwise.
+        of the object (possibly after some linger time, see :func:`set_linger`,
+        unless `linger` is False -- for example for broken objects) -- this
+        should make that object eligable for Python's garbage collection.
+        Returns 'True' if the given object was indeed registered, 'False'
+        otherwise.
         """
 
+        try :
+            return self._rem_obj (obj, linger)
+
+        finally :
+            self._finalize ()
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _rem_obj (self, obj, linger) :
+
         with self._lock :
 
             self._logger.debug("rem %s" % str(obj))
 
-            for oid in self._cache.keys () :
+            oid = self._index.get (id (obj))
+
+            if  oid is None or self._cache [oid]['obj'] is not obj :
+                return False  # obj not found
+
+            if  self._cache [oid]['cnt'] <= 0 :
+                return True   # already lingering
+
+            self._cache [oid]['cnt'] -= 1
 
-                if  obj == self._cache [oid]['obj'] :
+            self._logger.debug("rem %s [%s' [%s]" % (oid, self._cache [oid]['cnt'], self._cache [oid]['obj']))
 
-                    self._cache [oid]['cnt'] -= 1
+            if  self._cache [oid]['cnt'] == 0 :
+
+                if  linger and self._linger > 0 and self._size > 0 :
+                    self._idle [oid] = time.time ()
+                    self._expire (time.time ())
+                    self._wakeup.set ()
+
+                else :
+                    self._drop (oid)
+
+            return True # obj found
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _drop (self, oid) :
+
+        self._logger.debug("del %s [%s' [%s]" % (oid, self._cache [oid]['cnt'], self._cache [oid]['obj']))
+
+        self._index.pop (id (self._cache [oid]['obj']), None)
+        self._idle.pop  (oid, None)
+
+        # the finalizer is called once the lock is released
+        if  self._cache [oid]['fin'] :
+            self._doomed.append ((self._cache [oid]['obj'], self._cache [oid]['fin']))
+
+        self._cache [oid]['obj'] = None  # free the obj reference
+        self._cache.pop (oid, None)      # remove the cache entry
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _finalize (self) :
+
+        # call the finalizers of dropped objects -- outside of the lock, as
+        # tearing down an object (like a shell) may take a while
+        with self._lock :
+            doomed       = self._doomed
+            self._doomed = []
 
-                    self._logger.debug("rem %s [%s' [%s]" % (oid, self._cache [oid]['cnt'], self._cache [oid]['obj']))
+        for obj, finalizer in doomed :
+            try :
+                finalizer (obj)
+            except Exception as e :
+                self._logger.warning ("finalizing %s failed: %s" % (obj, e))
 
-                    if  self._cache [oid]['cnt'] == 0 :
-                        self._logger.debug("del %s [%s' [%s]" % (oid, self._cache [oid]['cnt'], self._cache [oid]['obj']))
-                        self._cache [oid]['obj'] = None  # free the obj reference
-                        self._cache.pop (oid, None)      # remove the cache entry
 
-                    return True # obj found
+    # --------------------------------------------------------------------------
+    #
+    def _expire (self, now) :
+
+        # drop idle objects which lingered long enough, then the least
+        # recently released ones until the idle pool fits its size
+        for oid, released in self._idle.items () :
+            if  released + self._linger <= now :
+                self._drop (oid)
+
+        while len (self._idle) > self._size :
+            oid = min (self._idle, key=self._idle.get)
+            self._drop (oid)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _reap (self) :
+
+        # drop lingering objects when their time has come
+        while True :
+
+            with self._lock :
+
+                self._wakeup.clear ()
+                self._expire (time.time ())
+
+                timeout = None
+                if  self._idle :
+                    timeout = min (self._idle.values ()) + self._linger - time.time ()
+
+            self._finalize ()
+
+            if  not self._reaper :
+                return
+
+            self._wakeup.wait (timeout)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _shutdown (self) :
+
+        # on exit, stop the reaper and tear down all lingering objects
+        with self._lock :
+            reaper       = self._reaper
+            self._reaper = None
+            self._linger = 0.0
+            self._expire (time.time ())
+            self._wakeup.set ()
+
+        self._finalize ()
 
-            return False  # obj not found
+        if  reaper :
+            reaper.join (1.0)
 
 
 # vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
@@ -15,9 +15,13 @@ import shlex
 import select
 import signal
 import termios
+import weakref
+import threading
 
 import saga.utils.threads   as sut
 import saga.utils.logger    as sul
+import saga.utils.singleton as sus
+import saga.utils.config    as sconf
 import saga.exceptions      as se
 
 # --------------------------------------------------------------------
@@ -27,6 +31,175 @@ _POLLDELAY = 0.01  # seconds in between read attempts
 _DEBUG_MAX = 600
 
 
+# --------------------------------------------------------------------
+#
+_config_options = [
+    { 
+    'category'      : 'saga.utils.pty',
+    'name'          : 'reactor', 
+    'type'          : bool, 
+    'default'       : False,
+    'valid_options' : [True, False],
+    'documentation' : 'drain the I/O of all pty processes in a single thread',
+    'env_variable'  : 'SAGA_PTY_REACTOR'
+    }
+]
+
+
+# --------------------------------------------------------------------
+#
+class PTYReactor (sconf.Configurable) :
+    """
+    A single thread which drains the output of all :class:`PTYProcess`
+    instances in this application into per-process buffers, and wakes up their
+    readers.  This way, data are read off the ptys as soon as they arrive --
+    so child processes never stall on full pty buffers, even if nobody is
+    currently reading from them -- and hundreds of processes can be served
+    without each of them polling its own fd.
+
+    The reactor is disabled by default, see the `saga.utils.pty` option
+    `reactor` (or the `SAGA_PTY_REACTOR` environment variable).  It uses
+    epoll where available, and poll otherwise.
+
+    Readers waiting for data are woken up via a pipe per process: on Python
+    2, a `Condition.wait()` with timeout sleeps in increments, which would add
+    up to a millisecond to every shell round trip.
+
+    The reactor only keeps weak references to the processes, so that
+    abandoned processes still get cleaned up by their destructor (which may
+    then run in the reactor thread, hence the reentrant lock).
+    """
+
+    __metaclass__ = sus.Singleton
+
+    # ----------------------------------------------------------------
+    #
+    def __init__ (self) :
+
+        sconf.Configurable.__init__ (self, 'saga.utils.pty', _config_options)
+
+        self.enabled = self.get_config ()['reactor'].get_value ()
+        self.logger  = sul.getLogger ('PTYReactor')
+        self.lock    = threading.RLock ()
+        self.procs   = {}      # fd -> weakref to PTYProcess
+        self.thread  = None
+
+        if  hasattr (select, 'epoll') :
+            self.poller = select.epoll ()
+            self.events = select.EPOLLIN | select.EPOLLERR | select.EPOLLHUP
+        else :
+            self.poller = select.poll ()
+            self.events = select.POLLIN  | select.POLLERR  | select.POLLHUP
+
+        # a pipe to wake up the reactor thread when the fd set changes (poll
+        # does not notice changes while it waits)
+        self.wake_r, self.wake_w = os.pipe ()
+        self.poller.register (self.wake_r, self.events)
+
+
+    # ----------------------------------------------------------------
+    #
+    def register (self, proc) :
+
+        with self.lock :
+
+            fd = proc.parent_out
+
+            self.procs[fd] = weakref.ref (proc)
+            self.poller.register (fd, self.events)
+
+            if  not self.thread :
+                self.thread = threading.Thread (target=self._run)
+                self.thread.setDaemon (True)
+                self.thread.start ()
+
+        os.write (self.wake_w, 'x')
+
+
+    # ----------------------------------------------------------------
+    #
+    def unregister (self, proc) :
+
+        with self.lock :
+
+            fd  = proc.parent_out
+            ref = self.procs.get (fd)
+
+            # the ref is dead if proc is being destructed
+            if  ref and ref () in [proc, None] :
+                self._drop (fd)
+
+
+    # ----------------------------------------------------------------
+    #
+    def _drop (self, fd) :
+
+        del self.procs[fd]
+        try :
+            self.poller.unregister (fd)
+        except (KeyError, IOError, OSError) :
+            pass
+
+
+    # ----------------------------------------------------------------
+    #
+    def _run (self) :
+
+        while True :
+
+            try :
+                events = self.poller.poll ()
+            except (IOError, OSError, select.error) as e :
+                if  e.args[0] == errno.EINTR :
+                    continue
+                raise
+
+            with self.lock :
+
+                for fd, _ in events :
+
+                    if  fd == self.wake_r :
+                        os.read (self.wake_r, _CHUNKSIZE)
+                        continue
+
+                    ref = self.procs.get (fd)
+                    if  not ref :
+                        continue
+
+                    proc = ref ()
+                    if  not proc :
+                        # abandoned process
+                        self._drop (fd)
+                        continue
+
+                    try :
+                        buf = os.read (fd, _CHUNKSIZE)
+
+                    except OSError as e :
+                        # EIO: the child side of the pty is gone
+                        buf = e
+
+                    if  isinstance (buf, OSError) or not len (buf) :
+                        # no more data to come -- stop watching that fd
+                        self._drop (fd)
+
+                    proc._feed (buf)
+                    proc = None
+
+
+# --------------------------------------------------------------------
+#
+def _get_reactor () :
+    """ returns the shared :class:`PTYReactor`, or None if disabled """
+
+    reactor = PTYReactor ()
+
+    if  reactor.enabled :
+        return reactor
+
+    return None
+
+
 # --------------------------------------------------------------------
 #
 class PTYProcess (object) :
@@ -121,6 +294,17 @@ class PTYProcess (object) :
         self.child   = None    # the process as created by subprocess.Popen
         self.ptyio   = None    # the process' io channel, from pty.fork()
 
+        self.reactor = _get_reactor ()     # drains our pty, if enabled
+        self.block   = threading.Lock ()   # protects the fields below
+        self.buffer  = ""      # data drained by the reactor
+        self.error   = None    # how the reactor found the pty to end
+        self.waiting = False   # a reader waits for the reactor
+        self.wake_r  = None    # the reactor wakes up readers via this pipe
+        self.wake_w  = None
+
+        if  self.reactor :
+            self.wake_r, self.wake_w = os.pipe ()
+
         self.exit_code        = None  # child died with code (may be revived)
         self.exit_signal      = None  # child kill by signal (may be revived)
 
@@ -149,6 +333,13 @@ class PTYProcess (object) :
                 self.finalize ()
             except :
                 pass
+
+            for fd in [self.wake_r, self.wake_w] :
+                if  fd is not None :
+                    try :
+                        os.close (fd)
+                    except OSError :
+                        pass
     
 
     # ----------------------------------------------------------------------
@@ -195,6 +386,12 @@ class PTYProcess (object) :
                 self.parent_in  = self.child_fd
                 self.parent_out = self.child_fd
 
+                if  self.reactor :
+                    with self.block :
+                        self.buffer = ""
+                        self.error  = None
+                    self.reactor.register (self)
+
 
     # --------------------------------------------------------------------
     #
@@ -245,6 +442,9 @@ class PTYProcess (object) :
                     self.exit_signal = os.WTERMSIG (wstat)
 
 
+            if  self.reactor and self.parent_out :
+                self.reactor.unregister (self)
+
             try : 
                 if  self.parent_out :
                     os.close (self.parent_out)
@@ -485,17 +685,12 @@ class PTYProcess (object) :
 
                     # otherwise we need to read some more data, right?
                     # idle wait 'til the next data chunk arrives, or 'til _POLLDELAY
-                    rlist, _, _ = select.select ([self.parent_out], [], [], _POLLDELAY)
+                    buf = self._read_chunk (_POLLDELAY)
 
                     # got some data? 
-                    for f in rlist:
-                        # read whatever we still need
-
-                        readsize = _CHUNKSIZE
-                        if size: 
-                            readsize = size-len(ret)
+                    if  buf is not None :
 
-                        buf  = os.read (f, _CHUNKSIZE)
+                        f = self.parent_out
 
                         if  len(buf) == 0 and sys.platform == 'darwin' :
                             self.logger.debug ("read : MacOS EOF")
@@ -566,6 +761,71 @@ class PTYProcess (object) :
                                  % (e, self.cache[-256:]))
 
 
+    # ----------------------------------------------------------------
+    #
+    def _feed (self, buf) :
+        """ 
+        called by the reactor with data drained from the pty -- or with an
+        empty string or an exception at the end of the data stream
+        """
+
+        with self.block :
+
+            if  isinstance (buf, Exception) :
+                self.error = buf
+            elif not buf :
+                self.error = ''
+            else :
+                self.buffer += buf
+
+            if  self.waiting :
+                self.waiting = False
+                os.write (self.wake_w, 'x')
+
+
+    # ----------------------------------------------------------------
+    #
+    def _read_chunk (self, timeout) :
+        """ 
+        wait up to timeout seconds for data, and return them -- or None if
+        there are none.  An empty string signals EOF.
+        """
+
+        if  not self.reactor :
+
+            rlist, _, _ = select.select ([self.parent_out], [], [], timeout)
+
+            if  not rlist :
+                return None
+
+            return os.read (self.parent_out, _CHUNKSIZE)
+
+
+        with self.block :
+            wait = self.waiting = not self.buffer and self.error is None
+
+        if  wait :
+            rlist, _, _ = select.select ([self.wake_r], [], [], timeout)
+            if  rlist :
+                os.read (self.wake_r, _CHUNKSIZE)
+
+        with self.block :
+
+            self.waiting = False
+
+            if  self.buffer :
+                buf, self.buffer = self.buffer, ""
+                return buf
+
+            if  isinstance (self.error, Exception) :
+                raise self.error
+
+            if  self.error is not None :
+                return ""
+
+            return None
+
+
     # ----------------------------------------------------------------
     #
     def find (self, patterns, timeout=0) :
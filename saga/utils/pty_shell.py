@@ -7,17 +7,41 @@ __license__   = "MIT"
 import re
 import os
 import sys
+import time
 import errno
+import base64
+import tempfile
+import collections
+
+from   cgi  import parse_qs
 
 import saga.utils.misc              as sumisc
 import saga.utils.logger            as sul
 import saga.utils.pty_shell_factory as supsf
+import saga.utils.pty_transfer      as supt
+import saga.utils.sync              as susync
+import saga.utils.object_cache      as soc
 import saga.url                     as surl
 import saga.exceptions              as se
 import saga.session                 as ss
 
+# recursive copies of trees with at least that many files are streamed as tar
+# archive over a single ssh channel, instead of going file by file via sftp.
+_TAR_MIN_FILES = 64
+
+# sources with shell wildcards are never transferred in byte ranges
+_GLOB_CHARS = re.compile (r'[*?\[]')
+
+# maximal length of a command line we send to the shell (the tty line
+# discipline usually limits lines to 4096 characters)
+_CMD_MAX = 2048
+
 _PTY_TIMEOUT = 2.0
 
+# how long we wait for a fast shell startup (see _initialize_fast) -- this
+# includes the login shell startup time, which can be considerable
+_INIT_TIMEOUT = 10.0
+
 # ------------------------------------------------------------------------------
 #
 # iomode flags
@@ -105,9 +129,28 @@ class PTYShell (object) :
     (if possible on the data channel, to keep the shell pty free for concurrent
     command execution).  Ssh tunneling is implemented via ssh.v2 'ControlMaster'
     capabilities (see `ssh_config(5)`).
-    
+
+    Recursive staging of larger directory trees (see `_TAR_MIN_FILES`) over
+    ssh does not use sftp, but streams a tar archive through a single ssh
+    channel, which is unpacked on the fly.  That is controlled by two options
+    (`opts` dict): `tar_stream` (default `True`) enables tar streams, and
+    `tar_compress` (default `False`) enables gzip compression of the stream.
+
+    Large single files (see `saga.utils.pty_transfer.SPLIT_MIN`) are staged
+    over ssh in byte ranges, over several concurrent channels, and many files
+    can be staged in one go over concurrent sftp sessions (see
+    :func:`stage_many_to_remote`).  The number of channels is taken from the
+    `channels` query parameter of the shell URL (``ssh://host/?channels=8``),
+    or from the `channels` option, and defaults to
+    `saga.utils.pty_transfer.CHANNELS`.  The `verify` option (`size` or `md5`)
+    selects how such transfers are verified.
+
+    :func:`sync_to_remote` and :func:`sync_from_remote` only stage files which
+    are missing or changed on the target side, which saves most of the traffic
+    when the same data are staged over and over again.
+
     For local shells, PTYShell will create an additional shell pty for data
-    management operations.  
+    management operations.
 
 
     **Asynchronous Notifications:**
@@ -179,14 +222,17 @@ class PTYShell (object) :
         self.logger.debug ("PTYShell init %s" % self)
 
         self.url         = url      # describes the shell to run
+        self.session     = session  # with the contexts to use
         self.init        = init     # call after reconnect
         self.opts        = opts     # options...
-        self.latency     = 0.0      # set by factory
+        self.latency     = sumisc.get_host_latency (url)  # see measure_latency
 
         self.prompt      = None
         self.prompt_re   = None
         self.initialized = False
 
+        self.dd_seek_bytes = None   # see _dd_seek_bytes
+
         # we need a local dir for file staging caches.  At this point we use
         # $HOME, but should make this configurable (FIXME)
         self.base = os.environ['HOME'] + '/.saga/adaptors/shell/'
@@ -201,6 +247,20 @@ class PTYShell (object) :
                 raise se.NoSuccess ("could not create staging dir: %s" % e)
 
         
+        # number of concurrent channels for data transfers
+        self.channels = self.opts.get ('channels', supt.CHANNELS)
+
+        query = surl.Url (url).query
+        if  query :
+            channels = parse_qs (query).get ('channels')
+            if  channels :
+                self.channels = channels[0]
+
+        try :
+            self.channels = int (self.channels)
+        except ValueError :
+            raise se.BadParameter ("invalid number of channels '%s'" % self.channels)
+
         self.factory    = supsf.PTYShellFactory   ()
         self.pty_info   = self.factory.initialize (url, session, self.logger)
         self.pty_shell  = self.factory.run_shell  (self.pty_info)
@@ -238,6 +298,28 @@ class PTYShell (object) :
                 self.logger.info ("custom  command shell: %s" % command_shell)
 
 
+            # for local shells, we change to the current working directory.
+            # Remote shells will remain in the default pwd (usually $HOME).
+            pwd = None
+            if  sumisc.host_is_local (surl.Url(self.url).host) :
+                pwd = os.getcwd ()
+
+            # if earlier shells to this host came up without authentication
+            # dialog, the factory did not wait for the initial prompt, and we
+            # can set up the shell in a single round trip.
+            if  self.pty_shell.prompt :
+
+                if  self._initialize_fast (command_shell, pwd) :
+                    self.initialized = True
+                    return
+
+                # that did not work out -- start over, the slow way
+                self.logger.warning ("fast shell startup failed, retrying")
+                self.factory.forget_prompt (self.pty_info)
+                self.pty_shell.finalize ()
+                self.pty_shell = self.factory.run_shell (self.pty_info)
+
+
             self.logger.debug    ("running command shell: %s" % command_shell)
             self.pty_shell.write ("stty -echo ; %s\n"         % command_shell)
 
@@ -263,21 +345,79 @@ class PTYShell (object) :
 
             try :
                 # got a command shell, finally!
-                # for local shells, we now change to the current working
-                # directory.  Remote shells will remain in the default pwd
-                # (usually $HOME).
-                if  sumisc.host_is_local (surl.Url(self.url).host) :
-                    pwd = os.getcwd ()
+                if  pwd :
                     self.run_sync ('cd %s' % pwd)
             except Exception as e :
                 # We will ignore any errors.
                 self.logger.warning ("local cd to %s failed" % pwd)
                 
-                
+            self.measure_latency ()
+
+            # the next shell to this host can skip most of the above
+            self.factory.remember_prompt (self.pty_info, self.pty_shell, self.prompt)
 
             self.initialized = True
 
 
+    # ----------------------------------------------------------------
+    #
+    def _initialize_fast (self, command_shell, pwd) :
+        """
+        Start the command shell, set the prompt, and wait for a nonce which
+        marks the end of the setup -- all in one round trip.  Returns False if
+        the nonce does not show up in time.
+        """
+
+        # the nonce is printed as 'SAGA_INIT_<nonce>', which does not appear in
+        # the tty echo of the command (echo is only turned off by the command)
+        nonce   = base64.b16encode (os.urandom (8))
+        timeout = max (_INIT_TIMEOUT, 50 * self.latency)
+
+        setup   = "unset PROMPT_COMMAND ; PS1='PROMPT-$?->' ; PS2='' ; " \
+                + "export PS1 PS2 2>&1 >/dev/null ; "
+        if  pwd :
+            setup += "cd %s ; " % pwd
+
+        self.logger.debug    ("running command shell (fast): %s" % command_shell)
+        self.pty_shell.write ("stty -echo ; %s\n%sprintf 'SAGA_%%s_%%s\\n' INIT %s\n" \
+                           % (command_shell, setup, nonce))
+
+        fret, match = self.pty_shell.find (["SAGA_INIT_%s\s*PROMPT-(\d+)->\s*$" % nonce],
+                                           timeout)
+        if  fret == None :
+            return False
+
+        self.prompt    = self.pty_shell.prompt
+        self.prompt_re = re.compile ("^(.*?)%s\s*$" % self.prompt, re.DOTALL)
+
+        self.logger.debug ("got new shell prompt (fast)")
+        return True
+
+
+    # ----------------------------------------------------------------
+    #
+    def measure_latency (self, samples=1) :
+        """
+        Measure the round trip time of no-op commands over the shell
+        connection.  The samples are added to the latency moving average for
+        the host (see :func:`saga.utils.misc.get_host_latency`), which is
+        returned, and also used by this shell from now on.
+        """
+
+        with self.pty_shell.rlock :
+
+            for _ in range (samples) :
+
+                start = time.time ()
+                self.run_sync (":")
+
+                self.latency = sumisc.set_host_latency (self.url, time.time () - start)
+
+            self.logger.debug ("latency to %s: %.4fs" % (self.url, self.latency))
+
+            return self.latency
+
+
     # ----------------------------------------------------------------
     #
     def finalize (self, kill_pty = False) :
@@ -414,11 +554,9 @@ class PTYShell (object) :
             while True :
 
                 try :
-                    # make sure we have a non-zero waiting delay (default to
-                    # 1 second)
-                    delay = 10 * self.latency
-                    if  not delay :
-                        delay = 1.0
+                    # make sure we have a reasonable waiting delay (at least
+                    # half a second, also on fast links)
+                    delay = max (0.5, 10 * self.latency)
 
                     # FIXME: how do we know that _PTY_TIMOUT suffices?  In particular if
                     # we actually need to flush...
@@ -570,6 +708,8 @@ class PTYShell (object) :
         shell, the ``new_prompt`` parameter MUST contain a regex to match the
         new prompt.  The same conventions as for set_prompt() hold -- i.e. we
         expect the prompt regex to capture the exit status of the process.
+
+        For commands with large output, consider :func:`run_stream`.
         """
 
         with self.pty_shell.rlock :
@@ -588,26 +728,8 @@ class PTYShell (object) :
                     raise se.BadParameter ("run_sync can only run foreground jobs ('%s')" \
                                         % command)
 
-                redir = ""
                 _err  = "/tmp/saga-python.ssh-job.stderr.$$"
-
-                if  iomode == IGNORE :
-                    redir  =  " 1>>/dev/null 2>>/dev/null"
-
-                if  iomode == MERGED :
-                    redir  =  " 2>&1"
-
-                if  iomode == SEPARATE :
-                    redir  =  " 2>%s" % _err
-
-                if  iomode == STDOUT :
-                    redir  =  " 2>/dev/null"
-
-                if  iomode == STDERR :
-                    redir  =  " 2>&1 1>/dev/null"
-
-                if  iomode == None :
-                    redir  =  ""
+                redir = self._redirect (iomode, _err)
 
                 self.logger.debug    ('run_sync: %s%s'   % (command, redir))
                 self.pty_shell.write (          "%s%s\n" % (command, redir))
@@ -672,6 +794,74 @@ class PTYShell (object) :
                 raise self._translate_exception (e)
 
 
+    # ----------------------------------------------------------------
+    #
+    def _redirect (self, iomode, err) :
+        """ 
+        returns the output redirection for the given iomode (see
+        :func:`run_sync`), `err` is the stderr file for SEPARATE mode.
+        """
+
+        if  iomode == IGNORE   : return " 1>>/dev/null 2>>/dev/null"
+        if  iomode == MERGED   : return " 2>&1"
+        if  iomode == SEPARATE : return " 2>%s" % err
+        if  iomode == STDOUT   : return " 2>/dev/null"
+        if  iomode == STDERR   : return " 2>&1 1>/dev/null"
+
+        return ""
+
+
+    # ----------------------------------------------------------------
+    #
+    def run_stream (self, command, iomode=None, spill=None) :
+        """
+        Run a shell command like :func:`run_sync` -- but instead of collecting
+        its complete output in memory, return a :class:`PTYShellOutput`
+        instance which delivers the output line by line while the command
+        runs, and which reports the exit code once the command finished::
+
+          out = shell.run_stream ("qstat -f")
+          for line in out :
+              parse (line)
+          print out.exit_code
+
+        The shell stays locked until all output has been consumed, either by
+        iterating over it, or by calling `out.wait ()` -- both should happen
+        in the calling thread.  `wait` stores any output which has not been
+        iterated over, and `spill` limits the number of bytes kept in memory
+        for that: beyond that, output is spilled to a temporary file.
+
+        All iomodes but SEPARATE are supported.
+        """
+
+        if  iomode == SEPARATE :
+            raise se.BadParameter ("run_stream does not support SEPARATE iomode")
+
+        self.pty_shell.rlock.acquire ()
+
+        try :
+
+            if not self.pty_shell.alive (recover=True) :
+                raise se.IncorrectState ("Can't run command -- shell died:\n%s" \
+                                      % self.pty_shell.autopsy ())
+
+            command = command.strip ()
+            if command.endswith ('&') :
+                raise se.BadParameter ("run_stream can only run foreground jobs ('%s')" \
+                                    % command)
+
+            redir = self._redirect (iomode, None)
+
+            self.logger.debug    ('run_stream: %s%s' % (command, redir))
+            self.pty_shell.write (            "%s%s\n" % (command, redir))
+
+            return PTYShellOutput (self, spill)
+
+        except Exception as e :
+            self.pty_shell.rlock.release ()
+            raise self._translate_exception (e)
+
+
     # ----------------------------------------------------------------
     #
     def run_async (self, command) :
@@ -792,6 +982,111 @@ class PTYShell (object) :
             raise self._translate_exception (e)
 
 
+    # ----------------------------------------------------------------
+    #
+    def read_range (self, src, offset=0, size=None) :
+        """
+        :type  src:    string
+        :param src:    path to remote file to read from.
+                       The src path is not an URL, but expected to be a path
+                       relative to the shell's URL.
+
+        :type  offset: int
+        :param offset: position in the file to start reading at.
+
+        :type  size:   int
+        :param size:   number of bytes to read -- all remaining bytes if not
+                       given.
+
+        Contrary to :func:`read_from_remote`, this reads only the requested
+        byte range, and the data are transferred (base64 encoded) over the
+        shell channel itself, which avoids the setup cost of a copy channel.
+        Less data than requested are returned at the end of the file.
+        """
+
+        cmd = "test -r %s && tail -c +%d %s" % (src, offset + 1, src)
+
+        if  size is not None :
+            cmd += " | head -c %d" % size
+
+        ret, out, _ = self.run_sync ("%s | base64" % cmd, iomode=STDOUT)
+
+        if  ret != 0 :
+            raise se.NoSuccess ("could not read from %s (%s): %s" % (src, ret, out))
+
+        return base64.b64decode (out)
+
+
+    # ----------------------------------------------------------------
+    #
+    def write_range (self, data, tgt, offset=0, append=False) :
+        """
+        :type  data:   string
+        :param data:   data to write into the target file
+
+        :type  tgt:    string
+        :param tgt:    path to remote file to write to.
+                       The tgt path is not an URL, but expected to be a path
+                       relative to the shell's URL.
+
+        :type  offset: int
+        :param offset: position in the file to write the data to.  The file
+                       is not truncated.  
+
+        :type  append: bool
+        :param append: if set, the data are appended to the file, and offset
+                       is ignored.
+
+        The data are transferred (base64 encoded) over the shell channel, and
+        only the given byte range of the target file is touched.  Returns the
+        size of the target file after writing.
+        """
+
+        if  append :
+            sink = ">> %s" % tgt
+
+        elif offset :
+            # dd seeks in blocks.  GNU dd can seek in bytes, otherwise we use
+            # the largest block size (up to 1MB) which divides the offset.
+            # With no count given, partial blocks read from the pipe are
+            # written as they are.
+            if  self._dd_seek_bytes () :
+                sink = "| dd of=%s bs=1048576 seek=%d oflag=seek_bytes conv=notrunc 2>/dev/null" \
+                     % (tgt, offset)
+            else :
+                bs   = min (offset & -offset, 1048576)
+                sink = "| dd of=%s bs=%d seek=%d conv=notrunc 2>/dev/null" \
+                     % (tgt, bs, offset / bs)
+
+        else :
+            sink = "| dd of=%s bs=1048576 conv=notrunc 2>/dev/null" % tgt
+
+        # the data are passed as here-document -- base64 lines are short
+        # enough for the tty line discipline
+        ret, out, _ = self.run_sync ("base64 -d <<'SAGA_EOF' %s && wc -c < %s\n%sSAGA_EOF" \
+                                  % (sink, tgt, base64.encodestring (data)))
+
+        if  ret != 0 :
+            raise se.NoSuccess ("could not write to %s (%s): %s" % (tgt, ret, out))
+
+        try :
+            return int (out.strip ())
+        except ValueError :
+            raise se.NoSuccess ("could not write to %s: %s" % (tgt, out))
+
+
+    # ----------------------------------------------------------------
+    #
+    def _dd_seek_bytes (self) :
+        # check (once) if the remote dd supports 'oflag=seek_bytes'
+
+        if  self.dd_seek_bytes is None :
+            ret, _, _ = self.run_sync ("dd if=/dev/null of=/dev/null oflag=seek_bytes 2>/dev/null")
+            self.dd_seek_bytes = (ret == 0)
+
+        return self.dd_seek_bytes
+
+
     # ----------------------------------------------------------------
     #
     def stage_to_remote (self, src, tgt, cp_flags="") :
@@ -811,6 +1106,19 @@ class PTYShell (object) :
         # prompt, and updating pwd state on every find_prompt.
 
         try :
+            if  self._use_tar (cp_flags) and self._count_local_files (src) >= _TAR_MIN_FILES :
+                try :
+                    self.factory.run_tar_to (self.pty_info, src, tgt, 
+                                             self.opts.get ('tar_compress', False))
+                    return
+                except Exception as e :
+                    self.logger.warning ("tar stream to %s failed, using sftp: %s" % (tgt, e))
+
+            if  self._use_ranges (cp_flags, src) and os.path.isfile (src) and \
+                os.path.getsize (src) >= supt.SPLIT_MIN :
+                self._transfer_engine ().put (src, tgt)
+                return
+
             self.factory.run_copy_to (self.pty_info, src, tgt, cp_flags)
 
         except Exception as e :
@@ -835,12 +1143,298 @@ class PTYShell (object) :
         # prompt, and updating pwd state on every find_prompt.
 
         try :
+            if  self._use_tar (cp_flags) and self._count_remote_files (src) >= _TAR_MIN_FILES :
+                try :
+                    self.factory.run_tar_from (self.pty_info, src, tgt, 
+                                               self.opts.get ('tar_compress', False))
+                    return
+                except Exception as e :
+                    self.logger.warning ("tar stream from %s failed, using sftp: %s" % (src, e))
+
+            # only ask for the size if a ranged transfer could follow at all
+            if  self._use_ranges (cp_flags, src) :
+                size = self._remote_file_size (src)
+                if  size >= supt.SPLIT_MIN :
+                    self._transfer_engine ().get (src, tgt, size)
+                    return
+
             self.factory.run_copy_from (self.pty_info, src, tgt, cp_flags)
 
         except Exception as e :
             raise self._translate_exception (e)
 
 
+    # ----------------------------------------------------------------
+    #
+    def stage_many_to_remote (self, pairs) :
+        """
+        :type  pairs: list of tuples
+        :param pairs: (src, tgt) pairs of local source file and remote target
+                      file paths (see :func:`stage_to_remote`).
+
+        Stages a set of files to the remote host.  Over ssh, the files are
+        distributed over concurrent sftp sessions.
+        """
+
+        try :
+            if  self.pty_info['type'] == 'ssh' and len (pairs) > 1 :
+                self._transfer_engine ().put_many (pairs)
+                return
+
+            for src, tgt in pairs :
+                self.factory.run_copy_to (self.pty_info, src, tgt)
+
+        except Exception as e :
+            raise self._translate_exception (e)
+
+
+    # ----------------------------------------------------------------
+    #
+    def stage_many_from_remote (self, pairs) :
+        """
+        :type  pairs: list of tuples
+        :param pairs: (src, tgt) pairs of remote source file and local target
+                      file paths (see :func:`stage_from_remote`).
+
+        Stages a set of files from the remote host.  Over ssh, the files are
+        distributed over concurrent sftp sessions.
+        """
+
+        try :
+            if  self.pty_info['type'] == 'ssh' and len (pairs) > 1 :
+                self._transfer_engine ().get_many (pairs)
+                return
+
+            for src, tgt in pairs :
+                self.factory.run_copy_from (self.pty_info, src, tgt)
+
+        except Exception as e :
+            raise self._translate_exception (e)
+
+
+    # ----------------------------------------------------------------
+    #
+    def sync_to_remote (self, src, tgt, cp_flags="", check='mtime') :
+        """
+        Like :func:`stage_to_remote`, but only transfers those files of the
+        local tree src which are missing or changed in the remote tree tgt
+        (see :mod:`saga.utils.sync` for the meaning of `check`).  Returns the
+        number of transferred files.
+        """
+
+        try :
+            tgt, dirs, files = susync.plan (src, tgt, '-r' in cp_flags, check,
+                                            lambda path : susync.local_manifest (path, check),
+                                            lambda path : susync.shell_manifest (self, path, check))
+            self._log_sync (src, dirs, files)
+
+            self._run_batched (["mkdir -p %s" % susync.join (tgt, d) for d in dirs])
+            self.stage_many_to_remote ([(susync.join (src, f), susync.join (tgt, f))
+                                        for f in files])
+            return len (files)
+
+        except Exception as e :
+            raise self._translate_exception (e)
+
+
+    # ----------------------------------------------------------------
+    #
+    def sync_from_remote (self, src, tgt, cp_flags="", check='mtime') :
+        """
+        Like :func:`stage_from_remote`, but only transfers those files of the
+        remote tree src which are missing or changed in the local tree tgt
+        (see :func:`sync_to_remote`).
+        """
+
+        try :
+            tgt, dirs, files = susync.plan (src, tgt, '-r' in cp_flags, check,
+                                            lambda path : susync.shell_manifest (self, path, check),
+                                            lambda path : susync.local_manifest (path, check))
+            self._log_sync (src, dirs, files)
+
+            for d in dirs :
+                if  not os.path.isdir (susync.join (tgt, d)) :
+                    os.makedirs (susync.join (tgt, d))
+
+            self.stage_many_from_remote ([(susync.join (src, f), susync.join (tgt, f))
+                                          for f in files])
+            return len (files)
+
+        except Exception as e :
+            raise self._translate_exception (e)
+
+
+    # ----------------------------------------------------------------
+    #
+    def sync_on_remote (self, src, tgt, cp_flags="", check='mtime') :
+        """
+        Like :func:`sync_to_remote`, but for source and target tree both on
+        the remote host -- changed files are copied by `cp` on that host.
+        """
+
+        try :
+            tgt, dirs, files = susync.plan (src, tgt, '-r' in cp_flags, check,
+                                            lambda path : susync.shell_manifest (self, path, check),
+                                            lambda path : susync.shell_manifest (self, path, check))
+            self._log_sync (src, dirs, files)
+
+            self._run_batched (["mkdir -p %s" % susync.join (tgt, d) for d in dirs] +
+                               ["cp %s %s" % (susync.join (src, f), susync.join (tgt, f))
+                                for f in files])
+            return len (files)
+
+        except Exception as e :
+            raise self._translate_exception (e)
+
+
+    # ----------------------------------------------------------------
+    #
+    def _log_sync (self, src, dirs, files) :
+
+        self.logger.debug ("sync %s: %d directories to create, %d files to transfer" \
+                        % (src, len (dirs), len (files)))
+
+
+    # ----------------------------------------------------------------
+    #
+    def _run_batched (self, cmds) :
+        """
+        Run the given commands, chained with '&&' into as few command lines as
+        the tty line discipline permits.
+        """
+
+        while cmds :
+
+            batch = [cmds.pop (0)]
+
+            while cmds and len (" && ".join (batch + cmds[:1])) < _CMD_MAX :
+                batch.append (cmds.pop (0))
+
+            ret, out, _ = self.run_sync (" && ".join (batch))
+
+            if  ret != 0 :
+                raise se.NoSuccess ("command failed (%s): %s" % (ret, out))
+
+
+    # ----------------------------------------------------------------
+    #
+    def _arg_batches (self, args, reserve=0) :
+        """
+        Split args into batches which, joined by blanks, leave room for
+        `reserve` more characters on a command line (see `_CMD_MAX`).
+        """
+
+        args  = list (args)
+        limit = _CMD_MAX - reserve
+
+        while args :
+
+            batch = [args.pop (0)]
+            size  = len (batch[0])
+
+            while args and size + 1 + len (args[0]) < limit :
+                size += 1 + len (args[0])
+                batch.append (args.pop (0))
+
+            yield batch
+
+
+    # ----------------------------------------------------------------
+    #
+    def _transfer_engine (self) :
+
+        return supt.TransferEngine (self, self.channels, 
+                                    self.opts.get ('verify', 'size'), self.logger)
+
+
+    # ----------------------------------------------------------------
+    #
+    def _use_ranges (self, cp_flags, src) :
+        """
+        Single files are transferred in byte ranges over several channels if
+        we have more than one channel to the remote host.  Wildcard sources
+        are left to sftp, as they may expand to any number of files.
+        """
+
+        return not '-r' in cp_flags         and \
+               self.pty_info['type'] == 'ssh' and \
+               self.channels > 1              and \
+               not _GLOB_CHARS.search (src)
+
+
+    # ----------------------------------------------------------------
+    #
+    def _remote_file_size (self, src) :
+        """
+        Size of the remote file src, or -1 if that is not a plain file.
+        """
+
+        ret, out, _ = self.run_sync ("test -f %s && wc -c < %s" % (src, src))
+        if  ret != 0 :
+            return -1
+
+        try :
+            return int (out.strip ())
+        except ValueError :
+            return -1
+
+
+    # ----------------------------------------------------------------
+    #
+    def _use_tar (self, cp_flags) :
+        """
+        Tar streams are used for recursive copies over ssh, if tar is around
+        (and unless disabled via the 'tar_stream' option).
+        """
+
+        if  not '-r' in cp_flags :
+            return False
+
+        if  not self.opts.get ('tar_stream', True) :
+            return False
+
+        return self.pty_info['type'] == 'ssh' and bool (self.pty_info.get ('tar_exe'))
+
+
+    # ----------------------------------------------------------------
+    #
+    def _count_local_files (self, src) :
+        """
+        Count the files in the local tree src -- but stop counting once we
+        know that the tree is large enough for a tar stream.
+        """
+
+        if  not os.path.isdir (src) :
+            return 0
+
+        count = 0
+        for root, dirs, files in os.walk (src) :
+            count += len (files)
+            if  count >= _TAR_MIN_FILES :
+                break
+
+        return count
+
+
+    # ----------------------------------------------------------------
+    #
+    def _count_remote_files (self, src) :
+        """
+        Count the files in the remote tree src, with the same cutoff as
+        above.  This costs one roundtrip on the shell channel.
+        """
+
+        ret, out, _ = self.run_sync ("test -d %s && find %s -type f | head -n %d | wc -l" \
+                                  % (src, src, _TAR_MIN_FILES))
+        if  ret != 0 :
+            return 0
+
+        try :
+            return int (out.strip ())
+        except ValueError :
+            return 0
+
+
     # ----------------------------------------------------------------
     #
     def _translate_exception (self, e, msg=None) :
@@ -890,5 +1484,223 @@ class PTYShell (object) :
         return e
 
 
+# ------------------------------------------------------------------------------
+#
+class PTYShellOutput (object) :
+    """
+    The output of a command started via :func:`PTYShell.run_stream`.
+    Iterating over it yields the output lines (including the newlines) as they
+    arrive; after the last line, `exit_code` is set and the shell is released.
+
+    Alternatively, :func:`wait` collects all remaining output for later
+    iteration (in memory up to `spill` bytes, and in a temporary file beyond
+    that), and :func:`close` discards it.  The object can also be used as
+    context manager, which closes it on exit.
+    """
+
+    # ----------------------------------------------------------------
+    #
+    def __init__ (self, shell, spill=None) :
+
+        self.shell     = shell
+        self.spill     = spill
+        self.exit_code = None
+
+        self._live     = collections.deque ()  # lines read off the shell
+        self._pending  = ""                    # incomplete line
+        self._done     = False                 # found the prompt
+
+        self._stored   = collections.deque ()  # lines collected by wait()
+        self._size     = 0                     # bytes in _stored
+        self._file     = None                  # lines spilled by wait()
+
+
+    # ----------------------------------------------------------------
+    #
+    def __iter__ (self) :
+
+        while True :
+
+            if  self._stored :
+                line = self._stored.popleft ()
+                self._size -= len (line)
+
+            elif self._file :
+                line = self._file.readline ()
+                if  not line :
+                    self._file.close ()
+                    self._file = None
+                    continue
+
+            else :
+                line = self._read ()
+
+            if  line is None :
+                return
+
+            yield line
+
+
+    # ----------------------------------------------------------------
+    #
+    def __enter__ (self)                         : return self
+    def __exit__  (self, type, value, traceback) : self.close ()
+
+
+    # ----------------------------------------------------------------
+    #
+    def _read (self) :
+        """
+        Return the next output line from the shell, or None once the prompt
+        appeared.
+        """
+
+        pty = self.shell.pty_shell
+
+        while not self._live :
+
+            if  self._done :
+                return None
+
+            try :
+                data = self._pending + pty.read (timeout=0)
+
+            except Exception as e :
+                self._finish ()
+                raise self.shell._translate_exception (e)
+
+            lines         = data.split ('\n')
+            self._pending = lines.pop ()
+
+            for line in lines :
+                self._live.append (line + '\n')
+
+            # the prompt follows the last newline of the output (unless the
+            # output does not end in a newline)
+            match = self.shell.prompt_re.match (self._pending)
+
+            if  match :
+                if  match.group (1) :
+                    self._live.append (match.group (1))
+
+                self.exit_code = int (match.group (2))
+                self._pending  = ""
+                self._finish ()
+
+        return self._live.popleft ()
+
+
+    # ----------------------------------------------------------------
+    #
+    def _finish (self) :
+
+        if  not self._done :
+            self._done = True
+            self.shell.pty_shell.rlock.release ()
+
+
+    # ----------------------------------------------------------------
+    #
+    def wait (self) :
+        """
+        Collect all remaining output, release the shell, and return the exit
+        code of the command.  The output can still be iterated over.
+        """
+
+        while True :
+
+            line = self._read ()
+
+            if  line is None :
+                break
+
+            if  not self._file :
+                if  self.spill is None or self._size + len (line) <= self.spill :
+                    self._stored.append (line)
+                    self._size += len (line)
+                    continue
+
+                self._file = tempfile.TemporaryFile (prefix='saga-output-')
+
+            self._file.write (line)
+
+        if  self._file :
+            self._file.seek (0)
+
+        return self.exit_code
+
+
+    # ----------------------------------------------------------------
+    #
+    def close (self) :
+        """
+        Discard all remaining output, release the shell, and return the exit
+        code of the command.
+        """
+
+        while self._read () is not None :
+            pass
+
+        self._stored.clear ()
+        self._size = 0
+
+        if  self._file :
+            self._file.close ()
+            self._file = None
+
+        return self.exit_code
+
+
+# ------------------------------------------------------------------------------
+#
+def get_shell (url, session=None, logger=None, shared=False) :
+    """
+    Return a :class:`PTYShell` for the given URL and session, served by the
+    :class:`saga.utils.object_cache.ObjectCache`: shells released by
+    :func:`release_shell` are reused while they linger (see the
+    `saga.utils.object_cache` options), which saves the cost of a new ssh
+    channel and shell login.  Shells which are not `shared` have a single
+    user at any time, as they may carry state like a working directory.
+    """
+
+    # sessions are told apart by their context list, which the default
+    # sessions share -- the shell keeps its session (and thus that id) alive
+    ctxs = None
+    if  session :
+        ctxs = session.contexts
+
+    u   = surl.Url (url)
+    oid = "pty_shell %s://%s@%s:%s?%s [%s]" \
+        % (u.schema, u.username, u.host, u.port, u.query, id (ctxs))
+
+    return soc.ObjectCache ().get_obj (oid, lambda : PTYShell (url, session, logger),
+                                       finalizer=_finalize_shell, shared=shared)
+
+
+# ------------------------------------------------------------------------------
+#
+def release_shell (shell) :
+    """
+    Hand a shell obtained by :func:`get_shell` back to the cache -- the shell
+    is finalized once no one uses it anymore, and it is not kept for reuse if
+    it died.
+    """
+
+    try :
+        alive = shell.alive ()
+    except Exception :
+        alive = False
+
+    if  not soc.ObjectCache ().rem_obj (shell, linger=alive) :
+        shell.finalize (kill_pty=True)
+
+
+# ------------------------------------------------------------------------------
+#
+def _finalize_shell (shell) :
+
+    shell.finalize (kill_pty=True)
+
+
 # vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
 
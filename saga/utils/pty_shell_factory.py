@@ -59,6 +59,9 @@ _SCHEMAS = _SCHEMAS_SH + _SCHEMAS_SSH + _SCHEMAS_GSI
 _SSH_FLAGS_MASTER   = "-o ControlMaster=yes -o ControlPath=%(ctrl)s"
 _SSH_FLAGS_SLAVE    = "-o ControlMaster=no  -o ControlPath=%(ctrl)s"
 
+# binary data streams must not see a pty, and must never block on prompts
+_SSH_FLAGS_STREAM   = "-T -o BatchMode=yes"
+
 # FIXME: right now, we create a shell connection as master --
 # but a master does not actually need a shell, as it is never really
 # used to run commands...
@@ -72,6 +75,14 @@ _SCRIPTS = {
         'copy_from'     : "%(sftp_env)s %(sftp_exe)s %(sftp_args)s %(s_flags)s  %(host_str)s",
         'copy_to_in'    : "progress \n put %(cp_flags)s %(src)s %(tgt)s \n exit \n",            
         'copy_from_in'  : "progress \n get %(cp_flags)s %(src)s %(tgt)s \n exit \n",
+        'tar_to'        : "cd %(src)s && %(tar_exe)s -c%(tar_z)sf - . | "
+                          "%(ssh_env)s %(ssh_exe)s %(ssh_args)s %(t_flags)s %(s_flags)s %(host_str)s "
+                          "'t=%(tgt)s; test -d $t && t=$t/%(src_name)s; "
+                          "mkdir -p $t && cd $t && tar -x%(tar_z)sf -'",
+        'tar_from'      : "%(ssh_env)s %(ssh_exe)s %(ssh_args)s %(t_flags)s %(s_flags)s %(host_str)s "
+                          "'cd %(src)s && tar -c%(tar_z)sf - .' | "
+                          "(t=%(tgt)s; test -d $t && t=$t/%(src_name)s; "
+                          "mkdir -p $t && cd $t && %(tar_exe)s -x%(tar_z)sf -)",
     },
     'sh' : { 
         'master'        : "%(sh_env)s %(sh_exe)s  %(sh_args)s",
@@ -133,6 +144,7 @@ class PTYShellFactory (object) :
 
         self.logger   = sul.getLogger ('PTYShellFactory')
         self.registry = {}
+        self.prompts  = {}    # type://user@host -> prompt of earlier shells
         self.rlock    = sut.RLock ('pty shell factory')
 
 
@@ -198,6 +210,9 @@ class PTYShellFactory (object) :
 
         # is_shell: only for shells we use prompt triggers.  sftp for example
         # does not deal well with triggers (no printf).
+        #
+        # Returns True if we had to go through some authentication dialog
+        # (password, passphrase, hostkey), False otherwise.
 
         with self.rlock :
 
@@ -234,6 +249,7 @@ class PTYShellFactory (object) :
                 retry_trigger = True
                 used_trigger  = False
                 found_trigger = ""
+                authenticated = False
 
                 while True :
 
@@ -273,6 +289,7 @@ class PTYShellFactory (object) :
                                                           % match)
 
                         pty_shell.write ("%s\n" % shell_pass)
+                        authenticated = True
                         n, match = pty_shell.find (prompt_patterns, delay)
 
 
@@ -293,6 +310,7 @@ class PTYShellFactory (object) :
                                                           % key)
 
                         pty_shell.write ("%s\n" % key_pass[key])
+                        authenticated = True
                         n, match = pty_shell.find (prompt_patterns, delay)
 
 
@@ -300,6 +318,7 @@ class PTYShellFactory (object) :
                     elif n == 2 :
                         logger.info ("got hostkey prompt")
                         pty_shell.write ("yes\n")
+                        authenticated = True
                         n, match = pty_shell.find (prompt_patterns, delay)
 
 
@@ -343,6 +362,8 @@ class PTYShellFactory (object) :
                                    % (n, match))
                         # we are done waiting for a prompt
                         break
+
+                return authenticated
                 
             except Exception as e :
                 raise self._translate_exception (e)
@@ -365,12 +386,57 @@ class PTYShellFactory (object) :
             # at this point, we do have a valid, living master
             sh_slave = supp.PTYProcess (s_cmd, info['logger'])
 
-            # authorization, prompt setup, etc
-            self._initialize_pty (sh_slave, info, is_shell=True)
+            # If earlier shells to that host came up without any authentication
+            # dialog, we skip the prompt detection altogether: the PTYShell
+            # will then set up its prompt in a single round trip (the shell
+            # input is buffered in the meantime).  Otherwise: authorization,
+            # prompt setup, etc.
+            sh_slave.latency = info['latency']
+            sh_slave.prompt  = self.prompts.get (self._prompt_key (info))
+
+            if  sh_slave.prompt :
+                sh_slave.authenticated = False
+            else :
+                sh_slave.authenticated = self._initialize_pty (sh_slave, info, is_shell=True)
 
             return sh_slave
 
 
+    # --------------------------------------------------------------------------
+    #
+    def _prompt_key (self, info) :
+
+        return "%s://%s@%s" % (info['type'], info['user'], info['host_str'])
+
+
+    # --------------------------------------------------------------------------
+    #
+    def remember_prompt (self, info, sh_slave, prompt) :
+        """ 
+        Cache the prompt a shell was set up with, so that the next shell to the
+        same host can be initialized in a single round trip (see
+        :func:`run_shell`).  Shells which needed authentication are not
+        cached: the next one is likely to need it, too.
+        """
+
+        with self.rlock :
+
+            if  not sh_slave.authenticated :
+                self.prompts[self._prompt_key (info)] = prompt
+
+
+    # --------------------------------------------------------------------------
+    #
+    def forget_prompt (self, info) :
+        """ 
+        Remove the cached prompt for the given shell host, for example if the
+        fast shell initialization failed.
+        """
+
+        with self.rlock :
+            self.prompts.pop (self._prompt_key (info), None)
+
+
     # --------------------------------------------------------------------------
     #
     def run_copy_to (self, info, src, tgt, cp_flags="") :
@@ -383,6 +449,7 @@ class PTYShellFactory (object) :
         with self.rlock :
 
             repl = dict ({'src'      : src, 
+                          'src_name' : os.path.basename (src.rstrip ('/')),
                           'tgt'      : tgt, 
                           'cp_flags' : cp_flags}.items ()+ info.items ())
 
@@ -415,6 +482,7 @@ class PTYShellFactory (object) :
         with self.rlock :
 
             repl = dict ({'src'      : src, 
+                          'src_name' : os.path.basename (src.rstrip ('/')),
                           'tgt'      : tgt, 
                           'cp_flags' : cp_flags}.items ()+ info.items ())
 
@@ -435,6 +503,72 @@ class PTYShellFactory (object) :
             info['logger'].debug ("copy done")
 
 
+    # --------------------------------------------------------------------------
+    #
+    def run_tar_to (self, info, src, tgt, compress=False) :
+        """ 
+        This streams a tar archive of the local directory src through a slave
+        ssh channel, and unpacks it on the fly into the directory tgt on the
+        remote host (which is created if needed).  As for sftp, a tgt which
+        is an existing directory receives the tree under the name of src.
+        Contrary to sftp, this does not cost a roundtrip per file.
+        """
+
+        self._run_tar ('tar_to', info, src, tgt, compress)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def run_tar_from (self, info, src, tgt, compress=False) :
+        """ 
+        This streams a tar archive of the directory src on the remote host
+        through a slave ssh channel, and unpacks it on the fly into the local
+        directory tgt (which is created if needed).  As for sftp, a tgt
+        which is an existing directory receives the tree under the name of
+        src.
+        """
+
+        self._run_tar ('tar_from', info, src, tgt, compress)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _run_tar (self, script, info, src, tgt, compress) :
+
+      # if True :
+        with self.rlock :
+
+            if  not script in _SCRIPTS[info['type']] or not info.get ('tar_exe') :
+                raise se.NotImplemented._log (info['logger'], \
+                        "tar streams are not supported for '%s'" % info['type'])
+
+            tar_z = ""
+            if  compress :
+                tar_z = "z"
+
+            repl = dict ({'src'      : src, 
+                          'src_name' : os.path.basename (src.rstrip ('/')),
+                          'tgt'      : tgt, 
+                          'tar_z'    : tar_z,
+                          't_flags'  : _SSH_FLAGS_STREAM}.items ()+ info.items ())
+
+            # the pipe runs in a local shell -- the pty only sees stderr.  The
+            # exit code is the one of the unpacking tar, which also fails if
+            # the packing side did not deliver a complete archive.
+            s_cmd = _SCRIPTS[info['type']][script] % repl
+
+            info['logger'].debug ("tar stream: %s" % s_cmd)
+
+            tar_slave = supp.PTYProcess (["/bin/sh", "-c", s_cmd], info['logger'])
+            tar_slave.wait ()
+
+            if  tar_slave.exit_code != 0 :
+                raise se.NoSuccess._log (info['logger'], "tar stream failed (%s): %s" \
+                                      % (tar_slave.exit_code, tar_slave.cache[-256:]))
+
+            info['logger'].debug ("tar stream done")
+
+
     # --------------------------------------------------------------------------
     #
     def _create_master_entry (self, url, session, logger) :
@@ -459,12 +593,14 @@ class PTYShellFactory (object) :
                 info['ssh_exe']  = suw.which ("ssh")
                 info['scp_exe']  = suw.which ("scp")
                 info['sftp_exe'] = suw.which ("sftp")
+                info['tar_exe']  = suw.which ("tar")
 
             elif info['schema']  in _SCHEMAS_GSI :
                 info['type']     = "ssh"
                 info['ssh_exe']  = suw.which ("gsissh")
                 info['scp_exe']  = suw.which ("gsiscp")
                 info['sftp_exe'] = suw.which ("gsisftp")
+                info['tar_exe']  = suw.which ("tar")
 
             elif info['schema']  in _SCHEMAS_SH :
                 info['type']     = "sh"
@@ -493,11 +629,10 @@ class PTYShellFactory (object) :
             # files, and reacts on commands.
 
             try :
+                # this is an estimate from earlier connections to the host (or
+                # a guess), the shell will measure again once it is up
                 info['latency'] = sumisc.get_host_latency (url)
 
-                # FIXME: note that get_host_latency is considered broken (see
-                # saga/utils/misc.py line 73), and will return a constant 250ms.
-
             except Exception  as e :
                 info['latency'] = 1.0  # generic value assuming slow link
                 info['logger'].warning ("Could not contact host '%s': %s" % (url, e))
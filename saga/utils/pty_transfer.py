@@ -0,0 +1,329 @@
+
+__author__    = "Andre Merzky"
+__copyright__ = "Copyright 2012-2013, The SAGA Project"
+__license__   = "MIT"
+
+
+"""
+Provides a parallel, multi-channel transfer engine for :class:`PTYShell`.
+
+A single sftp session rarely fills a high-latency WAN link.  The
+:class:`TransferEngine` thus spreads transfers over K concurrent slave channels
+to the host, which are all multiplexed over the ssh ControlMaster connection of
+the shell (so no additional authentication is needed):
+
+  * large files are split into K byte ranges (aligned to BLOCK_SIZE), and each
+    range is piped through its own ssh channel via dd, directly into the right
+    place of the target file;
+  * many files are distributed over K sftp sessions, balanced by size.
+
+After the transfer, the result is verified: the sizes of all target files are
+checked, and if so requested (verify='md5'), the checksums of split files.
+"""
+
+import os
+import hashlib
+
+import saga.exceptions              as se
+import saga.utils.logger            as sul
+import saga.utils.pty_process       as supp
+import saga.utils.pty_shell_factory as supsf
+
+# dd block size -- byte ranges are aligned to that size
+BLOCK_SIZE = 1024 * 1024
+
+# files larger than that are split into ranges
+SPLIT_MIN  = 64 * BLOCK_SIZE
+
+# default number of channels
+CHANNELS   = 4
+
+
+# ------------------------------------------------------------------------------
+#
+class TransferEngine (object) :
+    """
+    Transfers files between the local host and the host of the given
+    :class:`PTYShell`, over `channels` concurrent ssh/sftp channels.  The
+    shell itself is only used for (cheap) control commands, like size checks.
+    """
+
+    # --------------------------------------------------------------------------
+    #
+    def __init__ (self, shell, channels=CHANNELS, verify='size', logger=None) :
+
+        if  not logger :
+            logger = sul.getLogger ('TransferEngine')
+
+        self.shell    = shell
+        self.info     = shell.pty_info
+        self.channels = max (1, int (channels))
+        self.verify   = verify
+        self.logger   = logger
+
+        if  self.info['type'] != 'ssh' :
+            raise se.BadParameter ("parallel transfers need an ssh shell, not '%s'" \
+                                % self.info['type'])
+
+
+    # --------------------------------------------------------------------------
+    #
+    def put (self, src, tgt) :
+        """
+        Copy the local file src to the remote file tgt, in byte ranges.  Like
+        for sftp, a tgt which is an existing directory receives the file under
+        its original name.
+        """
+
+        size   = os.path.getsize (src)
+        ranges = self._ranges (size)
+
+        # resolve a directory target, and create / truncate the target file
+        # before the ranges get written into it -- all in one roundtrip
+        tgt = self._remote ("t=%s; test -d $t && t=$t/%s; : > $t && echo $t" \
+                         % (tgt, os.path.basename (src))).strip ()
+
+        cmds = list ()
+        for start, count in ranges :
+            cmds.append ("dd if=%s bs=%d skip=%d count=%d 2>/dev/null | %s " \
+                         "'dd of=%s bs=%d seek=%d conv=notrunc 2>/dev/null'" \
+                      % (src, BLOCK_SIZE, start, count, self._ssh (),
+                         tgt, BLOCK_SIZE, start))
+
+        self._run (cmds, "put %s" % src)
+
+        if  self._remote_sizes ([tgt]) != [size] :
+            raise se.NoSuccess ("transfer of %s to %s incomplete" % (src, tgt))
+
+        if  self.verify == 'md5' :
+            if  self._remote_md5 (tgt) != self._local_md5 (src) :
+                raise se.NoSuccess ("transfer of %s to %s corrupted" % (src, tgt))
+
+
+    # --------------------------------------------------------------------------
+    #
+    def get (self, src, tgt, size=None) :
+        """
+        Copy the remote file src to the local file tgt, in byte ranges.  Like
+        for sftp, a tgt which is an existing directory receives the file under
+        its original name.
+        """
+
+        if  os.path.isdir (tgt) :
+            tgt = os.path.join (tgt, os.path.basename (src))
+
+        if  size is None :
+            size = self._remote_sizes ([src])[0]
+
+        if  size < 0 :
+            raise se.DoesNotExist ("cannot access %s" % src)
+
+        ranges = self._ranges (size)
+
+        # create / truncate the target before the ranges get written into it
+        open (tgt, 'wb').close ()
+
+        cmds = list ()
+        for start, count in ranges :
+            cmds.append ("%s 'dd if=%s bs=%d skip=%d count=%d 2>/dev/null' | " \
+                         "dd of=%s bs=%d seek=%d conv=notrunc 2>/dev/null" \
+                      % (self._ssh (), src, BLOCK_SIZE, start, count,
+                         tgt, BLOCK_SIZE, start))
+
+        self._run (cmds, "get %s" % src)
+
+        if  os.path.getsize (tgt) != size :
+            raise se.NoSuccess ("transfer of %s to %s incomplete" % (src, tgt))
+
+        if  self.verify == 'md5' :
+            if  self._remote_md5 (src) != self._local_md5 (tgt) :
+                raise se.NoSuccess ("transfer of %s to %s corrupted" % (src, tgt))
+
+
+    # --------------------------------------------------------------------------
+    #
+    def put_many (self, pairs) :
+        """
+        Copy a list of (local src, remote tgt) file pairs, distributed over
+        concurrent sftp sessions.
+        """
+
+        sizes  = [os.path.getsize (src) for src, _ in pairs]
+        groups = self._balance (pairs, sizes)
+
+        self._run_sftp ('copy_to', [["put %s %s" % pair for pair in group]
+                                    for group in groups])
+
+        if  self._remote_sizes ([tgt for _, tgt in pairs]) != sizes :
+            raise se.NoSuccess ("transfer of %d files incomplete" % len (pairs))
+
+
+    # --------------------------------------------------------------------------
+    #
+    def get_many (self, pairs) :
+        """
+        Copy a list of (remote src, local tgt) file pairs, distributed over
+        concurrent sftp sessions.
+        """
+
+        sizes = self._remote_sizes ([src for src, _ in pairs])
+
+        for (src, _), size in zip (pairs, sizes) :
+            if  size < 0 :
+                raise se.DoesNotExist ("cannot access %s" % src)
+
+        groups = self._balance (pairs, sizes)
+
+        self._run_sftp ('copy_from', [["get %s %s" % pair for pair in group]
+                                      for group in groups])
+
+        for (_, tgt), size in zip (pairs, sizes) :
+            if  not os.path.isfile (tgt) or os.path.getsize (tgt) != size :
+                raise se.NoSuccess ("transfer of %d files incomplete" % len (pairs))
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _ranges (self, size) :
+        # split size into (start, count) block ranges, one per channel
+
+        blocks = max (1, (size + BLOCK_SIZE - 1) / BLOCK_SIZE)
+        count  = (blocks + self.channels - 1) / self.channels
+
+        return [(start, count) for start in range (0, blocks, count)]
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _balance (self, pairs, sizes) :
+        # distribute pairs over channels, largest first onto the least loaded
+
+        groups = [list () for _ in range (min (self.channels, len (pairs)))]
+        loads  = [0] * len (groups)
+
+        for size, pair in sorted (zip (sizes, pairs), reverse=True) :
+            i = loads.index (min (loads))
+            groups[i].append (pair)
+            loads[i] += size
+
+        return groups
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _ssh (self) :
+        # command line for a binary clean ssh slave channel
+
+        return "%(ssh_env)s %(ssh_exe)s %(ssh_args)s %(t_flags)s %(s_flags)s %(host_str)s" \
+             % dict (self.info.items () + [('t_flags', supsf._SSH_FLAGS_STREAM)])
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _remote (self, cmd) :
+
+        ret, out, _ = self.shell.run_sync (cmd)
+
+        if  ret != 0 :
+            raise se.NoSuccess ("remote command failed (%s): %s" % (cmd, out))
+
+        return out
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _remote_sizes (self, paths) :
+        # sizes of remote files, in as few roundtrips as the command line
+        # length permits -- -1 for missing files
+
+        cmd   = "for f in %s; do test -f $f && wc -c < $f || echo -1; done"
+        sizes = list ()
+
+        for batch in self.shell._arg_batches (paths, len (cmd)) :
+            out    = self._remote (cmd % " ".join (batch))
+            sizes += [int (line) for line in out.split ()]
+
+        return sizes
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _remote_md5 (self, path) :
+
+        return self._remote ("md5sum %s" % path).split ()[0]
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _local_md5 (self, path) :
+
+        md5 = hashlib.md5 ()
+
+        with open (path, 'rb') as f :
+            for chunk in iter (lambda : f.read (BLOCK_SIZE), '') :
+                md5.update (chunk)
+
+        return md5.hexdigest ()
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _run (self, cmds, what) :
+        # run the given local shell pipes concurrently, and wait for all
+
+        procs = [supp.PTYProcess (["/bin/sh", "-c", cmd], self.logger) for cmd in cmds]
+
+        self._wait (procs, what)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _run_sftp (self, script, batches) :
+        # run one sftp session per batch of sftp commands, concurrently
+
+        factory = supsf.PTYShellFactory ()
+        procs   = list ()
+
+        for batch in batches :
+            proc = supp.PTYProcess (supsf._SCRIPTS['ssh'][script] % self.info, self.logger)
+            factory._initialize_pty (proc, self.info)
+            procs.append (proc)
+
+        for proc, batch in zip (procs, batches) :
+            proc.write ("progress\n%s\nexit\n" % "\n".join (batch))
+
+        self._wait (procs, "%s of %d files" % (script, sum ([len (b) for b in batches])))
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _wait (self, procs, what) :
+        # wait for all processes to finish.  Their output is drained
+        # meanwhile, so that no process can block on a full pty.
+
+        output  = dict ()
+        running = list (procs)
+
+        while running :
+
+            for proc in list (running) :
+
+                try :
+                    output[proc] = (output.get (proc, "") + proc.read (timeout=0.1))[-256:]
+
+                except se.NoSuccess :
+                    # process is gone (or about to be) -- collect exit code
+                    proc.wait ()
+                    running.remove (proc)
+
+        failed = [proc for proc in procs if proc.exit_code != 0]
+
+        if  failed :
+            raise se.NoSuccess ("%s failed on %d of %d channels: %s" \
+                             % (what, len (failed), len (procs), output.get (failed[0])))
+
+        self.logger.debug ("%s done on %d channels" % (what, len (procs)))
+
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
@@ -0,0 +1,256 @@
+
+__author__    = "Andre Merzky"
+__copyright__ = "Copyright 2012-2013, The SAGA Project"
+__license__   = "MIT"
+
+
+"""
+Provides the helpers for incremental (rsync like) copies, as triggered by the
+``saga.filesystem.SYNCHRONIZE`` flag.
+
+A *manifest* describes a file tree: it maps the path of every entry relative to
+the tree root ('' for the root itself) to a tuple ``(type, size, mtime,
+digest)``, where type is 'f' for files and 'd' for directories, and where
+digest is only set when checksums are compared.  Symbolic links are followed,
+just like a plain copy does.
+Manifests of local trees are created by :func:`local_manifest`, those of trees
+on a :class:`PTYShell` host by :func:`shell_manifest` (in a single roundtrip).
+:func:`changes` compares a source and target manifest, and returns what needs
+to be transferred, and :func:`plan` wraps all of that for one sync operation.
+
+Files are considered unchanged if their sizes match, and if
+
+  * check='mtime': the target is not older than the source (at one second
+    resolution -- note that the clocks of local and remote host are assumed
+    to be in sync), or
+  * check='md5' / check='sha1': the checksums match.
+"""
+
+import os
+import hashlib
+
+import saga.exceptions as se
+
+CHECKS = ['mtime', 'md5', 'sha1']
+
+# read size for local checksums
+_BLOCK_SIZE = 1024 * 1024
+
+
+# ------------------------------------------------------------------------------
+#
+def local_manifest (path, check='mtime') :
+    """
+    Return the manifest of the local file tree at path -- empty if path does
+    not exist.
+    """
+
+    _check_check (check)
+
+    manifest = dict ()
+
+    if  not os.path.exists (path) :
+        return manifest
+
+    manifest[''] = _local_entry (path, check)
+
+    if  manifest[''][0] == 'd' :
+
+        for root, dirs, files in os.walk (path, followlinks=True) :
+
+            for name in dirs + files :
+
+                full = os.path.join (root, name)
+
+                # skip dangling links
+                if  os.path.exists (full) :
+                    manifest[os.path.relpath (full, path)] = _local_entry (full, check)
+
+    return manifest
+
+
+# ------------------------------------------------------------------------------
+#
+def shell_manifest (shell, path, check='mtime') :
+    """
+    Return the manifest of the file tree at path on the host of the given
+    :class:`PTYShell` -- empty if path does not exist.
+    """
+
+    _check_check (check)
+
+    cmd = "find -L %s -printf '%%y %%s %%T@ %%P\\n'" % path
+
+    if  check != 'mtime' :
+        cmd += " && echo SAGA_DIGESTS && find -L %s -type f -exec %ssum {} +" \
+             % (path, check)
+
+    # a missing tree is not an error, but an empty manifest
+    cmd = "if test -e %s ; then %s ; fi" % (path, cmd)
+
+    ret, out, _ = shell.run_sync (cmd)
+
+    if  ret != 0 :
+        raise se.NoSuccess ("could not inspect %s (%s): %s" % (path, ret, out))
+
+    manifest = dict ()
+    stats, _, digests = out.partition ("SAGA_DIGESTS\n")
+
+    for line in stats.splitlines () :
+
+        elems = line.split (' ', 3)
+
+        if  len (elems) < 3 :
+            continue
+
+        if  len (elems) == 3 :
+            elems.append ('')
+
+        ftype, size, mtime, name = elems
+        manifest[name] = (ftype, int (size), int (float (mtime)), None)
+
+    prefix = path.rstrip ('/') + '/'
+
+    for line in digests.splitlines () :
+
+        elems = line.split (None, 1)
+
+        if  len (elems) != 2 :
+            continue
+
+        digest, name = elems
+        name = name.lstrip ('*')
+
+        if  name == path :
+            name = ''
+        elif name.startswith (prefix) :
+            name = name[len (prefix):]
+
+        if  name in manifest :
+            manifest[name] = manifest[name][:3] + (digest,)
+
+    return manifest
+
+
+# ------------------------------------------------------------------------------
+#
+def plan (src, tgt, recursive, check, src_manifest, tgt_manifest) :
+    """
+    Plan the sync of the tree src to tgt, where the given callables return
+    the manifests for source and target paths.  Returns the effective target
+    path, and the directories to create and files to transfer (see
+    :func:`changes`).
+
+    A file synced into an existing directory ends up in that directory, just
+    like for a plain copy.  A directory is synced *onto* the target directory
+    though, so that repeated syncs of a tree hit the same target.
+    """
+
+    src_man = src_manifest (src)
+
+    if  not src_man :
+        raise se.DoesNotExist ("cannot access %s" % src)
+
+    if  src_man[''][0] == 'd' and not recursive :
+        raise se.BadParameter ("%s is a directory (use RECURSIVE)" % src)
+
+    tgt_man = tgt_manifest (tgt)
+
+    if  src_man[''][0] == 'f' and tgt_man.get ('', ('f',))[0] == 'd' :
+        tgt     = join (tgt, os.path.basename (src.rstrip ('/')))
+        tgt_man = tgt_manifest (tgt)
+
+    dirs, files = changes (src_man, tgt_man, check)
+
+    return tgt, dirs, files
+
+
+# ------------------------------------------------------------------------------
+#
+def changes (src, tgt, check='mtime') :
+    """
+    Compare the source and target manifests, and return a tuple of two lists:
+    the relative paths of the directories to create, and of the files to
+    transfer.  Entries which only exist on the target side are left alone.
+    """
+
+    _check_check (check)
+
+    dirs  = list ()
+    files = list ()
+
+    for name in sorted (src.keys ()) :
+
+        ftype, size, mtime, digest = src[name]
+        other                      = tgt.get (name)
+
+        if  ftype == 'd' :
+            if  not other or other[0] != 'd' :
+                dirs.append (name)
+            continue
+
+        if  ftype != 'f' :
+            # dangling links, sockets, etc. cannot be copied
+            continue
+
+        if  other and other[0] == 'f' and other[1] == size :
+
+            if  check == 'mtime' and other[2] >= mtime :
+                continue
+
+            if  check != 'mtime' and other[3] == digest :
+                continue
+
+        files.append (name)
+
+    return dirs, files
+
+
+# ------------------------------------------------------------------------------
+#
+def join (root, name) :
+    """
+    Return the path of the manifest entry name in the tree at root.
+    """
+
+    if  not name :
+        return root
+
+    return "%s/%s" % (root.rstrip ('/'), name)
+
+
+# ------------------------------------------------------------------------------
+#
+def _local_entry (path, check) :
+
+    stat = os.stat (path)
+
+    if  os.path.isdir (path) : ftype = 'd'
+    else                     : ftype = 'f'
+
+    digest = None
+
+    if  ftype == 'f' and check != 'mtime' :
+
+        hasher = hashlib.new (check)
+
+        with open (path, 'rb') as f :
+            for chunk in iter (lambda : f.read (_BLOCK_SIZE), '') :
+                hasher.update (chunk)
+
+        digest = hasher.hexdigest ()
+
+    return (ftype, stat.st_size, int (stat.st_mtime), digest)
+
+
+# ------------------------------------------------------------------------------
+#
+def _check_check (check) :
+
+    if  check not in CHECKS :
+        raise se.BadParameter ("sync check must be one of %s, not '%s'" \
+                            % (CHECKS, check))
+
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
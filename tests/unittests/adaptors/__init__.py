@@ -0,0 +1,8 @@
+
+__author__    = "Andre Merzky, Ole Weidner"
+__copyright__ = "Copyright 2012-2013, The SAGA Project"
+__license__   = "MIT"
+
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
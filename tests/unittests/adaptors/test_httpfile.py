@@ -0,0 +1,302 @@
+
+__author__    = "Andre Merzky"
+__copyright__ = "Copyright 2012-2013, The SAGA Project"
+__license__   = "MIT"
+
+
+""" Unit tests for saga.adaptors.http.http_file, against a local http server
+"""
+
+import os
+import re
+import shutil
+import tempfile
+import threading
+import SocketServer
+import BaseHTTPServer
+
+import saga
+import saga.adaptors.http.http_file as hf
+
+
+# ------------------------------------------------------------------------------
+#
+class _Handler (BaseHTTPServer.BaseHTTPRequestHandler) :
+
+    protocol_version = 'HTTP/1.1'
+
+    def setup (self) :
+        BaseHTTPServer.BaseHTTPRequestHandler.setup (self)
+        self.server.connections += 1
+
+    def log_message (self, *args) :
+        pass
+
+    def do_HEAD (self) :
+        self._serve (body=False)
+
+    def do_GET (self) :
+        self._serve (body=True)
+
+    def _serve (self, body) :
+
+        server = self.server
+        data   = server.files.get (self.path)
+
+        server.requests.append ((self.command, self.path, dict (self.headers)))
+
+        if  data is None :
+            self.send_response (404)
+            self.send_header   ('Content-Length', '0')
+            self.end_headers   ()
+            return
+
+        etag = server.etags[self.path]
+
+        # pretend the file changed right after the HEAD, if so requested
+        if  not body and server.stale :
+            etag = server.stale
+
+        if  self.headers.get ('if-none-match') == etag :
+            self.send_response (304)
+            self.send_header   ('ETag', etag)
+            self.end_headers   ()
+            return
+
+        start, end = 0, len (data) - 1
+        status     = 200
+        match      = re.match (r'bytes=(\d+)-(\d+)', self.headers.get ('range', ''))
+
+        if  match and self.headers.get ('if-range', etag) == etag :
+            start, end = int (match.group (1)), int (match.group (2))
+            status     = 206
+
+        self.send_response (status)
+        self.send_header   ('ETag', etag)
+        self.send_header   ('Accept-Ranges', 'bytes')
+        self.send_header   ('Content-Length', str (end - start + 1))
+        self.end_headers   ()
+
+        if  not body :
+            return
+
+        # break the first range response in the middle, if so requested
+        if  status == 206 and server.cut :
+            server.cut = False
+            self.wfile.write (data[start:start + (end - start) / 2])
+            self.close_connection = 1
+            return
+
+        self.wfile.write (data[start:end + 1])
+
+
+# ------------------------------------------------------------------------------
+#
+class _Server (SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer) :
+
+    daemon_threads = True
+
+    def __init__ (self) :
+
+        BaseHTTPServer.HTTPServer.__init__ (self, ('localhost', 0), _Handler)
+
+        self.files       = dict ()
+        self.etags       = dict ()
+        self.requests    = list ()
+        self.connections = 0
+        self.cut         = False
+        self.stale       = None
+
+    def handle_error (self, request, client_address) :
+        # clients may close connections at any time
+        pass
+
+    def publish (self, path, data, etag) :
+
+        self.files[path] = data
+        self.etags[path] = '"%s"' % etag
+
+    def url (self, path) :
+
+        return 'http://localhost:%d%s' % (self.server_address[1], path)
+
+    def gets (self) :
+
+        return [r for r in self.requests if r[0] == 'GET']
+
+
+# ------------------------------------------------------------------------------
+#
+def _setup () :
+
+    server = _Server ()
+    thread = threading.Thread (target=server.serve_forever)
+    thread.daemon = True
+    thread.start ()
+
+    return server, tempfile.mkdtemp ()
+
+
+def _teardown (server, tmp) :
+
+    server.shutdown     ()
+    server.server_close ()
+    shutil.rmtree (tmp)
+
+
+def _copy (server, path, tgt) :
+
+    f = saga.filesystem.File (server.url (path))
+    f.copy ('file://localhost%s' % tgt, saga.filesystem.OVERWRITE)
+
+    with open (tgt) as t :
+        data = t.read ()
+
+    return f._adaptor._adaptor, data
+
+
+# ------------------------------------------------------------------------------
+#
+def test_http_pool () :
+    """ Test that consecutive downloads reuse the keep-alive connection
+    """
+    server, tmp = _setup ()
+
+    try :
+        server.publish ('/pool', 'x' * 1000, 'v1')
+
+        for i in range (3) :
+            _, data = _copy (server, '/pool', os.path.join (tmp, 'pool'))
+            assert data == 'x' * 1000
+
+        # a HEAD and a GET per download, over a single connection
+        assert len (server.requests) == 6, server.requests
+        assert server.connections    == 1, server.connections
+
+    finally :
+        _teardown (server, tmp)
+
+
+# ------------------------------------------------------------------------------
+#
+def test_http_ranges () :
+    """ Test ranged downloads, their resume, and If-Range
+    """
+    server, tmp = _setup ()
+    split       = hf._SPLIT_MIN
+
+    try :
+        hf._SPLIT_MIN = 1024
+
+        data = ''.join (chr (i % 251) for i in range (100000))
+        server.publish ('/ranges', data, 'v1')
+        server.cut = True
+
+        adaptor, got = _copy (server, '/ranges', os.path.join (tmp, 'ranges'))
+        assert got == data
+
+        # the broken range got resumed, and all ranges are bound to the etag
+        gets = server.gets ()
+        assert len (gets) == adaptor.channels + 1, gets
+        for _, _, headers in gets :
+            assert headers.get ('if-range') == '"v1"', headers
+
+        # a file which changes during the download is not pieced together
+        server.publish ('/ranges', data, 'v2')
+        server.stale = '"v1"'
+
+        try :
+            _copy (server, '/ranges', os.path.join (tmp, 'changed'))
+            assert False, "expected failure"
+
+        except saga.BadParameter as e :
+            assert 'changed' in str (e), str (e)
+
+    finally :
+        hf._SPLIT_MIN = split
+        _teardown (server, tmp)
+
+
+# ------------------------------------------------------------------------------
+#
+def test_http_release () :
+    """ Test that large unread bodies close the connection
+    """
+    server, tmp = _setup ()
+
+    try :
+        server.publish ('/small', 'x' * 100,     'v1')
+        server.publish ('/large', 'x' * 1000000, 'v1')
+
+        f      = saga.filesystem.File (server.url ('/small'))
+        http   = f._adaptor
+        pool   = http._adaptor.pool
+        netloc = 'localhost:%d' % server.server_address[1]
+
+        # a small body is drained, and the connection is pooled
+        resp, _ = http._request ('GET', server.url ('/small'))
+        http._release (resp)
+        conn = pool.get ('http', netloc)
+        assert conn is resp.conn
+
+        # a large one is not
+        pool.put ('http', netloc, conn)
+        resp, _ = http._request ('GET', server.url ('/large'))
+        http._release (resp)
+        assert pool.get ('http', netloc) is not resp.conn
+
+    finally :
+        _teardown (server, tmp)
+
+
+# ------------------------------------------------------------------------------
+#
+def test_http_cache () :
+    """ Test revalidation and eviction of the download cache
+    """
+    server, tmp = _setup ()
+    cache_dir   = os.path.join (tmp, 'cache')
+
+    try :
+        server.publish ('/a', 'a' * 100000, 'v1')
+        server.publish ('/b', 'b' * 100000, 'v1')
+
+        f       = saga.filesystem.File (server.url ('/a'))
+        adaptor = f._adaptor._adaptor
+        cache   = adaptor.cache
+
+        adaptor.cache = hf.DownloadCache (cache_dir, 150000, False)
+
+        try :
+            tgt = os.path.join (tmp, 'a')
+
+            # the second copy is served from the cache, after a 304
+            assert _copy (server, '/a', tgt)[1] == 'a' * 100000
+            assert _copy (server, '/a', tgt)[1] == 'a' * 100000
+            assert len (server.gets ()) == 1
+
+            # a changed file is downloaded again
+            server.publish ('/a', 'A' * 100000, 'v2')
+            assert _copy (server, '/a', tgt)[1] == 'A' * 100000
+            assert len (server.gets ()) == 2
+
+            # an entry evicted after revalidation is downloaded again
+            data, _ = adaptor.cache._entry (server.url ('/a'))
+            os.remove (data)
+            assert _copy (server, '/a', tgt)[1] == 'A' * 100000
+            assert len (server.gets ()) == 3
+
+            # the cache only holds one of the files
+            assert _copy (server, '/b', os.path.join (tmp, 'b'))[1] == 'b' * 100000
+            assert not adaptor.cache.conditions (server.url ('/a'))
+            assert     adaptor.cache.conditions (server.url ('/b'))
+
+        finally :
+            adaptor.cache = cache
+
+    finally :
+        _teardown (server, tmp)
+
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
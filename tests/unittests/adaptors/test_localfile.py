@@ -0,0 +1,226 @@
+
+__author__    = "Andre Merzky"
+__copyright__ = "Copyright 2012-2013, The SAGA Project"
+__license__   = "MIT"
+
+
+""" Unit tests for saga.adaptors.local.localfile
+"""
+
+import os
+import shutil
+import tempfile
+
+import saga
+import saga.adaptors.local.localfile as lf
+
+
+# ------------------------------------------------------------------------------
+#
+def test_copy_file_onto_itself () :
+    """ Test that copying a file onto itself leaves the file intact
+    """
+    tmp = tempfile.mkdtemp (prefix='saga-test-')
+
+    try :
+        src = os.path.join (tmp, 'src')
+        with open (src, 'w') as f :
+            f.write ('saga test data\n')
+
+        for tgt in [src, tmp, tmp + '/./src'] :
+            try :
+                lf._copy_file (src, tgt)
+                assert False, "Expected BadParameter for %s" % tgt
+            except saga.BadParameter :
+                pass
+
+            assert open (src).read () == 'saga test data\n'
+
+        # a copy to a different file still works
+        assert lf._copy_file (src, tmp + '/tgt') == 15
+        assert open (tmp + '/tgt').read () == 'saga test data\n'
+
+    finally :
+        shutil.rmtree (tmp)
+
+
+# ------------------------------------------------------------------------------
+#
+def test_file_copy () :
+    """ Test that File.copy keeps sparse files sparse
+    """
+    tmp = tempfile.mkdtemp (prefix='saga-test-')
+
+    try :
+        src = os.path.join (tmp, 'src')
+        with open (src, 'w') as f :
+            f.seek  (16 * 1024 * 1024)
+            f.write ('end')
+
+        f = saga.filesystem.File ('file://localhost%s' % src)
+        assert isinstance (f._adaptor, lf.LocalFile), type (f._adaptor)
+
+        f.copy ('file://localhost%s/tgt' % tmp)
+
+        tgt = os.path.join (tmp, 'tgt')
+        assert open (tgt).read () == open (src).read ()
+
+        # no more blocks than the source (where the filesystem knows holes)
+        assert os.stat (tgt).st_blocks <= max (os.stat (src).st_blocks, 8)
+
+    finally :
+        shutil.rmtree (tmp)
+
+
+# ------------------------------------------------------------------------------
+#
+def test_container_copy () :
+    """ Test that copy tasks run in the bulk pool, and fail individually
+    """
+    tmp   = tempfile.mkdtemp (prefix='saga-test-')
+    calls = list ()
+    orig  = lf.BulkDirectory.container_copy
+
+    def container_copy (self, tasks) :
+        calls.append (len (tasks))
+        return orig (self, tasks)
+
+    lf.BulkDirectory.container_copy = container_copy
+
+    try :
+        for i in range (8) :
+            with open (os.path.join (tmp, 'src-%d' % i), 'w') as f :
+                f.write ('data %d' % i)
+
+        d  = saga.filesystem.Directory ('file://localhost%s' % tmp)
+        tc = saga.task.Container ()
+
+        for i in range (8) :
+            tc.add (d.copy ('src-%d' % i, 'tgt-%d' % i, ttype=saga.task.TASK))
+        tc.add (d.copy ('src-missing', 'tgt-missing', ttype=saga.task.TASK))
+
+        tc.run  ()
+        tc.wait ()
+
+        assert calls == [9], calls
+
+        for i in range (8) :
+            assert tc.tasks[i].state == saga.task.DONE
+            assert open (os.path.join (tmp, 'tgt-%d' % i)).read () == 'data %d' % i
+
+        assert tc.tasks[8].state == saga.task.FAILED
+        assert isinstance (tc.tasks[8].exception, saga.DoesNotExist)
+
+    finally :
+        lf.BulkDirectory.container_copy = orig
+        shutil.rmtree (tmp)
+
+
+# ------------------------------------------------------------------------------
+#
+def test_file_write () :
+    """ Test that writes at position 0 replace the file, as for shell files
+    """
+    tmp = tempfile.mkdtemp (prefix='saga-test-')
+
+    try :
+        path = os.path.join (tmp, 'data')
+        with open (path, 'w') as f :
+            f.write ('saga test data\n')
+
+        # file:// urls are served by the local adaptor
+        f = saga.filesystem.File ('file://localhost%s' % path)
+        assert isinstance (f._adaptor, lf.LocalFile), type (f._adaptor)
+
+        f.write ('new data')
+        f.write ('!')
+        assert open (path).read () == 'new data!'
+
+        f.seek  (4, saga.filesystem.START)
+        f.write ('DATA')
+        assert open (path).read () == 'new DATA!'
+
+        f.close ()
+
+        # appends never replace the file
+        f = saga.filesystem.File ('file://localhost%s' % path, saga.filesystem.APPEND)
+        assert isinstance (f._adaptor, lf.LocalFile), type (f._adaptor)
+
+        f.write ('\nmore')
+        assert open (path).read () == 'new DATA!\nmore'
+
+        f.close ()
+
+    finally :
+        shutil.rmtree (tmp)
+
+
+# ------------------------------------------------------------------------------
+#
+def test_file_vectors () :
+    """ Test vectored and positioned I/O on local files
+    """
+    tmp = tempfile.mkdtemp (prefix='saga-test-')
+
+    try :
+        path = os.path.join (tmp, 'data')
+        with open (path, 'w') as f :
+            f.write ('0123456789')
+
+        f = saga.filesystem.File ('file://localhost%s' % path)
+        assert isinstance (f._adaptor, lf.LocalFile), type (f._adaptor)
+
+        assert f.read_v  ([(0, 2), (8, 5)]) == ['01', '89']
+        assert f.write_v ([(2, 'ab'), (10, 'cd')]) == [2, 2]
+        assert f.seek (-4, saga.filesystem.END) == 8
+
+        # reads see the writes, and the grown file
+        assert f.read () == '89cd'
+        assert open (path).read () == '01ab456789cd'
+
+        f.close ()
+
+    finally :
+        shutil.rmtree (tmp)
+
+
+# ------------------------------------------------------------------------------
+#
+def test_directory_ops () :
+    """ Test the namespace operations on local directories
+    """
+    tmp = tempfile.mkdtemp (prefix='saga-test-')
+
+    try :
+        d = saga.filesystem.Directory ('file://localhost%s' % tmp)
+        assert isinstance (d._adaptor, lf.LocalDirectory), type (d._adaptor)
+
+        d.make_dir ('a/b', saga.filesystem.CREATE_PARENTS)
+        f = d.open ('a/b/data', saga.filesystem.CREATE)
+        f.write ('data')
+        f.close ()
+
+        assert [str (e) for e in d.list ()] == ['a']
+        assert d.is_dir    ('a')
+        assert d.is_entry  ('a/b/data')
+        assert d.exists    ('a/b/data')
+        assert d.get_size  ('a/b/data') == 4
+        assert d.get_size  ('a')        == 4
+
+        d.move ('a/b/data', 'a')
+        assert [str (e) for e in d.list ('a/*')] == ['a/b', 'a/data']
+
+        try :
+            d.remove ('a')
+            assert False, "Expected BadParameter for a directory"
+        except saga.BadParameter :
+            pass
+
+        d.remove ('a', saga.filesystem.RECURSIVE)
+        assert not d.exists ('a')
+
+    finally :
+        shutil.rmtree (tmp)
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
@@ -0,0 +1,85 @@
+
+__author__    = "Andre Merzky"
+__copyright__ = "Copyright 2012-2013, The SAGA Project"
+__license__   = "MIT"
+
+
+""" Unit tests for saga.adaptors.local.localjob
+"""
+
+import os
+import time
+import signal
+import multiprocessing
+
+import saga
+
+
+# ------------------------------------------------------------------------------
+#
+def test_job_fds () :
+    """ Test that jobs do not inherit the fds of the application
+    """
+    r, w = os.pipe ()
+    js   = saga.job.Service ('fork://localhost')
+
+    try :
+        for fd in [r, w] :
+            jd            = saga.job.Description ()
+            jd.executable = '/bin/sh'
+            jd.arguments  = ['-c', '"test -e /proc/self/fd/%d && exit 3; exit 0"' % fd]
+
+            job = js.create_job (jd)
+            job.run  ()
+            job.wait ()
+
+            assert job.exit_code == 0, "fd %d was inherited" % fd
+
+    finally :
+        js.close ()
+        os.close (r)
+        os.close (w)
+
+
+# ------------------------------------------------------------------------------
+#
+def test_job_wall_time_limit () :
+    """ Test that jobs are canceled when they exceed their wall time limit
+    """
+    js = saga.job.Service ('fork://localhost')
+
+    try :
+        # wall time limits are given in minutes -- run the job on the adaptor,
+        # to get a shorter limit
+        adaptor = js._adaptor._adaptor
+        start   = time.time ()
+        pid     = adaptor.run ('trap "" TERM; sleep 10', '/bin/sh', wall_time=0.5)
+
+        adaptor.wait ([pid], 5)
+
+        info = adaptor.job_info (pid)
+        assert info['state'] == saga.job.CANCELED, info['state']
+
+        # the job ignores TERM, so it gets killed after the grace period
+        while info['exit_code'] is None and time.time () - start < 5 :
+            time.sleep (0.1)
+
+        assert info['exit_code'] == 128 + signal.SIGKILL, info['exit_code']
+        assert time.time () - start < 5
+
+        # jobs cannot use more cores than the host has
+        jd                 = saga.job.Description ()
+        jd.executable      = '/bin/true'
+        jd.total_cpu_count = multiprocessing.cpu_count () + 1
+
+        try :
+            js.create_job (jd).run ()
+            assert False, "expected BadParameter"
+        except saga.BadParameter :
+            pass
+
+    finally :
+        js.close ()
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
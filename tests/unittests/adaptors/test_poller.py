@@ -0,0 +1,102 @@
+
+__author__    = "Andre Merzky"
+__copyright__ = "Copyright 2012-2013, The SAGA Project"
+__license__   = "MIT"
+
+
+""" Unit tests for saga.adaptors.poller
+"""
+
+import time
+import threading
+
+import saga.adaptors.poller as sap
+
+
+# ------------------------------------------------------------------------------
+#
+def test_poller_fetch () :
+    """ Test that registered clients are polled, poked and released
+    """
+    poller = sap.Poller ('poller-test-fetch')
+    calls  = list ()
+
+    def fetch () :
+        calls.append (time.time ())
+        return None
+
+    client = poller.register (fetch, interval_min=0.01, interval_max=0.1)
+
+    try :
+        # the first fetch happens right away, and finds nothing to watch
+        client.wait (5)
+        assert len (calls) == 1, calls
+        assert client.idle
+
+        # an idle client is not polled again ...
+        client.wait (0.2)
+        assert len (calls) == 1, calls
+
+        # ... until it gets poked
+        client.poke ()
+        client.wait (5)
+        assert len (calls) == 2, calls
+
+    finally :
+        client.unregister ()
+
+    # the thread terminates with the last client
+    assert poller._thread is None
+    assert client not in poller._clients
+
+
+# ------------------------------------------------------------------------------
+#
+def test_poller_unregister_wait () :
+    """ Test that unregistering a client releases threads waiting on it
+    """
+    poller  = sap.Poller ('poller-test-unregister')
+    client  = poller.register (lambda : None, interval_min=0.01, interval_max=0.1)
+    waited  = list ()
+
+    client.wait (5)
+
+    def waiter () :
+        start = time.time ()
+        client.wait ()
+        waited.append (time.time () - start)
+
+    thread = threading.Thread (target=waiter)
+    thread.daemon = True
+    thread.start ()
+
+    time.sleep (0.2)
+    assert not waited
+
+    client.unregister ()
+    thread.join (5)
+
+    assert waited and waited[0] < 5, waited
+
+    # waiting on an unregistered client returns right away
+    start = time.time ()
+    client.wait ()
+    assert time.time () - start < 1
+
+
+# ------------------------------------------------------------------------------
+#
+def test_poller_wait_closed () :
+    """ Test that waiting without a client sleeps one interval at most
+    """
+    start = time.time ()
+    sap.wait (None, None, 0.1)
+    assert 0.1 <= time.time () - start < 1
+
+    start = time.time ()
+    sap.wait (None, 0.05, 10)
+    assert time.time () - start < 1
+
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
@@ -0,0 +1,112 @@
+
+__author__    = "Andre Merzky"
+__copyright__ = "Copyright 2012-2013, The SAGA Project"
+__license__   = "MIT"
+
+
+""" Unit tests for saga.adaptors.redis.redis_cache (no redis server needed)
+"""
+
+import time
+
+import saga.utils.logger               as sul
+import saga.adaptors.redis.redis_cache as rc
+
+
+# ------------------------------------------------------------------------------
+#
+def _hit (cache, key) :
+
+    try :
+        return cache.get (key)
+    except AttributeError :
+        return None
+
+
+# ------------------------------------------------------------------------------
+#
+def test_cache_lru () :
+    """ Test that hits are promoted, and the least recently used entry evicted
+    """
+    cache = rc.Cache (sul.getLogger ('test_redis_cache'), size=3, ttl=60)
+
+    for key in ['a', 'b', 'c'] :
+        cache.set (key, key.upper ())
+
+    # 'a' becomes the most recently used entry, so 'b' goes first
+    assert _hit (cache, 'a') == 'A'
+
+    cache.set ('d', 'D')
+    assert _hit (cache, 'b') is None
+    assert _hit (cache, 'a') == 'A'
+
+    # re-setting 'c' renews it, so 'd' goes next
+    cache.set ('c', 'C2')
+    cache.set ('e', 'E')
+    assert _hit (cache, 'd') is None
+    assert _hit (cache, 'c') == 'C2'
+
+    stats = cache.stats ()
+    assert stats['size']    == 3, stats
+    assert stats['evicted'] == 2, stats
+    assert stats['miss']    == 2, stats
+
+
+# ------------------------------------------------------------------------------
+#
+def test_cache_expiry () :
+    """ Test that entries expire after their ttl, and can be discarded
+    """
+    cache = rc.Cache (sul.getLogger ('test_redis_cache'), size=10, ttl=0.2)
+
+    cache.set ('a', 1)
+    time.sleep (0.1)
+    cache.set ('b', 2)
+
+    # hits do not extend the lifetime of an entry
+    assert _hit (cache, 'a') == 1
+    time.sleep (0.15)
+    assert _hit (cache, 'a') is None
+    assert _hit (cache, 'b') == 2
+
+    time.sleep (0.1)
+    assert _hit (cache, 'b') is None
+    assert cache.stats ()['expired'] == 2
+
+    cache.set ('c', 3)
+    cache.discard ('c')
+    cache.discard ('c')
+    assert _hit (cache, 'c') is None
+
+    # a ttl of 0 disables the cache
+    cache = rc.Cache (sul.getLogger ('test_redis_cache'), size=10, ttl=0)
+    cache.set ('a', 1)
+    assert _hit (cache, 'a') is None
+
+
+# ------------------------------------------------------------------------------
+#
+def test_cache_no_ttl () :
+    """ Test that entries without ttl live until they are evicted
+    """
+    cache = rc.Cache (sul.getLogger ('test_redis_cache'), size=2, ttl=None)
+
+    cache.set ('a', 1)
+    cache.set ('b', 2)
+    time.sleep (0.1)
+
+    assert _hit (cache, 'a') == 1
+    assert _hit (cache, 'b') == 2
+
+    cache.set ('c', 3)
+    assert _hit (cache, 'a') is None
+    assert _hit (cache, 'b') == 2
+    assert _hit (cache, 'c') == 3
+
+    cache.discard ('b')
+    assert _hit (cache, 'b') is None
+    assert cache.stats ()['expired'] == 0
+
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
@@ -44,7 +44,72 @@ def test_advert_callback () :
                 print "%s " % ni
     except saga.SagaException as se:
         assert False, "Unexpected exception: %s" % se
-    
+
+
+# ------------------------------------------------------------------------------
+#
+def test_advert_find () :
+
+    try :
+        tc = sutc.TestConfig()
+
+        d_1 = saga.advert.Directory (tc.advert_url + '/tmp/test1/find/',
+                                     saga.advert.CREATE | saga.advert.CREATE_PARENTS)
+        d_2 = d_1.open_dir ('sub', saga.advert.CREATE)
+
+        e_1 = d_1.open ('one', saga.advert.CREATE)
+        e_2 = d_2.open ('two', saga.advert.CREATE)
+
+        e_1.set_attribute ('state', 'done')
+        e_2.set_attribute ('state', 'done')
+        e_2.set_attribute ('host',  'node_1')
+
+        names = [url.path for url in d_1.find ('*', 'state=done')]
+        assert names == ['/tmp/test1/find/one', '/tmp/test1/find/sub/two'], names
+
+        names = [url.path for url in d_1.find ('t*', 'state=done, host=node_*')]
+        assert names == ['/tmp/test1/find/sub/two'], names
+
+        names = [url.path for url in d_1.find ('*', 'state=done', flags=0)]
+        assert names == ['/tmp/test1/find/one'], names
+
+
+    except saga.NotImplemented as ni:
+            assert tc.notimpl_warn_only, "%s " % ni
+            if tc.notimpl_warn_only:
+                print "%s " % ni
+    except saga.SagaException as se:
+        assert False, "Unexpected exception: %s" % se
+
+
+
+# ------------------------------------------------------------------------------
+#
+def test_advert_bulk_attributes () :
+
+    try :
+        tc = sutc.TestConfig()
+
+        d_1 = saga.advert.Directory (tc.advert_url + '/tmp/test1/bulk/',
+                                     saga.advert.CREATE | saga.advert.CREATE_PARENTS)
+        e_1 = d_1.open ('status', saga.advert.CREATE)
+
+        e_1.set_attributes ({'state' : 'running', 'host' : 'node_1', 'cores' : '16'})
+
+        assert e_1.get_attribute ('state') == 'running'
+        assert e_1.get_attributes (['host', 'cores']) == {'host' : 'node_1', 'cores' : '16'}
+
+        names = [url.path for url in d_1.find ('*', 'host=node_1')]
+        assert names == ['/tmp/test1/bulk/status'], names
+
+
+    except saga.NotImplemented as ni:
+            assert tc.notimpl_warn_only, "%s " % ni
+            if tc.notimpl_warn_only:
+                print "%s " % ni
+    except saga.SagaException as se:
+        assert False, "Unexpected exception: %s" % se
+
 
 
 # vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
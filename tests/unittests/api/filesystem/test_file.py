@@ -146,6 +146,132 @@ class TestFile(unittest.TestCase):
         except saga.SagaException as ex:
             assert False, "Unexpected exception: %s" % ex
 
+    # -------------------------------------------------------------------------
+    #
+    def test_file_copy_sync(self):
+        """ Testing if a synchronizing copy skips unchanged files.
+        """
+        try:
+            tc = sutc.TestConfig()
+            filename1 = deepcopy(saga.Url(tc.filesystem_url))
+            filename1.path += "/%s" % self.uniquefilename1
+            f1 = saga.filesystem.File(filename1, saga.filesystem.CREATE)
+            f1.write("hello")
+
+            filename2 = deepcopy(saga.Url(tc.filesystem_url))
+            filename2.path += "/%s" % self.uniquefilename2
+
+            f1.copy(filename2, saga.filesystem.SYNCHRONIZE)
+            f2 = saga.filesystem.File(filename2)
+            assert f2.read() == "hello"
+
+            # same size and newer: the target is considered unchanged
+            f2 = saga.filesystem.File(filename2, saga.filesystem.WRITE)
+            f2.write("HELLO")
+            f1.copy(filename2, saga.filesystem.SYNCHRONIZE)
+            assert saga.filesystem.File(filename2).read() == "HELLO"
+
+            # a size change is picked up
+            f1 = saga.filesystem.File(filename1, saga.filesystem.WRITE)
+            f1.write("hello world")
+            f1.copy(filename2, saga.filesystem.SYNCHRONIZE)
+            assert saga.filesystem.File(filename2).read() == "hello world"
+
+        except saga.SagaException as ex:
+            assert False, "Unexpected exception: %s" % ex
+
+    # -------------------------------------------------------------------------
+    #
+    def test_file_read_write_seek(self):
+        """ Testing if we can read and write at the file position.
+        """
+        try:
+            tc = sutc.TestConfig()
+            filename1 = deepcopy(saga.Url(tc.filesystem_url))
+            filename1.path += "/%s" % self.uniquefilename1
+            f1 = saga.filesystem.File(filename1, saga.filesystem.CREATE
+                                               | saga.filesystem.READ
+                                               | saga.filesystem.WRITE)
+
+            f1.write("0123456789")
+            f1.seek(4)
+            f1.write("xy")
+            f1.seek(2)
+            assert f1.read(5) == "23xy6"
+            assert f1.read() == "789"
+            assert f1.seek(-2, saga.filesystem.END) == 8
+
+            f1.seek(0)
+            assert "".join(f1.read_chunks(3)) == "0123xy6789"
+
+        except saga.SagaException as ex:
+            assert False, "Unexpected exception: %s" % ex
+
+    # -------------------------------------------------------------------------
+    #
+    def test_directory_list(self):
+        """ Testing if listed entries report the right type and size.
+        """
+        try:
+            tc = sutc.TestConfig()
+            filename1 = deepcopy(saga.Url(tc.filesystem_url))
+            filename1.path += "/%s" % self.uniquefilename1
+            f1 = saga.filesystem.File(filename1, saga.filesystem.CREATE)
+
+            d = saga.filesystem.Directory(tc.filesystem_url)
+            entries = [str(e) for e in d.list()]
+            assert self.uniquefilename1 in entries
+
+            assert d.is_entry(self.uniquefilename1)
+            assert not d.is_dir(self.uniquefilename1)
+            assert not d.is_link(self.uniquefilename1)
+            assert d.get_size(self.uniquefilename1) == 0
+
+            # removed entries must not be answered from the listing
+            d.remove(self.uniquefilename1)
+            assert not d.is_entry(self.uniquefilename1)
+
+        except saga.SagaException as ex:
+            assert False, "Unexpected exception: %s" % ex
+
+    # -------------------------------------------------------------------------
+    #
+    def test_directory_bulk(self):
+        """ Testing if copy and get_size tasks can run in a task container.
+        """
+        try:
+            tc = sutc.TestConfig()
+            filename1 = deepcopy(saga.Url(tc.filesystem_url))
+            filename1.path += "/%s" % self.uniquefilename1
+            f1 = saga.filesystem.File(filename1, saga.filesystem.CREATE)
+            f1.write("hello")
+
+            d = saga.filesystem.Directory(tc.filesystem_url)
+
+            tc1 = saga.task.Container()
+            tc1.add(d.copy(self.uniquefilename1, self.uniquefilename2,
+                           ttype=saga.task.TASK))
+            tc1.add(d.copy("%s-missing" % self.uniquefilename1,
+                           self.uniquefilename2, ttype=saga.task.TASK))
+            tc1.run()
+            tc1.wait()
+
+            assert tc1.tasks[0].state == saga.task.DONE
+            assert tc1.tasks[1].state == saga.task.FAILED
+
+            filename2 = deepcopy(saga.Url(tc.filesystem_url))
+            filename2.path += "/%s" % self.uniquefilename2
+
+            tc2 = saga.task.Container()
+            tc2.add(saga.filesystem.File(filename1).get_size(ttype=saga.task.TASK))
+            tc2.add(saga.filesystem.File(filename2).get_size(ttype=saga.task.TASK))
+            tc2.run()
+            tc2.wait()
+
+            assert [t.result for t in tc2.tasks] == [5, 5]
+
+        except saga.SagaException as ex:
+            assert False, "Unexpected exception: %s" % ex
 
 # vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
 
@@ -422,3 +422,47 @@ def test_get_id():
         _silent_cancel(j)
         _silent_close_js(js)
 
+
+# ------------------------------------------------------------------------------
+#
+def test_job_container():
+    """ Test job container run/get_states/cancel/wait
+    """
+    js   = None
+    jobs = []
+    try:
+        tc = sutc.TestConfig()
+        js = saga.job.Service(tc.js_url, tc.session)
+        jd = saga.job.Description()
+        jd.executable = '/bin/sleep'
+        jd.arguments = ['60']
+
+        # add options from the test .cfg file if set
+        jd = sutc.add_tc_params_to_jd(tc=tc, jd=jd)
+
+        c = saga.job.Container()
+        for i in range(0, 4):
+            j = js.create_job(jd)
+            c.add(j)
+            jobs.append(j)
+
+        c.run()
+        for state in c.get_states():
+            assert state in [saga.job.RUNNING, saga.job.PENDING], state
+
+        c.cancel()
+        c.wait()
+        for job in jobs:
+            assert job.state == saga.job.CANCELED, job.state
+
+    except saga.NotImplemented as ni:
+        assert tc.notimpl_warn_only, "%s " % ni
+        if tc.notimpl_warn_only:
+            print "%s " % ni
+    except saga.SagaException as se:
+        assert False, "Unexpected exception: %s" % se
+    finally:
+        for j in jobs:
+            _silent_cancel(j)
+        _silent_close_js(js)
+
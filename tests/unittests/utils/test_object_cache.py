@@ -0,0 +1,112 @@
+
+__author__    = "Andre Merzky"
+__copyright__ = "Copyright 2012-2013, The SAGA Project"
+__license__   = "MIT"
+
+
+""" Unit tests for saga.utils.object_cache.py
+"""
+
+import time
+
+from saga.utils.object_cache import *
+
+class _Obj (object) :
+    pass
+
+
+def test_refcount () :
+    """ Test that objects are shared, and removed with the last reference
+    """
+    oc = ObjectCache ()
+    oc.set_linger (0)
+
+    o_1 = oc.get_obj ('refcount', _Obj)
+    o_2 = oc.get_obj ('refcount', _Obj)
+    assert o_1 is o_2
+
+    assert     oc.rem_obj (o_1)
+    assert     oc.rem_obj (o_2)
+    assert not oc.rem_obj (o_2)
+    assert not oc.rem_obj (_Obj ())
+
+    assert oc.get_obj ('refcount', _Obj) is not o_1
+
+
+def test_linger () :
+    """ Test that released objects are reused while they linger
+    """
+    oc = ObjectCache ()
+    oc.set_linger (0.5, size=1)
+
+    try :
+        o_1 = oc.get_obj ('linger_1', _Obj)
+        oc.rem_obj (o_1)
+        assert oc.get_obj ('linger_1', _Obj) is o_1
+
+        # o_2 evicts o_1 from the idle pool
+        o_2 = oc.get_obj ('linger_2', _Obj)
+        oc.rem_obj (o_1)
+        oc.rem_obj (o_2)
+        assert oc.get_obj ('linger_1', _Obj) is not o_1
+
+        # o_2 expires
+        time.sleep (1.0)
+        assert oc.get_obj ('linger_2', _Obj) is not o_2
+
+    finally :
+        oc.set_linger (0)
+
+
+def test_finalize () :
+    """ Test that objects are finalized when they are finally removed
+    """
+    oc   = ObjectCache ()
+    gone = list ()
+
+    oc.set_linger (0.5, size=2)
+
+    try :
+        o_1 = oc.get_obj ('finalize', _Obj, finalizer=gone.append)
+        oc.rem_obj (o_1)
+        assert gone == []
+
+        # lingering objects are finalized when they expire ...
+        time.sleep (1.0)
+        assert gone == [o_1]
+
+        # ... and broken ones right away
+        o_2 = oc.get_obj ('finalize', _Obj, finalizer=gone.append)
+        oc.rem_obj (o_2, linger=False)
+        assert gone == [o_1, o_2]
+
+    finally :
+        oc.set_linger (0)
+
+
+def test_exclusive () :
+    """ Test that exclusive objects are only reused once released
+    """
+    oc   = ObjectCache ()
+    gone = list ()
+
+    oc.set_linger (10, size=2)
+
+    try :
+        o_1 = oc.get_obj ('exclusive', _Obj, finalizer=gone.append, shared=False)
+        o_2 = oc.get_obj ('exclusive', _Obj, finalizer=gone.append, shared=False)
+        assert o_1 is not o_2
+
+        oc.rem_obj (o_1)
+        assert oc.get_obj ('exclusive', _Obj, shared=False) is o_1
+
+        oc.rem_obj (o_1)
+        oc.rem_obj (o_2)
+
+    finally :
+        oc.set_linger (0)
+
+    assert sorted (gone) == sorted ([o_1, o_2])
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
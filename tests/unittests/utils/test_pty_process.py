@@ -131,3 +131,30 @@ def test_ptyprocess_restart () :
     pty.finalize ()
     assert (not pty.alive ())
 
+
+
+# ------------------------------------------------------------------------------
+#
+def test_ptyprocess_reactor () :
+    """ Test pty_process output drained by the reactor """
+    reactor = supp.PTYReactor ()
+    enabled = reactor.enabled
+
+    try :
+        reactor.enabled = True
+        pty = supp.PTYProcess ("cat")
+        pty.write ("______1_____2\n")
+
+        # data get drained even if nobody reads
+        time.sleep (0.5)
+        assert (pty.buffer == "______1_____2\r\n"), "'%s'" % pty.buffer
+
+        out = pty.find (['\d\n'])
+        assert (out == (0, '______1_____2\n')), "'%s' == '%s'" % \
+               (out ,  (0, '______1_____2\n'))
+
+        pty.finalize ()
+        assert (not pty.alive ())
+
+    finally :
+        reactor.enabled = enabled
@@ -6,10 +6,14 @@ __license__   = "MIT"
 
 import os
 import time
+import shutil
 import signal
+import tempfile
 import saga
-import saga.utils.pty_shell   as sups
-import saga.utils.test_config as sutc
+import saga.utils.logger            as sul
+import saga.utils.pty_shell         as sups
+import saga.utils.pty_shell_factory as supsf
+import saga.utils.test_config       as sutc
 
 
 # ------------------------------------------------------------------------------
@@ -116,3 +120,202 @@ def test_ptyshell_file_stage () :
     assert (out == "")   , "%s == ''" % (repr(out))
 
 
+
+
+# ------------------------------------------------------------------------------
+#
+def test_ptyshell_fast_init () :
+    """ Test that later shells to the same host start in a single round trip """
+    conf    = sutc.TestConfig()
+    shell_1 = sups.PTYShell (saga.Url(conf.js_url), conf.session)
+    shell_2 = sups.PTYShell (saga.Url(conf.js_url), conf.session)
+
+    # the first shell told the factory about its prompt (unless authentication
+    # was needed), the second one used that
+    if  not shell_1.pty_shell.authenticated :
+        assert (shell_2.pty_shell.prompt == shell_1.prompt)
+
+    txt = "______1______2_____3_____"
+    ret, out, _ = shell_2.run_sync ("printf \"%s\" ; false" % txt)
+    assert (ret == 1)    , "%s"       % (repr(ret))
+    assert (out == txt)  , "%s == %s" % (repr(out), repr(txt))
+
+    shell_1.finalize (kill_pty=True)
+    shell_2.finalize (kill_pty=True)
+
+
+# ------------------------------------------------------------------------------
+#
+def test_ptyshell_stream () :
+    """ Test pty_shell streaming command output """
+    conf  = sutc.TestConfig()
+    shell = sups.PTYShell (saga.Url(conf.js_url), conf.session)
+
+    lines = ["%d\n" % i for i in range (1, 1001)]
+
+    out = shell.run_stream ("seq 1 1000 ; printf 'end' ; false")
+    assert (list (out) == lines + ['end'])
+    assert (out.exit_code == 1), "%s" % (repr(out.exit_code))
+
+    # collect the output first, spilling beyond 100 bytes
+    out = shell.run_stream ("seq 1 1000", spill=100)
+    assert (out.wait () == 0)
+
+    ret, txt, _ = shell.run_sync ("printf 'foo'")
+    assert (ret == 0)     , "%s"       % (repr(ret))
+    assert (txt == 'foo') , "%s == %s" % (repr(txt), repr('foo'))
+
+    assert (list (out) == lines)
+
+    shell.finalize (kill_pty=True)
+
+
+# ------------------------------------------------------------------------------
+#
+def test_ptyshell_tar_target_dir () :
+    """ Test that tar streams into an existing directory keep the source name """
+    tmp = tempfile.mkdtemp ()
+
+    try :
+        # a stand-in for ssh, which runs the remote command locally
+        ssh = os.path.join (tmp, 'ssh')
+        with open (ssh, 'w') as f :
+            f.write ('#!/bin/sh\nfor arg ; do cmd=$arg ; done\nexec /bin/sh -c "$cmd"\n')
+        os.chmod (ssh, 0755)
+
+        info = {'type'     : 'ssh',
+                'tar_exe'  : 'tar',
+                'ssh_env'  : '',
+                'ssh_exe'  : ssh,
+                'ssh_args' : '',
+                's_flags'  : '',
+                'host_str' : 'localhost',
+                'logger'   : sul.getLogger ('test_pty_shell')}
+
+        src = os.path.join (tmp, 'src')
+        os.mkdir (src)
+        with open (os.path.join (src, 'data'), 'w') as f :
+            f.write ('data')
+
+        factory = supsf.PTYShellFactory ()
+
+        for run in [factory.run_tar_to, factory.run_tar_from] :
+
+            # a new target directory gets the contents of src
+            tgt = os.path.join (tmp, 'new')
+            run (info, src, tgt)
+            assert (os.path.isfile (os.path.join (tgt, 'data')))
+
+            # an existing one gets src itself
+            tgt = os.path.join (tmp, 'old')
+            os.mkdir (tgt)
+            run (info, src, tgt)
+            assert (os.path.isfile (os.path.join (tgt, 'src', 'data')))
+            assert (not os.path.exists (os.path.join (tgt, 'data')))
+
+            shutil.rmtree (os.path.join (tmp, 'new'))
+            shutil.rmtree (os.path.join (tmp, 'old'))
+
+    finally :
+        shutil.rmtree (tmp)
+
+
+
+# ------------------------------------------------------------------------------
+#
+def test_ptyshell_remote_sizes () :
+    """ Test that size probes for many paths stay below the tty line limit """
+    import saga.utils.pty_transfer as supt
+
+    conf  = sutc.TestConfig()
+    shell = sups.PTYShell (saga.Url(conf.js_url), conf.session)
+    tmp   = tempfile.mkdtemp ()
+
+    try :
+        paths = list ()
+        for i in range (300) :
+            path = os.path.join (tmp, 'saga-test-remote-size-%04d' % i)
+            with open (path, 'w') as f :
+                f.write ('x' * i)
+            paths.append (path)
+
+        # the size probes only need the control shell, not ssh
+        engine       = supt.TransferEngine.__new__ (supt.TransferEngine)
+        engine.shell = shell
+
+        sizes = engine._remote_sizes (paths + [tmp + '/missing'])
+        assert (sizes == range (300) + [-1]), "%s" % (repr(sizes))
+
+    finally :
+        shutil.rmtree (tmp)
+        shell.finalize (kill_pty=True)
+
+
+
+# ------------------------------------------------------------------------------
+#
+def test_ptyshell_reuse () :
+    """ Test that released shells are reused while they linger """
+    import saga.utils.object_cache as soc
+
+    conf    = sutc.TestConfig()
+    session = conf.session
+    oc      = soc.ObjectCache ()
+    oc.set_linger (10, size=2)
+
+    try :
+        shell_1 = sups.get_shell (saga.Url(conf.js_url), session)
+        shell_2 = sups.get_shell (saga.Url(conf.js_url), session)
+        assert (shell_1 is not shell_2)
+
+        sups.release_shell (shell_1)
+        shell_3 = sups.get_shell (saga.Url(conf.js_url), session)
+        assert (shell_3 is shell_1)
+
+        sups.release_shell (shell_2)
+        sups.release_shell (shell_3)
+        assert (shell_3.alive ())
+
+    finally :
+        oc.set_linger (0)
+
+    # expired shells are finalized
+    assert (not shell_1.alive ())
+    assert (not shell_2.alive ())
+
+
+
+# ------------------------------------------------------------------------------
+#
+def test_ptyshell_write_range () :
+    """ Test that byte ranges are written in place """
+    conf  = sutc.TestConfig()
+    shell = sups.PTYShell (saga.Url(conf.js_url), conf.session)
+    tmp   = tempfile.mkdtemp ()
+    tgt   = os.path.join (tmp, 'saga-test-write-range')
+
+    try :
+        # with and without 'oflag=seek_bytes' for dd
+        for seek_bytes in [shell._dd_seek_bytes (), False] :
+
+            shell.dd_seek_bytes = seek_bytes
+
+            with open (tgt, 'w') as f :
+                f.write ('.' * 10000)
+
+            assert (shell.write_range ('abc', tgt, offset=4097) == 10000)
+            assert (shell.write_range ('xyz', tgt, offset=8192) == 10000)
+            assert (shell.write_range ('end', tgt, append=True) == 10003)
+            assert (shell.write_range ('012', tgt)              == 10003)
+
+            with open (tgt) as f :
+                data = f.read ()
+
+            expected = '012' + '.' * 4094 + 'abc' + '.' * 4092 + 'xyz' \
+                     + '.' * 1805 + 'end'
+            assert (data == expected)
+
+    finally :
+        shutil.rmtree (tmp)
+        shell.finalize (kill_pty=True)
+